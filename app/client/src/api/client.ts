@@ -35,16 +35,54 @@ async function apiRequest<T>(
 // API methods
 export const api = {
   // Upload file
-  async uploadFile(file: File): Promise<FileUploadResponse> {
+  async uploadFile(
+    file: File,
+    schemaHints?: Record<string, ColumnKind>,
+    mode: IngestMode = 'replace',
+    keyColumns: string[] = []
+  ): Promise<IngestJob> {
     const formData = new FormData();
     formData.append('file', file);
+    if (schemaHints) {
+      formData.append('schema_hints', JSON.stringify(schemaHints));
+    }
+    formData.append('mode', mode);
+    if (keyColumns.length) {
+      formData.append('key_columns', keyColumns.join(','));
+    }
     
-    return apiRequest<FileUploadResponse>('/upload', {
+    return apiRequest<IngestJob>('/upload', {
       method: 'POST',
       body: formData
     });
   },
   
+  // Upload several files or archives, one ingest job per file
+  async uploadFiles(files: File[], schemaHints?: Record<string, ColumnKind>): Promise<IngestBatchResponse> {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    if (schemaHints) {
+      formData.append('schema_hints', JSON.stringify(schemaHints));
+    }
+    
+    return apiRequest<IngestBatchResponse>('/upload/batch', {
+      method: 'POST',
+      body: formData
+    });
+  },
+  
+  // Get an upload's ingest job
+  async getJob(jobId: string): Promise<IngestJob> {
+    return apiRequest<IngestJob>(`/jobs/${encodeURIComponent(jobId)}`);
+  },
+  
+  // Cancel an upload's ingest job
+  async cancelJob(jobId: string): Promise<IngestJob> {
+    return apiRequest<IngestJob>(`/jobs/${encodeURIComponent(jobId)}/cancel`, {
+      method: 'POST'
+    });
+  },
+  
   // Process query
   async processQuery(request: QueryRequest): Promise<QueryResponse> {
     return apiRequest<QueryResponse>('/query', {
@@ -220,7 +220,7 @@ function initializeFileUpload() {
   fileInput.addEventListener('change', (e) => {
     const files = (e.target as HTMLInputElement).files;
     if (files && files.length > 0) {
-      handleFileUpload(files[0]);
+      handleFileUploads(Array.from(files));
     }
   });
   
@@ -240,22 +240,65 @@ function initializeFileUpload() {
     
     const files = e.dataTransfer?.files;
     if (files && files.length > 0) {
-      handleFileUpload(files[0]);
+      handleFileUploads(Array.from(files));
     }
   });
 }
 
+// Interval between polls of a running upload job
+const UPLOAD_POLL_INTERVAL_MS = 500;
+
+// Wait for an upload's ingest job to finish
+async function waitForJob(job: IngestJob): Promise<IngestJob> {
+  while (job.status === 'queued' || job.status === 'running') {
+    await new Promise(resolve => setTimeout(resolve, UPLOAD_POLL_INTERVAL_MS));
+    job = await api.getJob(job.job_id);
+  }
+  return job;
+}
+
 // Handle file upload
 async function handleFileUpload(file: File) {
   try {
-    const response = await api.uploadFile(file);
+    const job = await waitForJob(await api.uploadFile(file));
     
+    if (job.status === 'succeeded' && job.result) {
+      displayUploadSuccess(job.result);
+      await loadDatabaseSchema();
+    } else {
+      displayError(job.error || `Upload ${job.status}`);
+    }
+  } catch (error) {
+    displayError(error instanceof Error ? error.message : 'Upload failed');
+  }
+}
+
+// Archives are expanded by the server into a job per file
+const ARCHIVE_SUFFIXES = ['.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz'];
+
+// Handle several files or archives, parsed in parallel on the server
+async function handleFileUploads(files: File[]) {
+  const isArchive = (file: File) => ARCHIVE_SUFFIXES.some(suffix => file.name.toLowerCase().endsWith(suffix));
+  if (files.length === 1 && !isArchive(files[0])) {
+    return handleFileUpload(files[0]);
+  }
+  
+  try {
+    const response = await api.uploadFiles(files);
     if (response.error) {
       displayError(response.error);
-    } else {
-      displayUploadSuccess(response);
-      await loadDatabaseSchema();
+      return;
     }
+    
+    const jobs = await Promise.all(response.jobs.map(waitForJob));
+    jobs.forEach(job => {
+      if (job.status === 'succeeded' && job.result) {
+        displayUploadSuccess(job.result);
+      } else {
+        displayError(`${job.file_name}: ${job.error || `upload ${job.status}`}`);
+      }
+    });
+    await loadDatabaseSchema();
   } catch (error) {
     displayError(error instanceof Error ? error.message : 'Upload failed');
   }
@@ -1,11 +1,48 @@
 // These must match the Pydantic models exactly
 
 // File Upload Types
+type ColumnKind = 'integer' | 'real' | 'boolean' | 'date' | 'datetime' | 'timestamp' | 'category' | 'text';
+
 interface FileUploadResponse {
   table_name: string;
   table_schema: Record<string, string>;
   row_count: number;
   sample_data: Record<string, any>[];
+  rows_written?: number;
+  rows_added?: number;
+  error?: string;
+}
+
+type IngestMode = 'replace' | 'append' | 'upsert';
+
+type IngestJobStatus = 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+
+interface IngestJob {
+  job_id: string;
+  file_name: string;
+  table_name: string;
+  file_format: string;
+  mode: IngestMode;
+  status: IngestJobStatus;
+  bytes_total: number;
+  bytes_parsed: number;
+  rows_written: number;
+  bytes_per_second?: number;
+  rows_per_second?: number;
+  created_at?: string;
+  started_at?: string;
+  finished_at?: string;
+  result?: FileUploadResponse;  // Set once the job has succeeded
+  error?: string;
+}
+
+interface IngestJobListResponse {
+  jobs: IngestJob[];
+  error?: string;
+}
+
+interface IngestBatchResponse {
+  jobs: IngestJob[];  // One per file, archives expanded
   error?: string;
 }
 
@@ -14,6 +51,9 @@ interface QueryRequest {
   query: string;
   llm_provider: "openai" | "anthropic";
   table_name?: string;
+  page_size?: number;
+  page_token?: string;
+  request_id?: string;
 }
 
 interface QueryResponse {
@@ -22,9 +62,18 @@ interface QueryResponse {
   columns: string[];
   row_count: number;
   execution_time_ms: number;
+  has_more: boolean;
+  next_page_token?: string;
+  truncated: boolean;
+  request_id?: string;
   error?: string;
 }
 
+interface CancelQueryResponse {
+  request_id: string;
+  cancelled: boolean;
+}
+
 // Database Schema Types
 interface ColumnInfo {
   name: string;
@@ -50,6 +99,12 @@ interface DatabaseSchemaResponse {
 interface InsightsRequest {
   table_name: string;
   column_names?: string[];
+  sample_rate?: number;
+}
+
+interface StatisticBounds {
+  lower: number;
+  upper: number;
 }
 
 interface ColumnInsight {
@@ -61,6 +116,8 @@ interface ColumnInsight {
   max_value?: any;
   avg_value?: number;
   most_common?: Record<string, any>[];
+  sample_rate?: number;
+  error_bounds: Record<string, StatisticBounds>;
 }
 
 interface InsightsResponse {
@@ -83,4 +140,57 @@ interface HealthCheckResponse {
   tables_count: number;
   version: string;
   uptime_seconds: number;
-}
\ No newline at end of file
+}
+
+// Metrics Types
+interface ExecutorStats {
+  workers: number;
+  running: number;
+  queued: number;
+  completed: number;
+  rejected: number;
+}
+
+interface LLMCacheStats {
+  hits: number;
+  misses: number;
+  evictions: number;
+  entries: number;
+}
+
+interface LLMProviderStats {
+  requests: number;
+  errors: number;
+  timeouts: number;
+  hedged: number;
+  wins: number;
+  p50_ms?: number;
+  p95_ms?: number;
+  latency_histogram: Record<string, number>;
+}
+
+interface MetricsResponse {
+  executors: Record<string, ExecutorStats>;
+  llm_cache: LLMCacheStats;
+  llm_providers: Record<string, LLMProviderStats>;
+}
+
+// Index Advisor Types
+interface IndexRecommendation {
+  table_name: string;
+  column_name: string;
+  index_name: string;
+  hits: number;
+  clauses: string[];
+  row_count: number;
+}
+
+interface IndexRecommendationsResponse {
+  recommendations: IndexRecommendation[];
+  error?: string;
+}
+
+interface ApplyIndexesResponse {
+  created: string[];
+  error?: string;
+}
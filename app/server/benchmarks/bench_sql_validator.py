@@ -0,0 +1,82 @@
+"""
+Microbenchmark: tokenizer-based validate_sql_query vs the old regex chain.
+
+Run from app/server:
+
+    uv run python -m benchmarks.bench_sql_validator
+"""
+
+import re
+import timeit
+
+from core.sql_security import SQLSecurityError, validate_sql_query
+
+# The validator as it was before the tokenizer: a chain of regex scans
+# over the upper-cased query text
+_LEGACY_DANGEROUS_PATTERNS = [
+    r"\bDROP\s+(?:TABLE|DATABASE|INDEX|VIEW)\b",
+    r"\bDELETE\s+FROM\b",
+    r"\bTRUNCATE\s+TABLE\b",
+    r"\bEXEC(?:UTE)?\s*\(",
+    r"\bCREATE\s+(?:TABLE|DATABASE|INDEX|VIEW)\b",
+    r"\bALTER\s+TABLE\b",
+    r"\bGRANT\b",
+    r"\bREVOKE\b",
+    r"\bINSERT\s+INTO\b.*\bSELECT\b",
+    r"\bUPDATE\b.*\bSET\b",
+    r";\s*(?:DROP|DELETE|UPDATE|INSERT)",
+]
+
+_LEGACY_INJECTION_PATTERNS = [
+    r"'\s*OR\s*'?1'?\s*=\s*'?1",
+    r'"\s*OR\s*"?1"?\s*=\s*"?1',
+    r"'[^']*\s*;\s*(?:SELECT|DROP|DELETE|UPDATE|INSERT|CREATE|ALTER|EXEC)",
+    r'"[^"]*\s*;\s*(?:SELECT|DROP|DELETE|UPDATE|INSERT|CREATE|ALTER|EXEC)',
+]
+
+
+def legacy_validate_sql_query(query: str) -> bool:
+    normalized_query = query.upper().strip()
+    for pattern in _LEGACY_DANGEROUS_PATTERNS:
+        if re.search(pattern, normalized_query):
+            raise SQLSecurityError(f"Query contains potentially dangerous operation: {pattern}")
+    if "--" in query or "/*" in query or "*/" in query:
+        raise SQLSecurityError("Query contains SQL comments which are not allowed")
+    for pattern in _LEGACY_INJECTION_PATTERNS:
+        if re.search(pattern, normalized_query, re.IGNORECASE):
+            raise SQLSecurityError("Query contains potential SQL injection pattern")
+    return True
+
+
+def build_queries():
+    columns = ", ".join(f"t{i % 5}.column_{i} AS alias_{i}" for i in range(150))
+    filters = " AND ".join(f"t{i % 5}.name_{i} LIKE '%value {i}%'" for i in range(100))
+    notes = " OR ".join(f"note = 'please update the record {i}'" for i in range(300))
+    return {
+        'short': "SELECT name, email FROM users WHERE age > 18",
+        'long (wide select + filters)': (
+            f"SELECT {columns} FROM orders t0 JOIN customers t1 ON t0.cid = t1.id "
+            f"WHERE {filters} ORDER BY t0.id LIMIT 100"
+        ),
+        'long (many string literals)': f"SELECT * FROM notes WHERE {notes}",
+    }
+
+
+def best_time_us(func, query: str, number: int) -> float:
+    return min(timeit.repeat(lambda: func(query), number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    print(f"{'query':<30} {'chars':>7} {'regex chain':>14} {'tokenizer':>12} {'speedup':>8}")
+    for name, query in build_queries().items():
+        number = 2000 if len(query) < 1000 else 20
+        legacy = best_time_us(legacy_validate_sql_query, query, number)
+        current = best_time_us(validate_sql_query, query, number)
+        print(
+            f"{name:<30} {len(query):>7} {legacy:>11.1f} us {current:>9.1f} us "
+            f"{legacy / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
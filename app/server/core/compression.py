@@ -0,0 +1,74 @@
+"""
+Compressed uploads.
+
+Uploads named like ``events.csv.gz``, ``events.jsonl.zst`` or
+``events.json.bz2`` are spooled as they arrive (still compressed) and
+decompressed as a stream while they are parsed, so the decompressed data is
+never held in memory or written to disk as a whole.
+
+Supported compressions are gzip (.gz), bzip2 (.bz2), xz (.xz) and
+Zstandard (.zst), which needs the optional zstandard dependency.
+"""
+
+import bz2
+import gzip
+import lzma
+from typing import BinaryIO, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+# File name suffix -> compression
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+
+
+def split_compression(file_name: str) -> Tuple[str, Optional[str]]:
+    """
+    Split a compression suffix off a file name: 'a.csv.gz' -> ('a.csv', 'gzip')
+    """
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if file_name.lower().endswith(suffix):
+            return file_name[:-len(suffix)], compression
+    return file_name, None
+
+
+def check_decompressor(compression: Optional[str]) -> None:
+    """
+    Raises:
+        ValueError: If uploads with this compression can't be decompressed here
+    """
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError(
+            "Zstandard (.zst) uploads require zstandard, "
+            "install it with: pip install zstandard"
+        )
+
+
+def open_decompressed(stream: BinaryIO, compression: Optional[str]) -> BinaryIO:
+    """
+    A readable stream of the decompressed content of ``stream``
+
+    Closing the returned stream leaves ``stream`` open.
+
+    Raises:
+        ValueError: If the compression is unknown or needs zstandard and it is not installed
+    """
+    if compression is None:
+        return stream
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(stream, mode='rb')
+    if compression == 'xz':
+        return lzma.LZMAFile(stream, mode='rb')
+    if compression == 'zstd':
+        check_decompressor(compression)
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True, closefd=False)
+    raise ValueError(f"Unsupported compression: {compression}")
@@ -12,6 +12,34 @@ class FileUploadResponse(BaseModel):
     table_schema: Dict[str, str]  # column_name: data_type
     row_count: int
     sample_data: List[Dict[str, Any]]
+    rows_written: Optional[int] = None  # rows inserted or updated by this upload
+    rows_added: Optional[int] = None  # rows this upload added to the table (not updated)
+    error: Optional[str] = None
+
+class IngestJob(BaseModel):
+    job_id: str
+    file_name: str
+    table_name: str
+    file_format: str
+    mode: str = "replace"
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    bytes_total: int = 0
+    bytes_parsed: int = 0
+    rows_written: int = 0
+    bytes_per_second: Optional[float] = None
+    rows_per_second: Optional[float] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[FileUploadResponse] = None  # Set once the job has succeeded
+    error: Optional[str] = None
+
+class IngestJobListResponse(BaseModel):
+    jobs: List[IngestJob]
+    error: Optional[str] = None
+
+class IngestBatchResponse(BaseModel):
+    jobs: List[IngestJob]  # One per file, archives expanded
     error: Optional[str] = None
 
 # Query Models  
@@ -19,15 +47,26 @@ class QueryRequest(BaseModel):
     query: str = Field(..., description="Natural language query")
     llm_provider: Literal["openai", "anthropic"] = "openai"
     table_name: Optional[str] = None  # If querying specific table
+    page_size: Optional[int] = Field(None, ge=1, description="Rows per page (server default if omitted)")
+    page_token: Optional[str] = Field(None, description="Continuation token from a previous page")
+    request_id: Optional[str] = Field(None, description="Client-chosen ID for cancelling the query")
 
 class QueryResponse(BaseModel):
     sql: str
     results: List[Dict[str, Any]]
     columns: List[str]
-    row_count: int
+    row_count: int  # Rows in this page
     execution_time_ms: float
+    has_more: bool = False
+    next_page_token: Optional[str] = None
+    truncated: bool = False  # Stopped at the server's maximum row count
+    request_id: Optional[str] = None
     error: Optional[str] = None
 
+class CancelQueryResponse(BaseModel):
+    request_id: str
+    cancelled: bool  # False if no query with this ID was running
+
 # Database Schema Models
 class ColumnInfo(BaseModel):
     name: str
@@ -53,16 +92,26 @@ class DatabaseSchemaResponse(BaseModel):
 class InsightsRequest(BaseModel):
     table_name: str
     column_names: Optional[List[str]] = None  # If None, analyze all columns
+    sample_rate: Optional[float] = Field(
+        None, gt=0, le=1,
+        description="Fraction of rows sampled for distinct counts and most common values (server default if omitted)"
+    )
+
+class StatisticBounds(BaseModel):
+    lower: float
+    upper: float
 
 class ColumnInsight(BaseModel):
     column_name: str
     data_type: str
-    unique_values: int
+    unique_values: int  # Estimated for high-cardinality columns, see error_bounds
     null_count: int
     min_value: Optional[Any] = None
     max_value: Optional[Any] = None
     avg_value: Optional[float] = None
-    most_common: Optional[List[Dict[str, Any]]] = None
+    most_common: Optional[List[Dict[str, Any]]] = None  # value, count, count_lower, count_upper
+    sample_rate: Optional[float] = None  # Fraction of rows sampled, None if all rows were read
+    error_bounds: Dict[str, StatisticBounds] = {}  # ~95% bounds per statistic, equal to the value if exact
 
 class InsightsResponse(BaseModel):
     table_name: str
@@ -86,10 +135,57 @@ class HealthCheckResponse(BaseModel):
     version: str = "1.0.0"
     uptime_seconds: float
 
+# Metrics Models
+class ExecutorStats(BaseModel):
+    workers: int
+    running: int
+    queued: int
+    completed: int
+    rejected: int
+
+class LLMCacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+
+class LLMProviderStats(BaseModel):
+    requests: int
+    errors: int
+    timeouts: int
+    hedged: int = Field(..., description="Times this provider was called as a hedge or fallback")
+    wins: int
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    latency_histogram: Dict[str, int] = Field(..., description="Successful calls per latency bucket (upper bound in ms)")
+
+class MetricsResponse(BaseModel):
+    executors: Dict[str, ExecutorStats]
+    llm_cache: LLMCacheStats
+    llm_providers: Dict[str, LLMProviderStats] = {}
+
+# Index Advisor Models
+class IndexRecommendation(BaseModel):
+    table_name: str
+    column_name: str
+    index_name: str
+    hits: int = Field(..., description="Executed queries that used the column")
+    clauses: List[str] = Field(..., description="Where the column was used: filter, join, group, order")
+    row_count: int
+
+class IndexRecommendationsResponse(BaseModel):
+    recommendations: List[IndexRecommendation]
+    error: Optional[str] = None
+
+class ApplyIndexesResponse(BaseModel):
+    created: List[str] = Field(..., description="Names of the indexes created")
+    error: Optional[str] = None
+
 # Export Models
 class TableExportRequest(BaseModel):
     table_name: str = Field(..., description="Name of the table to export")
 
 class QueryExportRequest(BaseModel):
     sql: str = Field(..., description="SQL query to execute and export")
-    columns: List[str] = Field(..., description="Column names for the CSV headers")
\ No newline at end of file
+    columns: List[str] = Field(..., description="Column names for the CSV headers")
+    request_id: Optional[str] = Field(None, description="Client-chosen ID for cancelling the export")
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""
+Shared SQLite connection management for the application database.
+
+Instead of opening a new connection per request, callers borrow connections
+from a per-database ConnectionManager:
+
+    with get_connection_manager().reader() as conn:
+        ...  # SELECTs; many readers can run concurrently
+
+    with get_connection_manager().writer() as conn:
+        ...  # uploads, DDL; a single writer connection, serialised by a lock
+
+The database runs in WAL mode, so readers keep working while an upload is
+writing. Readers are opened read-only (a mode=ro URI) with an authorizer that
+denies writes, ATTACH and state-changing pragmas, so nothing run on a reader
+can modify the database whatever its SQL text. Pool size and pragmas can be tuned with environment variables:
+
+- DATABASE_PATH        path of the application database (default db/database.db)
+- METADATA_DATABASE_PATH  path of the internal metadata database, which holds
+                       caches kept out of the user-visible schema (default db/metadata.db)
+- DB_READ_POOL_SIZE    number of pooled read connections (default 4)
+- DB_READ_TIMEOUT      seconds to wait for a free read connection before
+                       failing with DatabaseBusyError (default 30)
+- SQLITE_JOURNAL_MODE  default WAL
+- SQLITE_SYNCHRONOUS   default NORMAL
+- SQLITE_CACHE_SIZE    page cache per connection, negative means KiB (default -65536)
+- SQLITE_MMAP_SIZE     bytes of memory-mapped I/O (default 268435456)
+- SQLITE_BUSY_TIMEOUT  milliseconds to wait on a locked database (default 5000)
+- SQLITE_WRITER_BUSY_TIMEOUT  milliseconds the writer waits for the write lock
+                       (default 60000); ingest workers appending to a table
+                       hold it for one batch at a time (see core.ingest_jobs)
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from core.sql_security import read_only_authorizer
+
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "db/database.db")
+METADATA_DATABASE_PATH = os.environ.get("METADATA_DATABASE_PATH", "db/metadata.db")
+
+DEFAULT_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", "4"))
+READ_TIMEOUT = float(os.environ.get("DB_READ_TIMEOUT", "30"))
+WRITER_BUSY_TIMEOUT = int(os.environ.get("SQLITE_WRITER_BUSY_TIMEOUT", "60000"))
+
+
+def _default_pragmas() -> Dict[str, str]:
+    return {
+        'journal_mode': os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        'synchronous': os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        'cache_size': os.environ.get("SQLITE_CACHE_SIZE", "-65536"),
+        'mmap_size': os.environ.get("SQLITE_MMAP_SIZE", "268435456"),
+        'busy_timeout': os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"),
+        'temp_store': "MEMORY",
+    }
+
+
+# Pragmas that change the database file rather than the connection; only the
+# writer sets these
+_DATABASE_PRAGMAS = {'journal_mode'}
+
+
+def _read_only_uri(db_path: str) -> str:
+    if db_path.startswith("file:"):
+        separator = "&" if "?" in db_path else "?"
+        return f"{db_path}{separator}mode=ro"
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro"
+
+
+class DatabaseBusyError(sqlite3.OperationalError):
+    """No pooled read connection became free within DB_READ_TIMEOUT"""
+
+
+class ConnectionManager:
+    """
+    Pool of read connections plus one lock-guarded writer for a database file.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        read_pool_size: int = DEFAULT_READ_POOL_SIZE,
+        pragmas: Optional[Dict[str, str]] = None
+    ):
+        self.db_path = db_path
+        self.read_pool_size = max(1, read_pool_size)
+        self.pragmas = pragmas if pragmas is not None else _default_pragmas()
+        # An in-memory database only exists on one connection, so readers
+        # must share the writer's connection
+        self.in_memory = db_path == ":memory:" or db_path.startswith("file::memory:")
+
+        self._idle_readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
+        self._reader_available = threading.Condition(self._pool_lock)
+
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._init_lock = threading.Lock()
+        self._closed = False
+
+    def _apply_pragmas(self, conn: sqlite3.Connection, for_writer: bool) -> None:
+        for name, value in self.pragmas.items():
+            if name in _DATABASE_PRAGMAS and not for_writer:
+                continue
+            if name == 'busy_timeout' and for_writer:
+                value = max(int(value), WRITER_BUSY_TIMEOUT)
+            conn.execute(f"PRAGMA {name}={value}")
+
+    def _connect(self, for_writer: bool) -> sqlite3.Connection:
+        if os.path.dirname(self.db_path) and not self.in_memory:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        if for_writer:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(_read_only_uri(self.db_path), uri=True, check_same_thread=False)
+        try:
+            self._apply_pragmas(conn, for_writer)
+            if not for_writer:
+                # After the pragmas, which the authorizer would deny
+                conn.set_authorizer(read_only_authorizer)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        # Guarded by its own lock so readers can trigger creation without
+        # waiting behind whoever currently holds the writer
+        with self._init_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection manager is closed")
+            if self._writer is None:
+                self._writer = self._connect(for_writer=True)
+            return self._writer
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        deadline = time.monotonic() + READ_TIMEOUT
+        with self._reader_available:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection manager is closed")
+                try:
+                    return self._idle_readers.get_nowait()
+                except queue.Empty:
+                    pass
+                if self._reader_count < self.read_pool_size:
+                    self._reader_count += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DatabaseBusyError(
+                        f"Database busy: all {self.read_pool_size} read connections "
+                        f"are in use (waited {READ_TIMEOUT:g}s)"
+                    )
+                self._reader_available.wait(remaining)
+
+        # Open the database through the writer first so that it exists and
+        # is in WAL mode before any reader touches it
+        try:
+            self._get_writer()
+            conn = self._connect(for_writer=False)
+        except Exception:
+            with self._reader_available:
+                self._reader_count -= 1
+                self._reader_available.notify()
+            raise
+        return conn
+
+    def _release_reader(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._reader_available:
+            if self._closed:
+                # Manager was closed while this reader was borrowed
+                conn.close()
+                return
+            self._idle_readers.put(conn)
+            self._reader_available.notify()
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a pooled, read-only connection.
+
+        Cursors must be fully consumed or closed before the block exits, since
+        an open statement pins the reader to an old snapshot.
+        """
+        if self.in_memory:
+            # Shares the writer's connection, restricted for the block
+            with self.writer() as conn:
+                conn.set_authorizer(read_only_authorizer)
+                try:
+                    yield conn
+                finally:
+                    conn.set_authorizer(None)
+            return
+
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow the single writer connection (one holder at a time).
+
+        An open transaction is rolled back if the block raises.
+        """
+        with self._writer_lock:
+            conn = self._get_writer()
+            try:
+                yield conn
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+
+    def stats(self) -> Dict[str, int]:
+        with self._pool_lock:
+            return {
+                'read_pool_size': self.read_pool_size,
+                'open_readers': self._reader_count,
+                'idle_readers': self._idle_readers.qsize(),
+            }
+
+    def close(self) -> None:
+        """
+        Close every connection owned by this manager.
+
+        Idle readers are closed immediately; borrowed readers are closed when
+        they are returned.
+        """
+        with self._reader_available:
+            self._closed = True
+            idle = []
+            while not self._idle_readers.empty():
+                idle.append(self._idle_readers.get_nowait())
+            self._reader_available.notify_all()
+        for conn in idle:
+            conn.close()
+        with self._writer_lock, self._init_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path: Optional[str] = None, pragmas: Optional[Dict[str, str]] = None) -> ConnectionManager:
+    """
+    Get the shared manager for a database path (the application database by default).
+
+    ``pragmas`` replace the defaults when the manager is first created.
+    """
+    db_path = db_path or DATABASE_PATH
+    with _managers_lock:
+        manager = _managers.get(db_path)
+        if manager is None:
+            manager = ConnectionManager(db_path, pragmas=pragmas)
+            _managers[db_path] = manager
+        return manager
+
+
+def close_connection_manager(db_path: str) -> None:
+    """
+    Close and forget the manager for one database (e.g. a scratch database
+    that is about to be deleted).
+    """
+    with _managers_lock:
+        manager = _managers.pop(db_path, None)
+    if manager is not None:
+        manager.close()
+
+
+def get_metadata_connection_manager() -> ConnectionManager:
+    """
+    Get the shared manager for the internal metadata database.
+    """
+    return get_connection_manager(METADATA_DATABASE_PATH)
+
+
+def close_all_connections() -> None:
+    """
+    Close and forget every manager (used on shutdown and between tests).
+    """
+    with _managers_lock:
+        managers = list(_managers.values())
+        _managers.clear()
+    for manager in managers:
+        manager.close()
@@ -0,0 +1,189 @@
+"""
+Bounded executors for running blocking work off the event loop.
+
+The FastAPI handlers are async, but sqlite3, pandas and the LLM SDK clients
+are all blocking. Handlers dispatch that work into one of three named pools so
+a slow LLM call or a large upload never stalls the uvicorn event loop:
+
+- "db":     short SQLite reads (schema, queries, insights, exports)
+- "llm":    SQL and query generation requests
+- "llm_calls": individual provider API calls, so a request can hedge across
+            providers (see core.llm_routing)
+- "ingest": file conversion for uploads
+
+Pool sizes and queue limits are configurable through environment variables
+(e.g. DB_EXECUTOR_WORKERS, DB_EXECUTOR_QUEUE). When a pool's queue is full,
+new work is rejected with ExecutorSaturatedError instead of piling up.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when a pool's queue is full and cannot accept more work."""
+
+    pass
+
+
+# Default (workers, max queued tasks) per pool
+DEFAULT_POOL_LIMITS = {
+    "db": (8, 200),
+    "llm": (16, 200),
+    "llm_calls": (32, 200),
+    "ingest": (2, 20),
+}
+
+
+class BoundedExecutor:
+    """
+    A thread pool with a cap on queued work and live queue-depth counters.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"{name}-worker"
+        )
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def submit(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        Submit blocking work to the pool.
+
+        Raises:
+            ExecutorSaturatedError: If max_queue tasks are already waiting
+        """
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturatedError(
+                    f"The {self.name} executor is saturated "
+                    f"({self._queued} tasks queued), please retry shortly"
+                )
+            self._queued += 1
+
+        def tracked() -> Any:
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        try:
+            return self._executor.submit(tracked)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run blocking work in the pool and await its result.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Snapshot of the pool's size and queue depth.
+        """
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'running': self._running,
+                'queued': self._queued,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+def _pool_limit(name: str, setting: str, default: int) -> int:
+    value = os.environ.get(f"{name.upper()}_EXECUTOR_{setting}")
+    return max(1, int(value)) if value else default
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    """
+    Get (creating on first use) the named pool.
+    """
+    if name not in DEFAULT_POOL_LIMITS:
+        raise ValueError(f"Unknown executor: {name}")
+
+    with _executors_lock:
+        if name not in _executors:
+            default_workers, default_queue = DEFAULT_POOL_LIMITS[name]
+            _executors[name] = BoundedExecutor(
+                name,
+                max_workers=_pool_limit(name, "WORKERS", default_workers),
+                max_queue=_pool_limit(name, "QUEUE", default_queue),
+            )
+        return _executors[name]
+
+
+async def run_blocking(pool: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking function in the named pool without blocking the event loop.
+
+    Example:
+        schema = await run_blocking("db", get_database_schema)
+    """
+    return await get_executor(pool).run(functools.partial(func, *args, **kwargs))
+
+
+async def iterate_blocking(pool: str, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """
+    Drive a blocking iterator (e.g. a cursor) from async code, one item per
+    pool task. The iterator is closed if the consumer stops early.
+    """
+    sentinel = object()
+    try:
+        while True:
+            item = await run_blocking(pool, next, iterator, sentinel)
+            if item is sentinel:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await run_blocking(pool, close)
+
+
+def get_executor_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Queue depth and counters for every pool.
+    """
+    return {name: get_executor(name).stats() for name in DEFAULT_POOL_LIMITS}
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    """
+    Shut down all pools (called on application shutdown).
+    """
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
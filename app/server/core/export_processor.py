@@ -0,0 +1,315 @@
+"""
+Streaming exporters for tables and query results.
+
+Exporters consume row batches straight from a SQLite cursor (see
+stream_sql_rows / stream_table_rows) and yield encoded chunks, so memory stays
+flat regardless of the size of the export and the first bytes can be sent as
+soon as the first batch has been read.
+
+Supported formats are CSV, NDJSON, Parquet and the Arrow IPC stream format.
+The columnar formats need the optional pyarrow dependency.
+"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Set
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+    pq = None
+
+
+def project_batches(
+    source_columns: List[str],
+    batches: Iterable[List[tuple]],
+    target_columns: List[str]
+) -> Iterator[List[tuple]]:
+    """
+    Re-order row batches to a requested column list (missing columns become None)
+
+    Args:
+        source_columns: Column names of the incoming rows
+        batches: Iterable of row-tuple batches
+        target_columns: Column names (and order) wanted in the output
+    """
+    if source_columns == target_columns:
+        yield from batches
+        return
+
+    positions = {name: i for i, name in enumerate(source_columns)}
+    indices = [positions.get(name) for name in target_columns]
+
+    for rows in batches:
+        yield [
+            tuple(None if i is None else row[i] for i in indices)
+            for row in rows
+        ]
+
+
+def iter_csv_chunks(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """
+    Encode row batches as UTF-8 CSV, one chunk per batch
+
+    NULL values are written as empty fields.
+
+    Args:
+        columns: Column names for the header row
+        batches: Iterable of row-tuple batches
+
+    Yields:
+        Encoded CSV bytes, starting with the header
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def drain() -> bytes:
+        chunk = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk
+
+    # Send the header before the first batch is read
+    writer.writerow(columns)
+    yield drain()
+
+    for rows in batches:
+        writer.writerows(rows)
+        yield drain()
+
+
+def iter_ndjson_chunks(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """
+    Encode row batches as newline-delimited JSON objects, one chunk per batch
+
+    Values JSON cannot represent (e.g. BLOBs) are written as strings.
+    """
+    for rows in batches:
+        lines = [
+            json.dumps(dict(zip(columns, row)), default=str)
+            for row in rows
+        ]
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that hands written bytes back in chunks.
+
+    pyarrow writers track offsets through tell(), so the position keeps
+    counting after each drain.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        chunk = b''.join(self._chunks)
+        self._chunks = []
+        return chunk
+
+
+def arrow_type_for_storage(storage_classes: Set[str]):
+    """
+    The Arrow type that holds every value of a column with these SQLite
+    storage classes (see sql_processor.scan_storage_classes)
+
+    Integers and reals widen to float64, and a column mixing numbers with
+    text or BLOBs is exported as text.
+    """
+    if not storage_classes:
+        # Only NULLs; a string column is the most useful empty column
+        return pa.string()
+    if storage_classes == {'integer'}:
+        return pa.int64()
+    if storage_classes <= {'integer', 'real'}:
+        return pa.float64()
+    if storage_classes == {'blob'}:
+        return pa.binary()
+    return pa.string()
+
+
+def _arrow_type_for(values: List[Any]):
+    """Infer the Arrow type of a column from its first batch of values"""
+    arrow_type = pa.array(values).type
+    if pa.types.is_null(arrow_type):
+        # No values yet to go on; a string column can hold whatever follows
+        return pa.string()
+    return arrow_type
+
+
+def _arrow_array(values: List[Any], arrow_type, name: str):
+    """Build a column array, stringifying values that SQLite stored with another type"""
+    if pa.types.is_integer(arrow_type) and any(isinstance(v, float) for v in values):
+        # pyarrow would silently truncate these
+        raise ValueError(f"Column '{name}' has REAL values but is exported as {arrow_type}")
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        if not pa.types.is_string(arrow_type):
+            raise
+        return pa.array(
+            [v if v is None or isinstance(v, str) else str(v) for v in values],
+            type=arrow_type
+        )
+
+
+def iter_record_batches(
+    columns: List[str],
+    batches: Iterable[List[tuple]],
+    storage_classes: Optional[List[Set[str]]] = None
+) -> Iterator[Any]:
+    """
+    Convert row batches to Arrow record batches
+
+    SQLite columns can mix value types, so the schema should come from the
+    storage classes each column holds across all rows. Without them it is
+    inferred from the first non-empty batch, and a later batch that does not
+    fit raises ValueError. Yields nothing if there are no rows.
+    """
+    schema = None
+    if storage_classes is not None:
+        schema = pa.schema([
+            pa.field(name, arrow_type_for_storage(classes))
+            for name, classes in zip(columns, storage_classes)
+        ])
+    for rows in batches:
+        if not rows:
+            continue
+        column_values = [list(values) for values in zip(*rows)]
+        if schema is None:
+            schema = pa.schema([
+                pa.field(name, _arrow_type_for(values))
+                for name, values in zip(columns, column_values)
+            ])
+        arrays = [
+            _arrow_array(values, field.type, field.name)
+            for values, field in zip(column_values, schema)
+        ]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _empty_schema(columns: List[str]):
+    return pa.schema([pa.field(name, pa.string()) for name in columns])
+
+
+def iter_arrow_chunks(
+    columns: List[str],
+    batches: Iterable[List[tuple]],
+    storage_classes: Optional[List[Set[str]]] = None
+) -> Iterator[bytes]:
+    """
+    Encode row batches as an Arrow IPC stream, one record batch per row batch
+    """
+    sink = _ChunkSink()
+    writer = None
+    for record_batch in iter_record_batches(columns, batches, storage_classes):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, record_batch.schema)
+        writer.write_batch(record_batch)
+        yield sink.drain()
+
+    if writer is None:
+        writer = pa.ipc.new_stream(sink, _empty_schema(columns))
+    writer.close()
+    yield sink.drain()
+
+
+def iter_parquet_chunks(
+    columns: List[str],
+    batches: Iterable[List[tuple]],
+    storage_classes: Optional[List[Set[str]]] = None
+) -> Iterator[bytes]:
+    """
+    Encode row batches as a Parquet file, one row group per row batch
+
+    The footer is only known once every row group is written, so the file is
+    complete (and readable) only after the last chunk.
+    """
+    sink = _ChunkSink()
+    writer = None
+    for record_batch in iter_record_batches(columns, batches, storage_classes):
+        if writer is None:
+            writer = pq.ParquetWriter(sink, record_batch.schema, compression='snappy')
+        writer.write_batch(record_batch)
+        yield sink.drain()
+
+    if writer is None:
+        writer = pq.ParquetWriter(sink, _empty_schema(columns), compression='snappy')
+    writer.close()
+    yield sink.drain()
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    """How to encode and serve one export format"""
+    name: str
+    media_type: str
+    extension: str
+    encoder: Callable[[List[str], Iterable[List[tuple]]], Iterator[bytes]]
+    batch_rows: int
+    requires_pyarrow: bool = False
+
+
+EXPORT_FORMATS = {
+    'csv': ExportFormat('csv', 'text/csv', 'csv', iter_csv_chunks, 500),
+    'ndjson': ExportFormat('ndjson', 'application/x-ndjson', 'ndjson', iter_ndjson_chunks, 500),
+    # Columnar formats compress and load better with larger batches
+    'parquet': ExportFormat(
+        'parquet', 'application/vnd.apache.parquet', 'parquet', iter_parquet_chunks, 10000, True
+    ),
+    'arrow': ExportFormat(
+        'arrow', 'application/vnd.apache.arrow.stream', 'arrows', iter_arrow_chunks, 10000, True
+    ),
+}
+
+
+def resolve_export_format(requested: Optional[str] = None, accept: Optional[str] = None) -> ExportFormat:
+    """
+    Pick the export format from an explicit name, else from an Accept header
+
+    Defaults to CSV.
+
+    Raises:
+        ValueError: If the format is unknown or needs pyarrow and it is not installed
+    """
+    if requested:
+        export_format = EXPORT_FORMATS.get(requested.lower())
+        if export_format is None:
+            raise ValueError(
+                f"Unsupported export format '{requested}'. "
+                f"Supported formats: {', '.join(EXPORT_FORMATS)}"
+            )
+    else:
+        export_format = EXPORT_FORMATS['csv']
+        accepted = [part.split(';')[0].strip().lower() for part in (accept or '').split(',')]
+        for media_type in accepted:
+            match = next((f for f in EXPORT_FORMATS.values() if f.media_type == media_type), None)
+            if match is not None:
+                export_format = match
+                break
+
+    if export_format.requires_pyarrow and pa is None:
+        raise ValueError(
+            f"The {export_format.name} export format requires pyarrow, "
+            f"install it with: pip install pyarrow"
+        )
+    return export_format
@@ -1,15 +1,44 @@
+import codecs
+import itertools
 import json
 import pandas as pd
 import sqlite3
 import io
 import re
-from typing import Dict, Any, Set
+from typing import Dict, Any, Callable, List, Iterable, Iterator, BinaryIO, Optional, Tuple, Union
 from .sql_security import (
     execute_query_safely,
+    escape_identifier,
     validate_identifier,
     SQLSecurityError
 )
 from .constants import NESTED_DELIMITER, LIST_INDEX_DELIMITER
+from .db import get_connection_manager
+from .insights import adopt_table_insights, forget_table_insights, refresh_table_insights
+from .type_inference import (
+    convert_frame,
+    convert_series,
+    declared_type,
+    infer_kind,
+    is_compatible,
+    kind_of_declared_type,
+    plan_column_kinds,
+    validate_schema_hints
+)
+
+# Number of rows parsed and inserted per batch during streaming ingestion.
+# Peak memory during an upload is bounded by this, not by the file size.
+INGEST_CHUNK_ROWS = 50000
+
+# Bytes read at a time when streaming a JSON array (more are read while a
+# single element doesn't fit)
+JSON_READ_BYTES = 1024 * 1024
+
+# How an upload is written into a table of the same name:
+# - replace: drop the table and create it from the upload
+# - append:  insert the uploaded rows
+# - upsert:  insert the uploaded rows, updating rows whose key columns match
+INGEST_MODES = ('replace', 'append', 'upsert')
 
 def sanitize_table_name(table_name: str) -> str:
     """
@@ -40,140 +69,478 @@ def sanitize_table_name(table_name: str) -> str:
     
     return sanitized
 
-def convert_csv_to_sqlite(csv_content: bytes, table_name: str, db_path: str = "db/database.db") -> Dict[str, Any]:
+def clean_column_names(columns: Iterable[str]) -> List[str]:
     """
-    Convert CSV file content to SQLite table
+    Normalise column names for SQLite (lowercase, spaces and hyphens to underscores)
     """
-    try:
-        # Sanitize table name
-        table_name = sanitize_table_name(table_name)
-        
-        # Read CSV into pandas DataFrame
-        df = pd.read_csv(io.BytesIO(csv_content))
-        
-        # Clean column names
-        df.columns = [col.lower().replace(' ', '_').replace('-', '_') for col in df.columns]
-        
-        # Connect to SQLite database
-        conn = sqlite3.connect(db_path)
-        
-        # Write DataFrame to SQLite
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-        
-        # Get schema information using safe query execution
-        cursor_info = execute_query_safely(
-            conn,
-            "PRAGMA table_info({table})",
-            identifier_params={'table': table_name}
+    return [str(col).lower().replace(' ', '_').replace('-', '_') for col in columns]
+
+# Connection settings for staging databases: private scratch files that are
+# copied into the application database and then deleted, so they need no
+# durability, only a rollback journal for failed uploads
+STAGING_PRAGMAS = {
+    'journal_mode': "MEMORY",
+    'synchronous': "OFF",
+    'cache_size': "-65536",
+    'temp_store': "MEMORY",
+}
+
+def normalize_schema_hints(schema_hints: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """
+    Validate schema hints and key them by cleaned column name
+    """
+    return {
+        clean_column_names([column])[0]: kind
+        for column, kind in validate_schema_hints(schema_hints).items()
+    }
+
+def validate_ingest_mode(mode: str, key_columns: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Check an ingest mode and its key columns, returning the cleaned key columns
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode '{mode}'; expected one of: {', '.join(INGEST_MODES)}")
+    keys = clean_column_names(key for key in (key_columns or []) if str(key).strip())
+    if mode == 'upsert' and not keys:
+        raise ValueError("Upsert needs at least one key column")
+    if mode != 'upsert' and keys:
+        raise ValueError("Key columns are only used by upsert")
+    return keys
+
+def _as_binary_stream(content: Union[bytes, BinaryIO]) -> BinaryIO:
+    """
+    Accept either raw bytes or an already open binary file object
+    """
+    if isinstance(content, (bytes, bytearray)):
+        return io.BytesIO(content)
+    return content
+
+def _frame_to_rows(df: pd.DataFrame) -> List[tuple]:
+    """
+    Convert a DataFrame chunk to plain Python tuples with NaN mapped to None
+    """
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+def _insert_rows(
+    conn: sqlite3.Connection,
+    table_name: str,
+    columns: List[str],
+    rows: List[tuple],
+    key_columns: Optional[List[str]] = None
+) -> int:
+    """
+    Insert a batch of rows into the named columns of an existing table with
+    executemany, updating rows that match on ``key_columns`` if given
+    
+    Returns:
+        Number of rows added to the table (rows that updated an existing row
+        are not counted)
+    """
+    names = ", ".join(_quote_identifier(column) for column in columns)
+    placeholders = ", ".join(["?"] * len(columns))
+    sql = f"INSERT INTO {escape_identifier(table_name)} ({names}) VALUES ({placeholders})"
+    
+    if key_columns:
+        updates = ", ".join(
+            f"{_quote_identifier(column)} = excluded.{_quote_identifier(column)}"
+            for column in columns if column not in key_columns
         )
-        columns_info = cursor_info.fetchall()
-        
-        schema = {}
-        for col in columns_info:
-            schema[col[1]] = col[2]  # column_name: data_type
-        
-        # Get sample data using safe query execution
-        cursor_sample = execute_query_safely(
-            conn,
-            "SELECT * FROM {table} LIMIT 5",
-            identifier_params={'table': table_name}
+        keys = ", ".join(_quote_identifier(column) for column in key_columns)
+        sql += f" ON CONFLICT ({keys}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+    else:
+        conn.executemany(sql, rows)
+        return len(rows)
+    
+    # Updated rows keep their rowid and each added row gets the next one
+    # after the largest, so the largest rowid grows by the rows added
+    rowid_before = _max_rowid(conn, table_name)
+    conn.executemany(sql, rows)
+    return _max_rowid(conn, table_name) - rowid_before
+
+def _max_rowid(conn: sqlite3.Connection, table_name: str) -> int:
+    return execute_query_safely(
+        conn,
+        "SELECT COALESCE(MAX(rowid), 0) FROM {table}",
+        identifier_params={'table': table_name}
+    ).fetchone()[0]
+
+def _create_table_sql(table_name: str, kinds: Dict[str, str]) -> str:
+    definitions = ", ".join(
+        f"{_quote_identifier(column)} {declared_type(kind)}" for column, kind in kinds.items()
+    )
+    return f"CREATE TABLE {escape_identifier(table_name)} ({definitions})"
+
+def _existing_columns(conn: sqlite3.Connection, table_name: str) -> Dict[str, str]:
+    """
+    Declared type of every column of a table (empty if there is no such table)
+    """
+    cursor = execute_query_safely(
+        conn,
+        "PRAGMA table_info({table})",
+        identifier_params={'table': table_name}
+    )
+    return {row[1]: row[2] or '' for row in cursor.fetchall()}
+
+def _check_compatible(column: str, kind: str, declared: str) -> None:
+    if not is_compatible(kind, declared):
+        raise ValueError(
+            f"Column '{column}' is {declared} in the existing table but the upload has {kind} values; "
+            f"pass a schema hint or replace the table"
         )
-        sample_rows = cursor_sample.fetchall()
-        column_names = [col[1] for col in columns_info]
-        sample_data = [dict(zip(column_names, row)) for row in sample_rows]
-        
-        # Get row count using safe query execution
-        cursor_count = execute_query_safely(
+
+def _add_column(conn: sqlite3.Connection, table_name: str, column: str, kind: str) -> None:
+    conn.execute(
+        f"ALTER TABLE {escape_identifier(table_name)} "
+        f"ADD COLUMN {_quote_identifier(column)} {declared_type(kind)}"
+    )
+
+def _ensure_unique_key(conn: sqlite3.Connection, table_name: str, key_columns: List[str]) -> None:
+    """
+    Make sure ``key_columns`` are covered by a unique index, which upserts
+    need as their conflict target. Creating it scans the table once; later
+    upserts reuse it.
+    """
+    columns = _existing_columns(conn, table_name)
+    missing = [column for column in key_columns if column not in columns]
+    if missing:
+        raise ValueError(f"Key columns not found in table: {', '.join(missing)}")
+    
+    for row in conn.execute("SELECT name, \"unique\", partial FROM pragma_index_list(?)", (table_name,)):
+        name, unique, partial = row
+        indexed = [info[2] for info in conn.execute("SELECT * FROM pragma_index_info(?)", (name,))]
+        if unique and not partial and set(indexed) == set(key_columns):
+            return
+    
+    index_name = "upsert_" + "_".join([table_name] + key_columns)
+    keys = ", ".join(_quote_identifier(column) for column in key_columns)
+    try:
+        conn.execute(
+            f"CREATE UNIQUE INDEX {_quote_identifier(index_name)} "
+            f"ON {escape_identifier(table_name)} ({keys})"
+        )
+    except sqlite3.IntegrityError:
+        raise ValueError(f"Key columns are not unique in the existing table: {', '.join(key_columns)}")
+
+def _prepare_table(
+    conn: sqlite3.Connection,
+    table_name: str,
+    sample: pd.DataFrame,
+    kinds: Dict[str, str],
+    mode: str,
+    key_columns: List[str]
+) -> None:
+    """
+    Get a table ready for an upload: recreate it (replace), or check the
+    upload against it and add any new columns (append, upsert). A table that
+    doesn't exist yet is created in every mode.
+    """
+    if mode == 'replace':
+        execute_query_safely(
             conn,
-            "SELECT COUNT(*) FROM {table}",
-            identifier_params={'table': table_name}
+            "DROP TABLE IF EXISTS {table}",
+            identifier_params={'table': table_name},
+            allow_ddl=True
         )
-        row_count = cursor_count.fetchone()[0]
+    
+    existing = _existing_columns(conn, table_name)
+    if not existing:
+        conn.execute(_create_table_sql(table_name, kinds))
+    else:
+        for column, kind in kinds.items():
+            if column not in existing:
+                _add_column(conn, table_name, column, kind)
+            elif sample[column].notna().any():
+                _check_compatible(column, kind, existing[column])
+    
+    if key_columns:
+        missing = [column for column in key_columns if column not in kinds]
+        if missing:
+            raise ValueError(f"Key columns not found in upload: {', '.join(missing)}")
+        _ensure_unique_key(conn, table_name, key_columns)
+
+def _check_commit_batches(mode: str, commit_batches: bool) -> None:
+    if commit_batches and mode == 'replace':
+        raise ValueError("Only appends and upserts can be committed batch by batch")
+
+def _end_batch(
+    conn: sqlite3.Connection,
+    row_count: int,
+    progress: Optional[Callable[[int], None]],
+    commit_batches: bool
+) -> None:
+    """
+    Report a written batch. With ``commit_batches`` the batch is committed
+    first and the write lock is released until the next batch starts, so
+    other writers (e.g. the server publishing a staged upload) wait for at
+    most one batch instead of a whole long-running append. Rows of committed
+    batches stay if the upload later fails or is cancelled.
+    """
+    if commit_batches:
+        conn.commit()
+    if progress:
+        progress(row_count)
+    if commit_batches:
+        conn.execute("BEGIN IMMEDIATE")
+
+def write_dataframe_chunks(
+    conn: sqlite3.Connection,
+    table_name: str,
+    chunks: Iterable[pd.DataFrame],
+    schema_hints: Optional[Dict[str, str]] = None,
+    mode: str = 'replace',
+    key_columns: Optional[List[str]] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    commit_batches: bool = False
+) -> Tuple[int, int]:
+    """
+    Write the rows of a stream of DataFrame chunks into a table.
+
+    Column types are inferred from the first chunk (see core.type_inference),
+    with ``schema_hints`` (cleaned column name -> kind) taking precedence, and
+    every chunk is converted to them and inserted with executemany. ``mode``
+    is one of INGEST_MODES; append and upsert only touch the uploaded rows.
+    ``progress`` is called with the rows written so far after every chunk and
+    may raise to abandon the upload. Everything runs inside a single
+    transaction, so a failed upload leaves the previous table intact, unless
+    ``commit_batches`` (see _end_batch) commits an append or upsert chunk by
+    chunk.
+
+    Returns:
+        Number of rows written, and how many of them were added to the table
+        (the rest updated existing rows)
+    """
+    _check_commit_batches(mode, commit_batches)
+    row_count = 0
+    rows_added = 0
+    kinds = None
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for chunk in chunks:
+            chunk.columns = clean_column_names(chunk.columns)
+
+            if kinds is None:
+                kinds = plan_column_kinds(chunk, schema_hints)
+                _prepare_table(conn, table_name, chunk, kinds, mode, key_columns or [])
+
+            if len(chunk):
+                chunk = convert_frame(chunk, kinds)
+                rows_added += _insert_rows(conn, table_name, list(kinds), _frame_to_rows(chunk), key_columns)
+                row_count += len(chunk)
+                _end_batch(conn, row_count, progress, commit_batches)
+
+        if kinds is None:
+            raise ValueError("No data found in file")
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return row_count, rows_added
+
+def _finish_upload(
+    conn: sqlite3.Connection,
+    table_name: str,
+    rows_written: int,
+    rows_added: int,
+    mode: str
+) -> Dict[str, Any]:
+    """
+    Update stored insights after an upload and build its result.
+    
+    A replaced table is new, so its insights are computed now and its row
+    count is the number of rows written. Insights of a table that was
+    appended or upserted to are dropped and recomputed on the next request
+    rather than rescanning the whole table for every delta; likewise its
+    row count is left as None, for the server to add rows_added to the count
+    it has cached (see sql_processor.record_table_rows_added).
+    """
+    if mode == 'replace':
+        refresh_table_insights(conn, table_name)
+        row_count = rows_written
+    else:
+        forget_table_insights(conn, table_name)
+        row_count = None
+    
+    result = _describe_table(conn, table_name, row_count)
+    result['rows_written'] = rows_written
+    result['rows_added'] = rows_added
+    return result
+
+def _describe_table(conn: sqlite3.Connection, table_name: str, row_count: Optional[int]) -> Dict[str, Any]:
+    """
+    Build the upload result (schema and sample rows) for a freshly written table
+    """
+    # Get schema information using safe query execution
+    cursor_info = execute_query_safely(
+        conn,
+        "PRAGMA table_info({table})",
+        identifier_params={'table': table_name}
+    )
+    columns_info = cursor_info.fetchall()
+
+    schema = {}
+    for col in columns_info:
+        schema[col[1]] = col[2]  # column_name: data_type
+
+    # Get sample data using safe query execution
+    cursor_sample = execute_query_safely(
+        conn,
+        "SELECT * FROM {table} LIMIT 5",
+        identifier_params={'table': table_name}
+    )
+    sample_rows = cursor_sample.fetchall()
+    column_names = [col[1] for col in columns_info]
+    sample_data = [dict(zip(column_names, row)) for row in sample_rows]
+
+    return {
+        'table_name': table_name,
+        'schema': schema,
+        'row_count': row_count,
+        'sample_data': sample_data
+    }
+
+def convert_csv_to_sqlite(
+    csv_content: Union[bytes, BinaryIO],
+    table_name: str,
+    db_path: Optional[str] = None,
+    chunk_size: int = INGEST_CHUNK_ROWS,
+    schema_hints: Optional[Dict[str, str]] = None,
+    mode: str = 'replace',
+    key_columns: Optional[List[str]] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    commit_batches: bool = False
+) -> Dict[str, Any]:
+    """
+    Convert CSV file content to SQLite table.
+
+    The CSV is parsed in chunks of ``chunk_size`` rows and streamed into SQLite,
+    so ``csv_content`` may be raw bytes or an open binary file (e.g. the spooled
+    temporary file behind an UploadFile) without ever being fully loaded.
+    ``schema_hints`` maps column names to kinds (see core.type_inference);
+    text and category columns hinted by their header are read as such, so
+    values like zip codes keep their leading zeros. ``mode`` is one of
+    INGEST_MODES, with ``key_columns`` identifying rows for upsert, and
+    ``progress`` is called with the rows written after every chunk.
+    ``commit_batches`` commits an append or upsert chunk by chunk.
+    """
+    try:
+        # Sanitize table name
+        table_name = sanitize_table_name(table_name)
+        key_columns = validate_ingest_mode(mode, key_columns)
+        parser_dtypes = {
+            column: 'category' if kind == 'category' else str
+            for column, kind in validate_schema_hints(schema_hints).items()
+            if kind in ('text', 'category')
+        }
+        schema_hints = normalize_schema_hints(schema_hints)
         
-        conn.close()
+        # Read CSV lazily in fixed-size chunks
+        chunks = pd.read_csv(_as_binary_stream(csv_content), chunksize=chunk_size, dtype=parser_dtypes)
         
-        return {
-            'table_name': table_name,
-            'schema': schema,
-            'row_count': row_count,
-            'sample_data': sample_data
-        }
+        # Borrow the database's writer connection
+        with get_connection_manager(db_path).writer() as conn:
+            row_count, rows_added = write_dataframe_chunks(
+                conn, table_name, chunks, schema_hints, mode, key_columns, progress, commit_batches
+            )
+            return _finish_upload(conn, table_name, row_count, rows_added, mode)
         
     except Exception as e:
         raise Exception(f"Error converting CSV to SQLite: {str(e)}")
 
-def convert_json_to_sqlite(json_content: bytes, table_name: str, db_path: str = "db/database.db") -> Dict[str, Any]:
+def convert_json_to_sqlite(
+    json_content: Union[bytes, BinaryIO],
+    table_name: str,
+    db_path: Optional[str] = None,
+    chunk_size: int = INGEST_CHUNK_ROWS,
+    schema_hints: Optional[Dict[str, str]] = None,
+    mode: str = 'replace',
+    key_columns: Optional[List[str]] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    commit_batches: bool = False
+) -> Dict[str, Any]:
     """
-    Convert JSON file content to SQLite table
+    Convert JSON file content (an array of objects) to SQLite table.
+    
+    The array is parsed incrementally and each object is flattened as in
+    convert_jsonl_to_sqlite and streamed into SQLite in batches, so memory
+    stays bounded however large the array is.
     """
     try:
         # Sanitize table name
         table_name = sanitize_table_name(table_name)
+        key_columns = validate_ingest_mode(mode, key_columns)
+        schema_hints = normalize_schema_hints(schema_hints)
         
-        # Parse JSON
-        data = json.loads(json_content.decode('utf-8'))
+        records = (flatten_json_object(obj) for obj in _iter_json_array_objects(json_content))
         
-        # Ensure it's a list of objects
-        if not isinstance(data, list):
-            raise ValueError("JSON must be an array of objects")
-        
-        if not data:
+        # Fail early (before touching the database) on an empty array
+        first_record = next(records, None)
+        if first_record is None:
             raise ValueError("JSON array is empty")
         
-        # Convert to pandas DataFrame
-        df = pd.DataFrame(data)
-        
-        # Clean column names
-        df.columns = [col.lower().replace(' ', '_').replace('-', '_') for col in df.columns]
-        
-        # Connect to SQLite database
-        conn = sqlite3.connect(db_path)
-        
-        # Write DataFrame to SQLite
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-        
-        # Get schema information using safe query execution
-        cursor_info = execute_query_safely(
-            conn,
-            "PRAGMA table_info({table})",
-            identifier_params={'table': table_name}
-        )
-        columns_info = cursor_info.fetchall()
-        
-        schema = {}
-        for col in columns_info:
-            schema[col[1]] = col[2]  # column_name: data_type
-        
-        # Get sample data using safe query execution
-        cursor_sample = execute_query_safely(
-            conn,
-            "SELECT * FROM {table} LIMIT 5",
-            identifier_params={'table': table_name}
-        )
-        sample_rows = cursor_sample.fetchall()
-        column_names = [col[1] for col in columns_info]
-        sample_data = [dict(zip(column_names, row)) for row in sample_rows]
-        
-        # Get row count using safe query execution
-        cursor_count = execute_query_safely(
-            conn,
-            "SELECT COUNT(*) FROM {table}",
-            identifier_params={'table': table_name}
-        )
-        row_count = cursor_count.fetchone()[0]
-        
-        conn.close()
-        
-        return {
-            'table_name': table_name,
-            'schema': schema,
-            'row_count': row_count,
-            'sample_data': sample_data
-        }
+        # Borrow the database's writer connection
+        with get_connection_manager(db_path).writer() as conn:
+            row_count, rows_added = write_records(
+                conn,
+                table_name,
+                itertools.chain([first_record], records),
+                batch_size=chunk_size,
+                schema_hints=schema_hints,
+                mode=mode,
+                key_columns=key_columns,
+                progress=progress,
+                commit_batches=commit_batches
+            )
+            return _finish_upload(conn, table_name, row_count, rows_added, mode)
         
     except Exception as e:
         raise Exception(f"Error converting JSON to SQLite: {str(e)}")
 
+def publish_staged_table(staging_path: str, table_name: str, db_path: Optional[str] = None) -> int:
+    """
+    Replace a table with its copy in a staging database.
+    
+    Uploads can be parsed into a private staging database in another process
+    (see core.ingest_jobs), so the shared database is only written to for
+    the copy, which SQLite does row by row in C without any Python objects.
+    The staged table's stored insights are carried over.
+    
+    Returns:
+        Number of rows copied
+    """
+    with get_connection_manager(db_path).writer() as conn:
+        conn.execute("ATTACH DATABASE ? AS staging", (staging_path,))
+        try:
+            staging_database = next(
+                (path for _, name, path in conn.execute("PRAGMA database_list").fetchall() if name == "staging"),
+                ""
+            )
+            row = conn.execute(
+                "SELECT sql FROM staging.sqlite_master WHERE type = 'table' AND name = ?",
+                (table_name,)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Table '{table_name}' not found in staging database")
+            
+            table = escape_identifier(table_name)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS main.{table}")
+                # An unqualified CREATE TABLE creates the table in main
+                conn.execute(row[0])
+                row_count = conn.execute(f"INSERT INTO main.{table} SELECT * FROM staging.{table}").rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE staging")
+        
+        adopt_table_insights(conn, table_name, staging_database)
+    return row_count
+
 def flatten_json_object(obj: Any, prefix: str = "") -> Dict[str, Any]:
     """
     Flatten a nested JSON object using delimiter constants.
@@ -201,45 +568,373 @@ def flatten_json_object(obj: Any, prefix: str = "") -> Dict[str, Any]:
     
     return result
 
-def discover_jsonl_fields(jsonl_content: bytes) -> Set[str]:
+def _iter_jsonl_objects(jsonl_content: Union[bytes, BinaryIO]) -> Iterator[Dict[str, Any]]:
     """
-    Discover all possible field names by scanning the entire JSONL file.
+    Lazily parse a JSONL payload line by line and yield flattened objects.
     
     Args:
-        jsonl_content: The raw JSONL file content
+        jsonl_content: Raw JSONL bytes or an open binary file
         
-    Returns:
-        Set of all flattened field names found in the file
+    Yields:
+        Flattened key-value pairs for each non-blank line
     """
-    all_fields = set()
+    text = io.TextIOWrapper(_as_binary_stream(jsonl_content), encoding='utf-8')
     
     try:
-        content = jsonl_content.decode('utf-8')
-        lines = content.strip().split('\n')
-        
-        for line_num, line in enumerate(lines, 1):
+        for line_num, line in enumerate(text, 1):
             line = line.strip()
             if not line:
                 continue
                 
             try:
                 json_obj = json.loads(line)
-                flattened = flatten_json_object(json_obj)
-                all_fields.update(flattened.keys())
             except json.JSONDecodeError as e:
                 raise ValueError(f"Invalid JSON on line {line_num}: {str(e)}")
+            
+            yield flatten_json_object(json_obj)
     except UnicodeDecodeError:
         raise ValueError("File is not valid UTF-8 encoded text")
+    finally:
+        # Don't let the wrapper close the caller's file object
+        text.detach()
+
+def _iter_json_array_objects(
+    json_content: Union[bytes, BinaryIO],
+    read_size: int = JSON_READ_BYTES
+) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily parse a JSON array and yield its objects one at a time.
+    
+    Only the element being parsed (and at most ``read_size`` bytes beyond it)
+    is held in memory; each element is decoded with json's own decoder.
+    
+    Raises:
+        ValueError: If the content is not a well-formed array of objects
+    """
+    stream = _as_binary_stream(json_content)
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    whitespace = re.compile(r'\s*')
+    buffer = ""
+    pos = 0
+    eof = False
+    
+    def read_more(size: int) -> None:
+        nonlocal buffer, pos, eof
+        chunk = stream.read(size)
+        eof = not chunk
+        try:
+            text = text_decoder.decode(chunk, final=eof)
+        except UnicodeDecodeError:
+            raise ValueError("File is not valid UTF-8 encoded text")
+        # Drop what has been parsed already
+        buffer = buffer[pos:] + text
+        pos = 0
+    
+    def next_char() -> str:
+        # Skip whitespace; the next character, or '' at the end of the content
+        nonlocal pos
+        while True:
+            pos = whitespace.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            read_more(read_size)
     
-    return all_fields
+    def next_element() -> Any:
+        # Read more while the element is incomplete. A complete-looking
+        # element at the very end of the buffer (e.g. a number) might
+        # continue in the next read.
+        nonlocal pos
+        size = read_size
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                if end < len(buffer) or eof:
+                    pos = end
+                    return element
+            except json.JSONDecodeError as e:
+                truncated = e.pos >= len(buffer) - 16 or e.msg.startswith("Unterminated string")
+                if eof or not truncated:
+                    raise ValueError(f"Invalid JSON: {e.msg}")
+            read_more(size)
+            size *= 2
+    
+    if next_char() != '[':
+        raise ValueError("JSON must be an array of objects")
+    pos += 1
+    
+    if next_char() == ']':
+        pos += 1
+    else:
+        while True:
+            if not next_char():
+                raise ValueError("Invalid JSON: unterminated array")
+            element = next_element()
+            if not isinstance(element, dict):
+                raise ValueError("JSON must be an array of objects")
+            yield element
+            
+            char = next_char()
+            pos += 1
+            if char == ']':
+                break
+            if char != ',':
+                raise ValueError(
+                    f"Invalid JSON: expected ',' or ']' but found {char!r}" if char
+                    else "Invalid JSON: unterminated array"
+                )
+    
+    if next_char():
+        raise ValueError("Invalid JSON: extra data after the array")
 
-def convert_jsonl_to_sqlite(jsonl_content: bytes, table_name: str, db_path: str = "db/database.db") -> Dict[str, Any]:
+def _quote_identifier(name: str) -> str:
+    """
+    Quote a column name for DDL, allowing characters that validate_identifier rejects
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+class _RecordTableWriter:
+    """
+    Streams flattened records into a table, evolving its schema as it goes.
+    
+    Columns are created from the first batch and any key first seen in a later
+    batch is added with ALTER TABLE ADD COLUMN, so rows never have to be padded
+    out to the full set of fields before insertion. Each column's kind is
+    inferred from the batch it first appears in (or taken from ``schema_hints``)
+    and dates and booleans are converted batch by batch. Records written into
+    an existing table are checked against its columns' types, and only the
+    columns present in the upload are written.
+    """
+    
+    # Kinds whose JSON values need converting before storage
+    CONVERTED_KINDS = ('boolean', 'date', 'datetime', 'timestamp')
+    
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        table_name: str,
+        schema_hints: Optional[Dict[str, str]] = None,
+        key_columns: Optional[List[str]] = None
+    ):
+        self.conn = conn
+        self.table_name = table_name
+        self.schema_hints = schema_hints or {}
+        self.key_columns = key_columns or []
+        self.existing = _existing_columns(conn, table_name)
+        self.columns: List[str] = list(self.existing)
+        self.kinds: List[str] = [kind_of_declared_type(declared) for declared in self.existing.values()]
+        self.key_positions: Dict[str, int] = {}
+        self.written: List[int] = []
+        self.unchecked = set(range(len(self.columns)))
+        self.key_checked = False
+        self.row_count = 0
+        self.rows_added = 0
+    
+    def _register_new_keys(self, batch: List[Dict[str, Any]]) -> List[int]:
+        new_positions = []
+        clean_positions = {name: i for i, name in enumerate(self.columns)}
+        
+        for record in batch:
+            for key in record:
+                if key in self.key_positions:
+                    continue
+                clean_name = clean_column_names([key])[0]
+                if clean_name not in clean_positions:
+                    clean_positions[clean_name] = len(self.columns)
+                    new_positions.append(len(self.columns))
+                    self.columns.append(clean_name)
+                position = clean_positions[clean_name]
+                if position not in self.written:
+                    self.written.append(position)
+                self.key_positions[key] = position
+        
+        return new_positions
+    
+    def _values_by_position(self, batch: List[Dict[str, Any]], positions: Iterable[int]) -> Dict[int, List[Any]]:
+        values_by_position = {position: [] for position in positions}
+        for record in batch:
+            for key, value in record.items():
+                position = self.key_positions[key]
+                if position in values_by_position:
+                    values_by_position[position].append(value)
+        return values_by_position
+    
+    def _check_existing_columns(self, batch: List[Dict[str, Any]]) -> None:
+        positions = self.unchecked.intersection(self.written)
+        if not positions:
+            return
+        
+        for position, values in self._values_by_position(batch, positions).items():
+            name = self.columns[position]
+            kind = self.schema_hints.get(name) or infer_kind(pd.Series(values, dtype=object))
+            if any(value is not None for value in values):
+                _check_compatible(name, kind, self.existing[name])
+            if name in self.schema_hints:
+                self.kinds[position] = kind
+        self.unchecked -= positions
+    
+    def _declare_columns(self, batch: List[Dict[str, Any]], positions: List[int]) -> None:
+        if not positions:
+            return
+        
+        values_by_position = self._values_by_position(batch, positions)
+        for position in positions:
+            name = self.columns[position]
+            self.kinds.append(
+                self.schema_hints.get(name) or infer_kind(pd.Series(values_by_position[position], dtype=object))
+            )
+        
+        definitions = [
+            f"{_quote_identifier(self.columns[position])} {declared_type(self.kinds[position])}"
+            for position in positions
+        ]
+        table = escape_identifier(self.table_name)
+        
+        if len(self.columns) == len(positions):
+            self.conn.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+        else:
+            for definition in definitions:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {definition}")
+    
+    def _check_key_columns(self) -> None:
+        written_names = {self.columns[position] for position in self.written}
+        missing = [column for column in self.key_columns if column not in written_names]
+        if missing:
+            raise ValueError(f"Key columns not found in upload: {', '.join(missing)}")
+        _ensure_unique_key(self.conn, self.table_name, self.key_columns)
+        self.key_checked = True
+    
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        
+        self._declare_columns(batch, self._register_new_keys(batch))
+        self._check_existing_columns(batch)
+        
+        if not self.written:
+            # Only empty objects so far; there is nothing to insert yet
+            return
+        if self.key_columns and not self.key_checked:
+            self._check_key_columns()
+        
+        width = len(self.columns)
+        rows = []
+        for record in batch:
+            row = [None] * width
+            for key, value in record.items():
+                row[self.key_positions[key]] = value
+            rows.append(row)
+        
+        for position in self.written:
+            kind = self.kinds[position]
+            if kind in self.CONVERTED_KINDS:
+                converted = convert_series(pd.Series([row[position] for row in rows], dtype=object), kind)
+                converted = converted.astype(object).where(converted.notna(), None)
+                for row, value in zip(rows, converted):
+                    row[position] = value
+        
+        if not self.key_columns:
+            groups = {tuple(self.written): rows}
+        else:
+            # An upsert only updates the fields a record has, so records are
+            # written in groups that share the same keys
+            groups = {}
+            for record, row in zip(batch, rows):
+                if record:
+                    positions = tuple(sorted({self.key_positions[key] for key in record}))
+                    groups.setdefault(positions, []).append(row)
+        
+        for positions, group in groups.items():
+            self.rows_added += _insert_rows(
+                self.conn,
+                self.table_name,
+                [self.columns[position] for position in positions],
+                [tuple(row[position] for position in positions) for row in group],
+                self.key_columns
+            )
+            self.row_count += len(group)
+
+def write_records(
+    conn: sqlite3.Connection,
+    table_name: str,
+    records: Iterable[Dict[str, Any]],
+    batch_size: int = INGEST_CHUNK_ROWS,
+    schema_hints: Optional[Dict[str, str]] = None,
+    mode: str = 'replace',
+    key_columns: Optional[List[str]] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    commit_batches: bool = False
+) -> Tuple[int, int]:
+    """
+    Write a stream of flat records into a table in a single pass.
+    
+    Records are inserted in batches of ``batch_size`` and new keys become new
+    columns as they appear. ``mode`` is one of INGEST_MODES and ``progress``
+    and ``commit_batches`` work as in write_dataframe_chunks. Everything runs
+    in one transaction, so a failure part-way through leaves any previous
+    table intact, unless batches are committed.
+    
+    Returns:
+        Number of rows written, and how many of them were added to the table
+    """
+    _check_commit_batches(mode, commit_batches)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if mode == 'replace':
+            execute_query_safely(
+                conn,
+                "DROP TABLE IF EXISTS {table}",
+                identifier_params={'table': table_name},
+                allow_ddl=True
+            )
+        writer = _RecordTableWriter(conn, table_name, schema_hints, key_columns)
+        
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_batch(batch)
+                batch = []
+                _end_batch(conn, writer.row_count, progress, commit_batches)
+        writer.write_batch(batch)
+        _end_batch(conn, writer.row_count, progress, commit_batches)
+        
+        if not writer.written:
+            raise ValueError("No valid records found")
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    return writer.row_count, writer.rows_added
+
+def convert_jsonl_to_sqlite(
+    jsonl_content: Union[bytes, BinaryIO],
+    table_name: str,
+    db_path: Optional[str] = None,
+    chunk_size: int = INGEST_CHUNK_ROWS,
+    schema_hints: Optional[Dict[str, str]] = None,
+    mode: str = 'replace',
+    key_columns: Optional[List[str]] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    commit_batches: bool = False
+) -> Dict[str, Any]:
     """
     Convert JSONL file content to SQLite table with flattened structure.
     
+    Each line is parsed and flattened once and streamed into SQLite in batches;
+    columns are added as new flattened keys appear.
+    
     Args:
-        jsonl_content: The raw JSONL file content
+        jsonl_content: The raw JSONL file content or an open binary file
         table_name: Name for the SQLite table
+        chunk_size: Number of records inserted per batch
+        schema_hints: Column name -> kind overrides (see core.type_inference)
+        mode: One of INGEST_MODES
+        key_columns: Columns identifying a row, for upsert
+        progress: Called with the rows written so far after every batch
+        commit_batches: Commit an append or upsert batch by batch
         
     Returns:
         Dict containing table info, schema, row count, and sample data
@@ -247,89 +942,30 @@ def convert_jsonl_to_sqlite(jsonl_content: bytes, table_name: str, db_path: str
     try:
         # Sanitize table name
         table_name = sanitize_table_name(table_name)
+        schema_hints = normalize_schema_hints(schema_hints)
+        key_columns = validate_ingest_mode(mode, key_columns)
         
-        # First pass: discover all possible fields
-        all_fields = discover_jsonl_fields(jsonl_content)
+        records = _iter_jsonl_objects(jsonl_content)
         
-        if not all_fields:
+        # Fail early (before touching the database) on an empty file
+        first_record = next(records, None)
+        if first_record is None:
             raise ValueError("No valid JSON objects found in JSONL file")
         
-        # Second pass: process each line and create consistent records
-        content = jsonl_content.decode('utf-8')
-        lines = content.strip().split('\n')
-        
-        records = []
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if not line:
-                continue
-                
-            try:
-                json_obj = json.loads(line)
-                flattened = flatten_json_object(json_obj)
-                
-                # Create record with all fields, filling missing ones with None
-                record = {}
-                for field in all_fields:
-                    record[field] = flattened.get(field, None)
-                
-                records.append(record)
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Invalid JSON on line {line_num}: {str(e)}")
-        
-        if not records:
-            raise ValueError("No valid records found in JSONL file")
-        
-        # Convert to pandas DataFrame
-        df = pd.DataFrame(records)
-        
-        # Clean column names for SQLite compatibility
-        df.columns = [col.lower().replace(' ', '_').replace('-', '_') for col in df.columns]
-        
-        # Connect to SQLite database
-        conn = sqlite3.connect(db_path)
-        
-        # Write DataFrame to SQLite
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-        
-        # Get schema information using safe query execution
-        cursor_info = execute_query_safely(
-            conn,
-            "PRAGMA table_info({table})",
-            identifier_params={'table': table_name}
-        )
-        columns_info = cursor_info.fetchall()
-        
-        schema = {}
-        for col in columns_info:
-            schema[col[1]] = col[2]  # column_name: data_type
-        
-        # Get sample data using safe query execution
-        cursor_sample = execute_query_safely(
-            conn,
-            "SELECT * FROM {table} LIMIT 5",
-            identifier_params={'table': table_name}
-        )
-        sample_rows = cursor_sample.fetchall()
-        column_names = [col[1] for col in columns_info]
-        sample_data = [dict(zip(column_names, row)) for row in sample_rows]
-        
-        # Get row count using safe query execution
-        cursor_count = execute_query_safely(
-            conn,
-            "SELECT COUNT(*) FROM {table}",
-            identifier_params={'table': table_name}
-        )
-        row_count = cursor_count.fetchone()[0]
-        
-        conn.close()
-        
-        return {
-            'table_name': table_name,
-            'schema': schema,
-            'row_count': row_count,
-            'sample_data': sample_data
-        }
+        # Borrow the database's writer connection
+        with get_connection_manager(db_path).writer() as conn:
+            row_count, rows_added = write_records(
+                conn,
+                table_name,
+                itertools.chain([first_record], records),
+                batch_size=chunk_size,
+                schema_hints=schema_hints,
+                mode=mode,
+                key_columns=key_columns,
+                progress=progress,
+                commit_batches=commit_batches
+            )
+            return _finish_upload(conn, table_name, row_count, rows_added, mode)
         
     except Exception as e:
-        raise Exception(f"Error converting JSONL to SQLite: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error converting JSONL to SQLite: {str(e)}")
@@ -0,0 +1,620 @@
+"""
+Background ingestion jobs.
+
+/api/upload copies the upload to a spool file, records a job in the
+ingest_jobs table of the metadata database (see core.db) and returns the job
+straight away. The conversion runs in a worker process, so a large upload
+neither holds its HTTP request open nor competes with the request threads
+for the GIL. Jobs can be followed through GET /api/jobs/{job_id} and
+cancelled with POST /api/jobs/{job_id}/cancel.
+
+Workers write their progress (bytes parsed, rows written) into the job's row
+after every batch, and read the row's cancellation flag at the same time; a
+cancelled or failed replacement is discarded, so any previous table is left
+intact. Jobs that were queued when the server stopped are resubmitted
+on the next start and jobs that were running are marked failed.
+
+Uploads that replace a table are parsed into a private staging database,
+so any number of them can be parsed at once, one per worker. The server
+process then copies each staged table into the application database through
+its single writer connection (see core.file_processor.publish_staged_table),
+so the shared database is only locked for the copy. Appends and upserts
+check and write the existing table directly, committing batch by batch so
+that the server's writer (which waits up to SQLITE_WRITER_BUSY_TIMEOUT, see
+core.db) is never locked out for longer than one batch; a worker waits up to
+INGEST_JOB_LOCK_TIMEOUT for the lock before each batch. The server then
+finishes the job by adding the rows it added to the table's cached row
+count (see core.sql_processor.record_table_rows_added) instead of counting
+the table again. A cancelled or failed append or upsert keeps the batches
+it committed, as its rows_written reports.
+
+POST /api/upload/batch queues a job per file for several files or for the
+members of .zip and .tar(.gz/.bz2/.xz) archives. Uploads may be compressed
+(.gz, .bz2, .xz or .zst, see core.compression).
+
+Settings (environment variables):
+
+- INGEST_JOB_WORKERS       worker processes (default: CPU count, at most 4)
+- INGEST_JOB_QUEUE         queued jobs allowed before uploads are rejected (default 20)
+- INGEST_JOB_LOCK_TIMEOUT  seconds a worker waits for the database write lock (default 3600)
+- INGEST_SPOOL_DIR         directory for uploads waiting to be converted (default: the system temp dir)
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from core import db
+from core.db import close_connection_manager, get_connection_manager, get_metadata_connection_manager
+from core.compression import check_decompressor, open_decompressed, split_compression
+from core.executors import ExecutorSaturatedError, get_executor
+from core.file_processor import (
+    STAGING_PRAGMAS,
+    convert_csv_to_sqlite,
+    convert_json_to_sqlite,
+    convert_jsonl_to_sqlite,
+    publish_staged_table
+)
+from core.sql_processor import invalidate_schema_cache, record_table_row_count, record_table_rows_added
+
+logger = logging.getLogger(__name__)
+
+INGEST_JOB_WORKERS = int(os.environ.get("INGEST_JOB_WORKERS") or min(4, os.cpu_count() or 1))
+INGEST_JOB_QUEUE = int(os.environ.get("INGEST_JOB_QUEUE", "20"))
+INGEST_JOB_LOCK_TIMEOUT = float(os.environ.get("INGEST_JOB_LOCK_TIMEOUT", "3600"))
+INGEST_SPOOL_DIR = os.environ.get("INGEST_SPOOL_DIR") or None
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# Converter for each upload format
+CONVERTERS = {
+    'csv': convert_csv_to_sqlite,
+    'json': convert_json_to_sqlite,
+    'jsonl': convert_jsonl_to_sqlite,
+}
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+_CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS ingest_jobs (
+        job_id TEXT PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        file_format TEXT NOT NULL,
+        options TEXT NOT NULL,
+        database_path TEXT NOT NULL,
+        spool_path TEXT NOT NULL,
+        staging_path TEXT,
+        status TEXT NOT NULL,
+        bytes_total INTEGER NOT NULL,
+        bytes_parsed INTEGER NOT NULL DEFAULT 0,
+        rows_written INTEGER NOT NULL DEFAULT 0,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )
+"""
+
+
+class IngestJobCancelled(Exception):
+    """Raised inside a worker to abandon a job that was cancelled."""
+
+    pass
+
+
+def _execute(sql: str, params: tuple = ()) -> List[tuple]:
+    with get_metadata_connection_manager().writer() as conn:
+        conn.execute(_CREATE_TABLE)
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+    return rows
+
+
+def _remove_spool(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _describe_job(row: tuple) -> Dict[str, Any]:
+    (job_id, file_name, table_name, file_format, options, status, bytes_total, bytes_parsed,
+     rows_written, result, error, created_at, started_at, finished_at) = row
+
+    bytes_per_second = rows_per_second = None
+    if started_at is not None:
+        elapsed = (finished_at or time.time()) - started_at
+        if elapsed > 0:
+            bytes_per_second = bytes_parsed / elapsed
+            rows_per_second = rows_written / elapsed
+
+    return {
+        'job_id': job_id,
+        'file_name': file_name,
+        'table_name': table_name,
+        'file_format': file_format,
+        'mode': json.loads(options).get('mode', 'replace'),
+        'status': status,
+        'bytes_total': bytes_total,
+        'bytes_parsed': bytes_parsed,
+        'rows_written': rows_written,
+        'bytes_per_second': bytes_per_second,
+        'rows_per_second': rows_per_second,
+        'created_at': created_at,
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'result': json.loads(result) if result else None,
+        'error': error,
+    }
+
+
+_JOB_COLUMNS = (
+    "job_id, file_name, table_name, file_format, options, status, bytes_total, bytes_parsed, "
+    "rows_written, result, error, created_at, started_at, finished_at"
+)
+
+
+def upload_format(file_name: str) -> Optional[str]:
+    """
+    The format of an uploaded file from its name (ignoring any compression
+    suffix), or None if unsupported
+    """
+    file_name, _ = split_compression(file_name)
+    extension = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+    return extension if extension in CONVERTERS else None
+
+
+def table_name_for(file_name: str) -> str:
+    """
+    The table an uploaded file is loaded into: its name without directory
+    or extensions (sanitised further by the converters)
+    """
+    base_name, _ = split_compression(os.path.basename(file_name.replace('\\', '/')))
+    return base_name.rsplit('.', 1)[0].lower().replace(' ', '_')
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    A job's status and progress, or None if there is no such job
+    """
+    rows = _execute(f"SELECT {_JOB_COLUMNS} FROM ingest_jobs WHERE job_id = ?", (job_id,))
+    return _describe_job(rows[0]) if rows else None
+
+
+def list_jobs(limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    The most recent jobs, newest first
+    """
+    rows = _execute(f"SELECT {_JOB_COLUMNS} FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+    return [_describe_job(row) for row in rows]
+
+
+def _check_queue_capacity(new_jobs: int) -> None:
+    queued = _execute("SELECT COUNT(*) FROM ingest_jobs WHERE status = 'queued'")[0][0]
+    if queued + new_jobs > INGEST_JOB_QUEUE:
+        raise ExecutorSaturatedError(
+            f"The ingest queue is full ({queued} jobs queued), please retry shortly"
+        )
+
+
+def create_job(
+    upload: BinaryIO,
+    file_name: str,
+    table_name: str,
+    file_format: str,
+    options: Optional[Dict[str, Any]] = None,
+    db_path: Optional[str] = None
+) -> str:
+    """
+    Spool an upload to disk and queue a job for it, returning the job ID
+
+    Raises:
+        ExecutorSaturatedError: If INGEST_JOB_QUEUE jobs are already queued
+    """
+    if file_format not in CONVERTERS:
+        raise ValueError(f"Unsupported file format: {file_format}")
+    check_decompressor(split_compression(file_name)[1])
+    _check_queue_capacity(1)
+
+    job_id = uuid.uuid4().hex
+    fd, spool_path = tempfile.mkstemp(prefix=f"ingest-{job_id}-", suffix=f".{file_format}", dir=INGEST_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as spool:
+            shutil.copyfileobj(upload, spool, 1024 * 1024)
+        _execute(
+            "INSERT INTO ingest_jobs "
+            "(job_id, file_name, table_name, file_format, options, database_path, spool_path, "
+            "status, bytes_total, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+            (
+                job_id, file_name, table_name, file_format, json.dumps(options or {}),
+                os.path.abspath(db_path or db.DATABASE_PATH), spool_path,
+                os.path.getsize(spool_path), time.time()
+            )
+        )
+    except Exception:
+        _remove_spool(spool_path)
+        raise
+    return job_id
+
+
+def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Cancel a job: a queued job never starts and a running one stops at its
+    next batch (a replacement is discarded, an append or upsert keeps the
+    batches already committed). Returns the job, or None if there is no such job.
+    """
+    rows = _execute(
+        "UPDATE ingest_jobs SET cancel_requested = 1, "
+        "status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END, "
+        "finished_at = CASE WHEN status = 'queued' THEN ? ELSE finished_at END "
+        "WHERE job_id = ? RETURNING status, spool_path",
+        (time.time(), job_id)
+    )
+    if not rows:
+        return None
+    status, spool_path = rows[0]
+    if status == 'cancelled':
+        _remove_spool(spool_path)
+    return get_job(job_id)
+
+
+def _finish(job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+    _execute(
+        "UPDATE ingest_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ?",
+        (status, json.dumps(result, default=str) if result is not None else None, error, time.time(), job_id)
+    )
+
+
+class _JobProgress:
+    """
+    Progress callback for the converters: records how far the job has got
+    and stops it if it was cancelled
+    """
+
+    def __init__(self, job_id: str, spool: BinaryIO):
+        self.job_id = job_id
+        self.spool = spool
+
+    def __call__(self, rows_written: int) -> None:
+        rows = _execute(
+            "UPDATE ingest_jobs SET bytes_parsed = ?, rows_written = ? WHERE job_id = ? RETURNING cancel_requested",
+            (self.spool.tell(), rows_written, self.job_id)
+        )
+        if rows and rows[0][0]:
+            raise IngestJobCancelled("Upload cancelled")
+
+
+def _create_staging_database() -> str:
+    fd, staging_path = tempfile.mkstemp(prefix="ingest-staging-", suffix=".db", dir=INGEST_SPOOL_DIR)
+    os.close(fd)
+    return staging_path
+
+
+def _remove_staging(path: Optional[str]) -> None:
+    if path:
+        close_connection_manager(path)
+        _remove_spool(path)
+
+
+def run_job(job_id: str) -> Optional[str]:
+    """
+    Convert a queued job's upload (in a worker process), returning its
+    status: 'staged' when a replacement table is ready to publish, 'written'
+    when an append or upsert is done (both finished by publish_job), or None
+    if the job was not waiting to run
+    """
+    rows = _execute(
+        "UPDATE ingest_jobs SET status = 'running', started_at = ? "
+        "WHERE job_id = ? AND status = 'queued' AND cancel_requested = 0 "
+        "RETURNING file_name, table_name, file_format, options, database_path, spool_path",
+        (time.time(), job_id)
+    )
+    if not rows:
+        return None
+    file_name, table_name, file_format, options, database_path, spool_path = rows[0]
+    options = json.loads(options)
+
+    staging_path = None
+    if options.get('mode', 'replace') == 'replace':
+        staging_path = _create_staging_database()
+        _execute("UPDATE ingest_jobs SET staging_path = ? WHERE job_id = ?", (staging_path, job_id))
+        get_connection_manager(staging_path, pragmas=STAGING_PRAGMAS)
+
+    try:
+        # The spool holds the upload as sent, so compressed uploads are
+        # decompressed as they are parsed and progress counts compressed bytes
+        with open(spool_path, 'rb') as spool, open_decompressed(spool, split_compression(file_name)[1]) as stream:
+            result = CONVERTERS[file_format](
+                stream,
+                table_name,
+                staging_path or database_path,
+                progress=_JobProgress(job_id, spool),
+                commit_batches=staging_path is None,
+                **options
+            )
+            bytes_parsed = spool.tell()
+        result = {
+            'table_name': result['table_name'],
+            'table_schema': result['schema'],
+            'row_count': result['row_count'],
+            'sample_data': result['sample_data'],
+            'rows_written': result['rows_written'],
+            'rows_added': result['rows_added'],
+        }
+        _execute(
+            "UPDATE ingest_jobs SET bytes_parsed = ?, rows_written = ?, result = ? WHERE job_id = ?",
+            (bytes_parsed, result['rows_written'], json.dumps(result, default=str), job_id)
+        )
+        # Finished by the server process (see publish_job)
+        if staging_path:
+            close_connection_manager(staging_path)
+            return 'staged'
+        return 'written'
+    except Exception as e:
+        _remove_staging(staging_path)
+        cancelled = _execute("SELECT cancel_requested FROM ingest_jobs WHERE job_id = ?", (job_id,))[0][0]
+        if cancelled:
+            _finish(job_id, 'cancelled')
+            return 'cancelled'
+        _finish(job_id, 'failed', error=str(e))
+        return 'failed'
+    finally:
+        _remove_spool(spool_path)
+
+
+def publish_job(job_id: str) -> Optional[str]:
+    """
+    Finish a job a worker has written (in the server process), returning its
+    final status: a staged table is copied into the application database
+    through the server's writer connection, and the table's cached row count
+    is brought up to date without a recount
+    """
+    rows = _execute(
+        "SELECT table_name, database_path, staging_path, cancel_requested, result, started_at "
+        "FROM ingest_jobs WHERE job_id = ? AND status = 'running'",
+        (job_id,)
+    )
+    if not rows:
+        return None
+    table_name, database_path, staging_path, cancelled, result, started_at = rows[0]
+    result = json.loads(result)
+
+    try:
+        if staging_path is None:
+            # Appended or upserted rows are already committed, cancelled or not
+            result['row_count'] = record_table_rows_added(result['table_name'], result['rows_added'], started_at)
+        if cancelled:
+            _finish(job_id, 'cancelled')
+            return 'cancelled'
+        if staging_path is not None:
+            publish_staged_table(staging_path, result['table_name'], database_path)
+        _finish(job_id, 'succeeded', result=result)
+    except Exception as e:
+        _finish(job_id, 'failed', error=str(e))
+        return 'failed'
+    finally:
+        _remove_staging(staging_path)
+
+    if staging_path is not None:
+        try:
+            record_table_row_count(result['table_name'], result['row_count'])
+        except Exception as e:
+            logger.error(f"[ERROR] Recording row count for job {job_id} failed: {str(e)}")
+    return 'succeeded'
+
+
+def _init_worker(metadata_path: str) -> None:
+    """
+    Set up a worker process: use the server's metadata database and wait
+    for the write lock instead of failing while another upload holds it
+    """
+    db.METADATA_DATABASE_PATH = metadata_path
+    os.environ["SQLITE_BUSY_TIMEOUT"] = str(int(INGEST_JOB_LOCK_TIMEOUT * 1000))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked, so workers never inherit the server's
+            # open SQLite connections
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, INGEST_JOB_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(os.path.abspath(db.METADATA_DATABASE_PATH),)
+            )
+        return _pool
+
+
+def _job_done(job_id: str, future: Future) -> None:
+    """
+    Runs in the server process when a worker is done with a job
+    """
+    try:
+        status = future.result()
+    except Exception as e:
+        # The worker died before it could record the outcome
+        logger.error(f"[ERROR] Ingest job {job_id} crashed: {str(e)}")
+        rows = _execute(
+            "UPDATE ingest_jobs SET status = 'failed', error = ?, finished_at = ? "
+            "WHERE job_id = ? AND status IN ('queued', 'running') RETURNING spool_path, staging_path",
+            (f"Ingest worker failed: {str(e)}", time.time(), job_id)
+        )
+        for spool_path, staging_path in rows:
+            _remove_spool(spool_path)
+            _remove_staging(staging_path)
+        _forget_row_count(job_id)
+        return
+
+    if status in ('staged', 'written'):
+        try:
+            get_executor("ingest").submit(publish_job, job_id)
+        except ExecutorSaturatedError:
+            publish_job(job_id)
+        except RuntimeError:
+            # The server is shutting down; recover_jobs cleans the job up on
+            # the next start
+            logger.error(f"[ERROR] Ingest job {job_id} could not be published during shutdown")
+            _forget_row_count(job_id)
+    elif status in ('failed', 'cancelled'):
+        _forget_row_count(job_id)
+
+
+def _forget_row_count(job_id: str) -> None:
+    """
+    Drop the cached row count of a table an unfinished append or upsert may
+    have committed rows to
+    """
+    job = get_job(job_id)
+    if job and job['mode'] != 'replace' and job['rows_written']:
+        invalidate_schema_cache(job['table_name'])
+
+
+def start_job(job_id: str) -> None:
+    """
+    Hand a queued job to the worker pool
+    """
+    global _pool
+    try:
+        future = _get_pool().submit(run_job, job_id)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool
+        with _pool_lock:
+            _pool = None
+        future = _get_pool().submit(run_job, job_id)
+    future.add_done_callback(lambda done: _job_done(job_id, done))
+
+
+def submit_job(
+    upload: BinaryIO,
+    file_name: str,
+    table_name: str,
+    file_format: str,
+    options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Queue an upload for conversion in the background and return its job
+    """
+    job_id = create_job(upload, file_name, table_name, file_format, options)
+    start_job(job_id)
+    return get_job(job_id)
+
+
+def _archive_members(upload: BinaryIO, file_name: str) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    The supported files in an archive, as (name, readable stream) pairs
+    """
+    def wanted(name: str) -> bool:
+        base_name = os.path.basename(name)
+        return not base_name.startswith('.') and '__MACOSX/' not in name and upload_format(name) is not None
+
+    if file_name.lower().endswith('.zip'):
+        with zipfile.ZipFile(upload) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and wanted(member.filename):
+                    with archive.open(member) as stream:
+                        yield member.filename, stream
+    else:
+        with tarfile.open(fileobj=upload, mode='r:*') as archive:
+            for member in archive:
+                if member.isfile() and wanted(member.name):
+                    yield member.name, archive.extractfile(member)
+
+
+def submit_batch(uploads: List[Tuple[str, BinaryIO]], options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Queue several uploads, expanding archives into their member files, and
+    return a job per file. Each file replaces the table named after it.
+
+    Raises:
+        ValueError: If there are no supported files, a file's compression
+            can't be decompressed here, or two files would load the same table
+        ExecutorSaturatedError: If the files don't fit in the ingest queue
+    """
+    files = []
+    for file_name, upload in uploads:
+        if file_name.lower().endswith(ARCHIVE_SUFFIXES):
+            files.append((file_name, upload, True))
+        elif upload_format(file_name):
+            check_decompressor(split_compression(file_name)[1])
+            files.append((file_name, upload, False))
+        else:
+            raise ValueError(f"Unsupported file: {file_name}")
+    _check_queue_capacity(len(files))
+
+    job_ids = []
+    tables: Dict[str, str] = {}
+    try:
+        for file_name, upload, is_archive in files:
+            members = _archive_members(upload, file_name) if is_archive else [(file_name, upload)]
+            for member_name, stream in members:
+                table_name = table_name_for(member_name)
+                if table_name in tables:
+                    raise ValueError(
+                        f"'{tables[table_name]}' and '{member_name}' would both load table '{table_name}'"
+                    )
+                tables[table_name] = member_name
+                job_ids.append(create_job(stream, member_name, table_name, upload_format(member_name), options))
+        if not job_ids:
+            raise ValueError("No .csv, .json or .jsonl files found")
+    except Exception:
+        # All or nothing: drop the jobs queued so far
+        for job_id in job_ids:
+            cancel_job(job_id)
+        raise
+
+    for job_id in job_ids:
+        start_job(job_id)
+    return [get_job(job_id) for job_id in job_ids]
+
+
+def recover_jobs() -> None:
+    """
+    Resubmit jobs left queued by a previous server process and fail the
+    ones it was running
+    """
+    interrupted = _execute(
+        "UPDATE ingest_jobs SET status = 'failed', error = 'Interrupted by a server restart', finished_at = ? "
+        "WHERE status = 'running' RETURNING spool_path, staging_path",
+        (time.time(),)
+    )
+    for spool_path, staging_path in interrupted:
+        _remove_spool(spool_path)
+        _remove_staging(staging_path)
+
+    for job_id, spool_path in _execute("SELECT job_id, spool_path FROM ingest_jobs WHERE status = 'queued'"):
+        if os.path.exists(spool_path):
+            start_job(job_id)
+        else:
+            _finish(job_id, 'failed', error="Upload file is missing")
+
+
+def shutdown_job_pool(wait: bool = True) -> None:
+    """
+    Stop the worker processes
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
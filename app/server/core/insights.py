@@ -1,124 +1,389 @@
+"""
+Column insights computed in two passes over a table, however many columns
+it has:
+
+1. One aggregate query returns the row count and every column's non-null
+   count, plus MIN/MAX/AVG for numeric columns. These are exact.
+2. One streaming read feeds each column's values, in batches, into a
+   HyperLogLog sketch (distinct count) and a Space-Saving summary (most
+   common values). For large tables this read can use a Bernoulli sample
+   of the rows instead of all of them.
+
+Every statistic reports ~95% bounds in ColumnInsight.error_bounds (equal to
+the value when it is exact), and each most common value carries count_lower
+and count_upper.
+
+Insights for whole tables are computed when a table is written and then
+served from core.insights_cache until the table's content changes.
+
+Settings (environment variables):
+
+- INSIGHTS_SAMPLE_MIN_ROWS  sample tables with at least this many rows, 0 never (default 1000000)
+- INSIGHTS_SAMPLE_ROWS      expected number of rows in a sample (default 200000)
+"""
+
+import math
+import os
 import sqlite3
-from typing import List, Optional
-from core.data_models import ColumnInsight
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.data_models import ColumnInsight, StatisticBounds
+from .db import get_connection_manager
+from .insights_cache import (
+    database_key,
+    forget_cached_insights,
+    get_cached_insights,
+    move_cached_insights,
+    store_cached_insights,
+    table_content_version
+)
+from .sketches import BOUNDS_Z, HyperLogLog, SpaceSaving
 from .sql_security import (
+    escape_identifier,
     execute_query_safely,
     validate_identifier,
     SQLSecurityError
 )
 
-def generate_insights(table_name: str, column_names: Optional[List[str]] = None) -> List[ColumnInsight]:
+INSIGHTS_SAMPLE_MIN_ROWS = int(os.environ.get("INSIGHTS_SAMPLE_MIN_ROWS", "1000000"))
+INSIGHTS_SAMPLE_ROWS = int(os.environ.get("INSIGHTS_SAMPLE_ROWS", "200000"))
+
+# Rows read per batch in the sketch pass
+INSIGHTS_BATCH_ROWS = 20000
+
+# Most common values reported per column
+TOP_VALUES = 5
+
+NUMERIC_TYPES = ['INTEGER', 'REAL', 'NUMERIC']
+
+def generate_insights(
+    table_name: str,
+    column_names: Optional[List[str]] = None,
+    sample_rate: Optional[float] = None
+) -> List[ColumnInsight]:
     """
     Generate statistical insights for table columns
+    
+    Args:
+        table_name: Table to analyse
+        column_names: Columns to analyse (all if omitted)
+        sample_rate: Fraction of rows used for distinct counts and most common
+            values; by default large tables are sampled (INSIGHTS_SAMPLE_MIN_ROWS)
     """
     try:
         # Validate table name
         validate_identifier(table_name, "table")
         
-        conn = sqlite3.connect("db/database.db")
-        
-        # Get table schema using safe query execution
-        cursor_info = execute_query_safely(
-            conn,
-            "PRAGMA table_info({table})",
-            identifier_params={'table': table_name}
-        )
-        columns_info = cursor_info.fetchall()
-        
-        # If no specific columns requested, analyze all
-        if not column_names:
-            column_names = [col[1] for col in columns_info]
-        else:
-            # Validate provided column names
-            for col in column_names:
-                try:
-                    validate_identifier(col, "column")
-                except SQLSecurityError:
-                    raise Exception(f"Invalid column name: {col}")
-        
-        insights = []
-        
-        for col_info in columns_info:
-            col_name = col_info[1]
-            col_type = col_info[2]
-            
-            if col_name not in column_names:
-                continue
-            
-            # Validate column name
+        # Validate provided column names
+        for col in column_names or []:
             try:
-                validate_identifier(col_name, "column")
+                validate_identifier(col, "column")
             except SQLSecurityError:
-                # Skip columns with invalid names
-                continue
-            
-            # Basic statistics using safe query execution
-            cursor_distinct = execute_query_safely(
-                conn,
-                "SELECT COUNT(DISTINCT {column}) FROM {table}",
-                identifier_params={'column': col_name, 'table': table_name}
-            )
-            unique_values = cursor_distinct.fetchone()[0]
-            
-            cursor_null = execute_query_safely(
-                conn,
-                "SELECT COUNT(*) FROM {table} WHERE {column} IS NULL",
-                identifier_params={'table': table_name, 'column': col_name}
-            )
-            null_count = cursor_null.fetchone()[0]
-            
-            insight = ColumnInsight(
-                column_name=col_name,
-                data_type=col_type,
-                unique_values=unique_values,
-                null_count=null_count
-            )
-            
-            # Type-specific insights
-            if col_type in ['INTEGER', 'REAL', 'NUMERIC']:
-                # Numeric insights using safe query execution
-                cursor_stats = execute_query_safely(
-                    conn,
-                    """
-                    SELECT 
-                        MIN({column}) as min_val,
-                        MAX({column}) as max_val,
-                        AVG({column}) as avg_val
-                    FROM {table}
-                    WHERE {column} IS NOT NULL
-                    """,
-                    identifier_params={'column': col_name, 'table': table_name}
-                )
-                result = cursor_stats.fetchone()
-                if result:
-                    insight.min_value = result[0]
-                    insight.max_value = result[1]
-                    insight.avg_value = result[2]
-            
-            # Most common values (for all types) using safe query execution
-            cursor_common = execute_query_safely(
-                conn,
-                """
-                SELECT {column}, COUNT(*) as count
-                FROM {table}
-                WHERE {column} IS NOT NULL
-                GROUP BY {column}
-                ORDER BY count DESC
-                LIMIT 5
-                """,
-                identifier_params={'column': col_name, 'table': table_name}
-            )
-            most_common = cursor_common.fetchall()
-            if most_common:
-                insight.most_common = [
-                    {"value": val, "count": count} 
-                    for val, count in most_common
-                ]
-            
-            insights.append(insight)
+                raise Exception(f"Invalid column name: {col}")
+        
+        with get_connection_manager().reader() as conn:
+            if sample_rate is not None:
+                # An explicit sample rate always gets a fresh computation
+                return _compute_insights(conn, table_name, column_names, sample_rate)
+            insights = _stored_table_insights(conn, table_name)
         
-        conn.close()
+        if column_names:
+            insights = [insight for insight in insights if insight.column_name in column_names]
         return insights
         
     except Exception as e:
-        raise Exception(f"Error generating insights: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error generating insights: {str(e)}")
+
+def refresh_table_insights(conn: sqlite3.Connection, table_name: str) -> None:
+    """
+    Compute and store a table's insights right after it was written
+    """
+    try:
+        version = table_content_version(conn, table_name)
+        if version is not None:
+            insights = _compute_insights(conn, table_name, None)
+            store_cached_insights(database_key(conn), table_name, version, insights)
+    except Exception:
+        # Never fail a write over its insights; they are computed on the
+        # next request instead
+        pass
+
+def forget_table_insights(conn: sqlite3.Connection, table_name: str) -> None:
+    """
+    Drop a table's stored insights after rows were added or changed in place
+    """
+    try:
+        forget_cached_insights(database_key(conn), table_name)
+    except Exception:
+        # A stale entry is still caught by the content version unless the
+        # table was only updated in place
+        pass
+
+def adopt_table_insights(conn: sqlite3.Connection, table_name: str, source_database: str) -> None:
+    """
+    Give a table the insights stored for its copy in another database
+    (e.g. the staging database it was built in)
+    """
+    try:
+        version = table_content_version(conn, table_name)
+        if version is None or not move_cached_insights(table_name, source_database, database_key(conn), version):
+            refresh_table_insights(conn, table_name)
+    except Exception:
+        # As in refresh_table_insights, the next request computes them
+        pass
+
+def _stored_table_insights(conn: sqlite3.Connection, table_name: str) -> List[ColumnInsight]:
+    """
+    Insights for every column of a table, computed only if the stored ones
+    are missing or older than the table's content
+    """
+    version = table_content_version(conn, table_name)
+    if version is None:
+        return []
+    
+    database = database_key(conn)
+    insights = get_cached_insights(database, table_name, version)
+    if insights is None:
+        insights = _compute_insights(conn, table_name, None)
+        # Don't store insights of a table that was rewritten meanwhile
+        if table_content_version(conn, table_name) == version:
+            store_cached_insights(database, table_name, version, insights)
+    return insights
+
+def _compute_insights(
+    conn: sqlite3.Connection,
+    table_name: str,
+    column_names: Optional[List[str]],
+    sample_rate: Optional[float] = None
+) -> List[ColumnInsight]:
+    """
+    Compute per-column statistics over an open connection
+    """
+    # Get table schema using safe query execution
+    cursor_info = execute_query_safely(
+        conn,
+        "PRAGMA table_info({table})",
+        identifier_params={'table': table_name}
+    )
+    columns_info = cursor_info.fetchall()
+    
+    # If no specific columns requested, analyze all
+    if not column_names:
+        column_names = [col[1] for col in columns_info]
+    
+    columns: List[Tuple[str, str]] = []
+    for col_info in columns_info:
+        col_name = col_info[1]
+        col_type = col_info[2]
+        
+        if col_name not in column_names:
+            continue
+        
+        # Validate column name
+        try:
+            validate_identifier(col_name, "column")
+        except SQLSecurityError:
+            # Skip columns with invalid names
+            continue
+        columns.append((col_name, col_type))
+    
+    if not columns:
+        return []
+    
+    row_count, exact = _exact_statistics(conn, table_name, columns)
+    rate = _resolve_sample_rate(row_count, sample_rate)
+    sketches = _sketch_columns(conn, table_name, [name for name, _ in columns], rate)
+    
+    return [
+        _build_insight(name, col_type, row_count, exact[name], sketches[name], rate)
+        for name, col_type in columns
+    ]
+
+def _exact_statistics(
+    conn: sqlite3.Connection,
+    table_name: str,
+    columns: List[Tuple[str, str]]
+) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+    """
+    Row count, per-column non-null counts and numeric MIN/MAX/AVG in one scan
+    """
+    aggregates = ["COUNT(*)"]
+    for name, col_type in columns:
+        column = escape_identifier(name)
+        aggregates.append(f"COUNT({column})")
+        if col_type in NUMERIC_TYPES:
+            aggregates += [f"MIN({column})", f"MAX({column})", f"AVG({column})"]
+    
+    cursor = execute_query_safely(
+        conn,
+        f"SELECT {', '.join(aggregates)} FROM {{table}}",
+        identifier_params={'table': table_name}
+    )
+    values = iter(cursor.fetchone())
+    row_count = next(values)
+    
+    stats = {}
+    for name, col_type in columns:
+        column_stats = {'non_null': next(values)}
+        if col_type in NUMERIC_TYPES:
+            column_stats.update(min_value=next(values), max_value=next(values), avg_value=next(values))
+        stats[name] = column_stats
+    return row_count, stats
+
+def _resolve_sample_rate(row_count: int, sample_rate: Optional[float]) -> float:
+    """
+    Fraction of rows to sketch: the requested rate, or a sample of about
+    INSIGHTS_SAMPLE_ROWS rows for large tables
+    """
+    if sample_rate is not None:
+        return min(1.0, max(sample_rate, 0.0)) or 1.0
+    if INSIGHTS_SAMPLE_MIN_ROWS and row_count >= INSIGHTS_SAMPLE_MIN_ROWS:
+        return min(1.0, INSIGHTS_SAMPLE_ROWS / row_count)
+    return 1.0
+
+def _sketch_columns(
+    conn: sqlite3.Connection,
+    table_name: str,
+    column_names: List[str],
+    rate: float
+) -> Dict[str, Tuple[HyperLogLog, SpaceSaving]]:
+    """
+    Feed every column into its sketches in a single read of the table (or
+    of a Bernoulli sample of its rows)
+    """
+    sketches = {name: (HyperLogLog(), SpaceSaving()) for name in column_names}
+    select = ", ".join(escape_identifier(name) for name in column_names)
+    params: Tuple[Any, ...] = ()
+    query = f"SELECT {select} FROM {{table}}"
+    if rate < 1.0:
+        # random() is a signed 64-bit integer; keep each row with probability rate
+        query += " WHERE (random() & 9223372036854775807) < ?"
+        params = (int(rate * 2 ** 63),)
+    
+    cursor = execute_query_safely(conn, query, params=params, identifier_params={'table': table_name})
+    try:
+        while True:
+            rows = cursor.fetchmany(INSIGHTS_BATCH_ROWS)
+            if not rows:
+                break
+            for name, values in zip(column_names, zip(*rows)):
+                values = np.array(values, dtype=object)
+                values = values[np.not_equal(values, None)]
+                if len(values) == 0:
+                    continue
+                # Without NULLs pandas can infer a native dtype, which hashes
+                # and counts far faster than generic objects
+                counts = pd.Series(values).infer_objects().value_counts(sort=False)
+                hll, top_values = sketches[name]
+                # Repeats don't change a HyperLogLog, so only hash each value once
+                hll.add(counts.index)
+                top_values.add_counts(counts)
+    finally:
+        cursor.close()
+    return sketches
+
+def _exact(value: Any) -> Optional[StatisticBounds]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return StatisticBounds(lower=value, upper=value)
+    return None
+
+def _distinct_estimate(
+    hll: HyperLogLog,
+    top_values: SpaceSaving,
+    non_null: int,
+    rate: float
+) -> Tuple[int, StatisticBounds]:
+    """
+    Distinct count and bounds from a (possibly sampled) HyperLogLog sketch
+    """
+    sampled = top_values.total
+    if sampled == 0:
+        return 0, StatisticBounds(lower=0, upper=non_null if rate < 1.0 else 0)
+    
+    if top_values.exact:
+        # Every value seen has its own counter, so the count is exact
+        estimate = lower = upper = float(len(top_values.counts))
+    else:
+        estimate = min(hll.estimate(), sampled)
+        lower, upper = hll.bounds()
+    
+    if rate < 1.0:
+        unsampled = non_null - sampled
+        if top_values.exact:
+            singletons = float(top_values.frequency_profile().get(1, 0))
+            # Good-Turing: values seen once estimate the share of rows that
+            # hold values the sample missed (+3 bounds it when there are none)
+            unseen_share = min(1.0, (singletons + BOUNDS_Z * math.sqrt(singletons) + 3) / sampled)
+            upper += unseen_share * unsampled + BOUNDS_Z * math.sqrt(unseen_share * unsampled)
+        else:
+            # At least 2d - n of the d sampled values were seen once. Rows
+            # outside the sample could all hold new values.
+            singletons = max(0.0, 2 * estimate - sampled)
+            upper += unsampled
+        # GEE estimator: values seen once stand for sqrt(1 / rate) values each
+        estimate = estimate - singletons + singletons / math.sqrt(rate)
+    
+    upper = min(upper, non_null)
+    lower = min(lower, upper)
+    estimate = min(max(estimate, lower), upper)
+    return round(estimate), StatisticBounds(lower=math.floor(lower), upper=math.ceil(upper))
+
+def _most_common(top_values: SpaceSaving, rate: float) -> List[Dict[str, Any]]:
+    """
+    Most common values with count bounds, scaled up from a sample if needed
+    """
+    most_common = []
+    for value, count, error in top_values.top(TOP_VALUES):
+        lower, upper = count - error, count
+        if rate < 1.0:
+            # Binomial sampling error on top of the summary's own error
+            lower = max(0.0, lower - BOUNDS_Z * math.sqrt(lower * (1 - rate))) / rate
+            upper = (upper + BOUNDS_Z * math.sqrt(upper * (1 - rate))) / rate
+            count = count / rate
+        most_common.append({
+            "value": value,
+            "count": round(count),
+            "count_lower": math.floor(lower),
+            "count_upper": math.ceil(upper)
+        })
+    return most_common
+
+def _build_insight(
+    name: str,
+    col_type: str,
+    row_count: int,
+    exact: Dict[str, Any],
+    sketches: Tuple[HyperLogLog, SpaceSaving],
+    rate: float
+) -> ColumnInsight:
+    hll, top_values = sketches
+    unique_values, unique_bounds = _distinct_estimate(hll, top_values, exact['non_null'], rate)
+    
+    insight = ColumnInsight(
+        column_name=name,
+        data_type=col_type,
+        unique_values=unique_values,
+        null_count=row_count - exact['non_null'],
+        sample_rate=rate if rate < 1.0 else None
+    )
+    insight.error_bounds['unique_values'] = unique_bounds
+    insight.error_bounds['null_count'] = _exact(insight.null_count)
+    
+    # Type-specific insights
+    if col_type in NUMERIC_TYPES:
+        insight.min_value = exact['min_value']
+        insight.max_value = exact['max_value']
+        insight.avg_value = exact['avg_value']
+        for stat in ('min_value', 'max_value', 'avg_value'):
+            bounds = _exact(exact[stat])
+            if bounds is not None:
+                insight.error_bounds[stat] = bounds
+    
+    most_common = _most_common(top_values, rate)
+    if most_common:
+        insight.most_common = most_common
+    
+    return insight
@@ -0,0 +1,148 @@
+"""
+Persisted column insights, one entry per table.
+
+Insights are computed when a table is written (see core.file_processor) and
+stored in the metadata database (see core.db) with the table's content
+version, so /api/insights can answer from the stored entry instead of
+scanning the table. An entry is only used while the table's content version
+matches; a table that was replaced or appended to since gets new insights on
+its next request.
+
+A table's content version combines its CREATE statement, its root page and
+its largest rowid, all of which can be read without scanning the table.
+Tables written by the app always have their entry refreshed at write time.
+Lookups only read, on a pooled reader, so they never wait for the metadata
+writer.
+"""
+
+import hashlib
+import sqlite3
+import time
+from typing import List, Optional
+
+from pydantic import TypeAdapter
+
+from core.data_models import ColumnInsight
+from core.db import get_metadata_connection_manager
+from core.sql_security import execute_query_safely
+
+_CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS table_insights (
+        database TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        content_version TEXT NOT NULL,
+        insights TEXT NOT NULL,
+        computed_at REAL NOT NULL,
+        PRIMARY KEY (database, table_name)
+    )
+"""
+
+_insights_adapter = TypeAdapter(List[ColumnInsight])
+
+
+def database_key(conn: sqlite3.Connection) -> str:
+    """The file of the connection's main database ('' when in memory)"""
+    for _, name, path in conn.execute("PRAGMA database_list").fetchall():
+        if name == "main":
+            return path or ""
+    return ""
+
+
+def table_content_version(conn: sqlite3.Connection, table_name: str) -> Optional[str]:
+    """
+    Cheap fingerprint of a table's content, or None if the table does not exist
+    """
+    row = conn.execute(
+        "SELECT sql, rootpage FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table_name,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    sql, rootpage = row
+    try:
+        # A single b-tree seek, not a scan
+        max_rowid = execute_query_safely(
+            conn,
+            "SELECT MAX(rowid) FROM {table}",
+            identifier_params={'table': table_name}
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID tables
+        max_rowid = None
+
+    digest = hashlib.sha256((sql or "").encode("utf-8")).hexdigest()[:16]
+    return f"{rootpage}:{max_rowid}:{digest}"
+
+
+def get_cached_insights(database: str, table_name: str, content_version: str) -> Optional[List[ColumnInsight]]:
+    """
+    Stored insights for a table, or None unless they match its content version
+    """
+    try:
+        with get_metadata_connection_manager().reader() as conn:
+            row = conn.execute(
+                "SELECT content_version, insights FROM table_insights WHERE database = ? AND table_name = ?",
+                (database, table_name)
+            ).fetchone()
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        # Nothing has been stored yet (the first store creates the table)
+        return None
+
+    if row is None or row[0] != content_version:
+        return None
+    return _insights_adapter.validate_json(row[1])
+
+
+def store_cached_insights(
+    database: str,
+    table_name: str,
+    content_version: str,
+    insights: List[ColumnInsight]
+) -> None:
+    """
+    Remember a table's insights, replacing those of any earlier content
+    """
+    with get_metadata_connection_manager().writer() as conn:
+        conn.execute(_CREATE_TABLE)
+        conn.execute(
+            "INSERT OR REPLACE INTO table_insights "
+            "(database, table_name, content_version, insights, computed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (database, table_name, content_version, _insights_adapter.dump_json(insights).decode("utf-8"), time.time())
+        )
+        conn.commit()
+
+
+def forget_cached_insights(database: str, table_name: str) -> None:
+    """
+    Drop a table's stored insights (e.g. because the table was deleted)
+    """
+    with get_metadata_connection_manager().writer() as conn:
+        conn.execute(_CREATE_TABLE)
+        conn.execute(
+            "DELETE FROM table_insights WHERE database = ? AND table_name = ?",
+            (database, table_name)
+        )
+        conn.commit()
+
+
+def move_cached_insights(table_name: str, source_database: str, target_database: str, target_version: str) -> bool:
+    """
+    Hand a table's stored insights over to a copy of the table in another
+    database, returning False if there were none to move
+    """
+    with get_metadata_connection_manager().writer() as conn:
+        conn.execute(_CREATE_TABLE)
+        conn.execute(
+            "DELETE FROM table_insights WHERE database = ? AND table_name = ?",
+            (target_database, table_name)
+        )
+        moved = conn.execute(
+            "UPDATE table_insights SET database = ?, content_version = ? WHERE database = ? AND table_name = ?",
+            (target_database, target_version, source_database, table_name)
+        ).rowcount
+        conn.commit()
+    return moved > 0
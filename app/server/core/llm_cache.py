@@ -0,0 +1,235 @@
+"""
+Cache of generated SQL for natural language queries.
+
+Entries live in the metadata database (see core.db) so they survive restarts
+without showing up in the user's schema. Each entry is keyed by:
+
+- the normalised query text
+- the LLM provider and model
+- a hash of the schema description sent in the prompt
+
+so any schema change produces new keys; entries for older schemas are purged
+when the first entry for a new schema is stored. Entries expire after a TTL
+and the least recently used entries are evicted once the cache is full.
+
+Lookups only read (on a pooled reader), so they never wait for the metadata
+writer. The table is created by the first store, and the recency of hits is
+written in batches, at the latest before the next eviction.
+
+Settings (environment variables):
+
+- LLM_CACHE_TTL_SECONDS  entry lifetime, 0 disables the cache (default 86400)
+- LLM_CACHE_MAX_ENTRIES  maximum number of entries (default 1000)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from core.db import get_metadata_connection_manager
+
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1000"))
+
+_CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS llm_sql_cache (
+        cache_key TEXT PRIMARY KEY,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        schema_hash TEXT NOT NULL,
+        query_text TEXT NOT NULL,
+        sql TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used_at REAL NOT NULL
+    )
+"""
+
+# Hits whose last_used_at is written in one statement
+_TOUCH_BATCH_SIZE = 50
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# cache_key -> time of the latest hit not yet written to last_used_at
+_touches_lock = threading.Lock()
+_pending_touches: Dict[str, float] = {}
+
+
+def normalize_query_text(query_text: str) -> str:
+    """
+    Normalise a question so trivially different phrasings share an entry
+
+    Whitespace is collapsed and trailing punctuation dropped. Case is kept,
+    since it can matter for literals in the question ("named Smith").
+    """
+    return re.sub(r"\s+", " ", query_text).strip().rstrip("?.!; ").strip()
+
+
+def schema_fingerprint(schema_description: str) -> str:
+    """Hash of the schema description given to the LLM"""
+    return hashlib.sha256(schema_description.encode("utf-8")).hexdigest()
+
+
+def _cache_key(query_text: str, provider: str, model: str, schema_hash: str) -> str:
+    parts = [normalize_query_text(query_text), provider, model, schema_hash]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _cache_enabled() -> bool:
+    return LLM_CACHE_TTL_SECONDS > 0 and LLM_CACHE_MAX_ENTRIES > 0
+
+
+def _count(stat: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[stat] += amount
+
+
+def _take_touches() -> Dict[str, float]:
+    global _pending_touches
+    with _touches_lock:
+        touches, _pending_touches = _pending_touches, {}
+    return touches
+
+
+def _write_touches(conn: sqlite3.Connection, touches: Dict[str, float]) -> None:
+    if touches:
+        conn.executemany(
+            "UPDATE llm_sql_cache SET last_used_at = MAX(last_used_at, ?) WHERE cache_key = ?",
+            [(used_at, key) for key, used_at in touches.items()]
+        )
+
+
+def _touch(key: str, now: float) -> None:
+    """Record a hit, writing the batch of recorded hits once it is full"""
+    with _touches_lock:
+        _pending_touches[key] = now
+        full = len(_pending_touches) >= _TOUCH_BATCH_SIZE
+    if full:
+        touches = _take_touches()
+        with get_metadata_connection_manager().writer() as conn:
+            conn.execute(_CREATE_TABLE)
+            _write_touches(conn, touches)
+            conn.commit()
+
+
+def get_cached_sql(query_text: str, provider: str, model: str, schema_hash: str) -> Optional[str]:
+    """
+    Look up generated SQL, or None on a miss (including expired entries,
+    which the next store purges)
+    """
+    if not _cache_enabled():
+        return None
+
+    key = _cache_key(query_text, provider, model, schema_hash)
+    now = time.time()
+    try:
+        with get_metadata_connection_manager().reader() as conn:
+            row = conn.execute(
+                "SELECT sql FROM llm_sql_cache WHERE cache_key = ? AND created_at >= ?",
+                (key, now - LLM_CACHE_TTL_SECONDS)
+            ).fetchone()
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        # Nothing has been stored yet
+        row = None
+
+    if row is None:
+        _count('misses')
+        return None
+
+    _touch(key, now)
+    _count('hits')
+    return row[0]
+
+
+def store_cached_sql(query_text: str, provider: str, model: str, schema_hash: str, sql: str) -> None:
+    """
+    Remember generated SQL, purging entries for other schemas and evicting
+    the least recently used entries beyond LLM_CACHE_MAX_ENTRIES
+    """
+    if not _cache_enabled():
+        return
+
+    key = _cache_key(query_text, provider, model, schema_hash)
+    now = time.time()
+    touches = _take_touches()
+    with get_metadata_connection_manager().writer() as conn:
+        conn.execute(_CREATE_TABLE)
+        conn.execute("BEGIN")
+        # Recency must be up to date before choosing what to evict
+        _write_touches(conn, touches)
+        stale = conn.execute(
+            "DELETE FROM llm_sql_cache WHERE schema_hash != ? OR created_at < ?",
+            (schema_hash, now - LLM_CACHE_TTL_SECONDS)
+        ).rowcount
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_sql_cache "
+            "(cache_key, provider, model, schema_hash, query_text, sql, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, provider, model, schema_hash, normalize_query_text(query_text), sql, now, now)
+        )
+        evicted = conn.execute(
+            "DELETE FROM llm_sql_cache WHERE cache_key IN ("
+            "SELECT cache_key FROM llm_sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (LLM_CACHE_MAX_ENTRIES,)
+        ).rowcount
+        conn.commit()
+
+    if stale or evicted:
+        _count('evictions', stale + evicted)
+
+
+def forget_cached_sql(sql: str) -> None:
+    """
+    Drop every entry that produced this SQL (e.g. because it failed to run)
+    """
+    with get_metadata_connection_manager().writer() as conn:
+        conn.execute(_CREATE_TABLE)
+        removed = conn.execute("DELETE FROM llm_sql_cache WHERE sql = ?", (sql,)).rowcount
+        conn.commit()
+
+    if removed:
+        _count('evictions', removed)
+
+
+def clear_llm_cache() -> None:
+    """Remove every entry and reset the counters"""
+    with get_metadata_connection_manager().writer() as conn:
+        conn.execute("DROP TABLE IF EXISTS llm_sql_cache")
+        conn.commit()
+    _take_touches()
+    reset_llm_cache_stats()
+
+
+def reset_llm_cache_stats() -> None:
+    with _stats_lock:
+        for stat in _stats:
+            _stats[stat] = 0
+
+
+def get_llm_cache_stats() -> Dict[str, int]:
+    """
+    Hit/miss/eviction counters since startup, plus the current count of
+    unexpired entries
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    entries = 0
+    if _cache_enabled():
+        with get_metadata_connection_manager().reader() as conn:
+            table = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'llm_sql_cache'"
+            ).fetchone()
+            if table:
+                entries = conn.execute(
+                    "SELECT COUNT(*) FROM llm_sql_cache WHERE created_at >= ?",
+                    (time.time() - LLM_CACHE_TTL_SECONDS,)
+                ).fetchone()[0]
+    stats['entries'] = entries
+    return stats
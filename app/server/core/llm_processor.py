@@ -1,40 +1,173 @@
 import os
-from typing import Dict, Any
-from openai import OpenAI
-from anthropic import Anthropic
+import asyncio
+import inspect
+import logging
+import threading
+import time
+import weakref
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from anthropic import Anthropic, AsyncAnthropic
 from core.data_models import QueryRequest
+from core.llm_cache import get_cached_sql, store_cached_sql, schema_fingerprint
+from core.schema_retrieval import SchemaIndex, estimate_tokens, select_schema
+from core.executors import run_blocking
+from core.llm_routing import call_with_hedging, get_provider_stats
+from core.sql_security import validate_sql_query
 
-def generate_sql_with_openai(query_text: str, schema_info: Dict[str, Any]) -> str:
+logger = logging.getLogger(__name__)
+
+OPENAI_MODEL = "gpt-4.1-mini"
+ANTHROPIC_MODEL = "claude-3-haiku-20240307"
+
+# HTTP connection pool and timeouts for the provider clients
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("LLM_REQUEST_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+
+HELICONE_HEADERS = {
+    "Helicone-Property-App": "tac-6",
+    "Helicone-Property-Environment": "production"
+}
+
+# Clients are built once per (provider, API key, Helicone key) and reused, so
+# calls share keep-alive connections and TLS sessions. Async clients are also
+# kept per event loop, since their connections belong to the loop.
+_clients: Dict[Tuple[str, str, Optional[str]], Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str, Optional[str]], Any]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+OPENAI_HELICONE_URL = "https://oai.helicone.ai/v1"
+ANTHROPIC_HELICONE_URL = "https://anthropic.helicone.ai"
+
+def _llm_timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_REQUEST_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+def _build_http_client(asynchronous: bool = False):
     """
-    Generate SQL query using OpenAI API
+    Create a pooled HTTP client for one provider
     """
-    try:
-        # Get API key from environment
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set")
-
-        # Check if Helicone is configured
-        helicone_key = os.environ.get("HELICONE_API_KEY")
-        if helicone_key:
-            # Use Helicone proxy for monitoring
-            client = OpenAI(
-                api_key=api_key,
-                base_url="https://oai.helicone.ai/v1",
-                default_headers={
-                    "Helicone-Auth": f"Bearer {helicone_key}",
-                    "Helicone-Property-App": "tac-6",
-                    "Helicone-Property-Environment": "production"
-                }
-            )
+    http_client_class = httpx.AsyncClient if asynchronous else httpx.Client
+    return http_client_class(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS
+        ),
+        timeout=_llm_timeout()
+    )
+
+def _client_options(api_key: str, helicone_key: Optional[str], helicone_url: str, asynchronous: bool) -> Dict[str, Any]:
+    options = {
+        "api_key": api_key,
+        "http_client": _build_http_client(asynchronous),
+        "timeout": _llm_timeout(),
+        "max_retries": LLM_MAX_RETRIES
+    }
+    if helicone_key:
+        # Use Helicone proxy for monitoring
+        options["base_url"] = helicone_url
+        options["default_headers"] = {"Helicone-Auth": f"Bearer {helicone_key}", **HELICONE_HEADERS}
+    return options
+
+def _build_openai_client(api_key: str, helicone_key: Optional[str]) -> OpenAI:
+    return OpenAI(**_client_options(api_key, helicone_key, OPENAI_HELICONE_URL, asynchronous=False))
+
+def _build_anthropic_client(api_key: str, helicone_key: Optional[str]) -> Anthropic:
+    return Anthropic(**_client_options(api_key, helicone_key, ANTHROPIC_HELICONE_URL, asynchronous=False))
+
+def _build_async_openai_client(api_key: str, helicone_key: Optional[str]) -> AsyncOpenAI:
+    return AsyncOpenAI(**_client_options(api_key, helicone_key, OPENAI_HELICONE_URL, asynchronous=True))
+
+def _build_async_anthropic_client(api_key: str, helicone_key: Optional[str]) -> AsyncAnthropic:
+    return AsyncAnthropic(**_client_options(api_key, helicone_key, ANTHROPIC_HELICONE_URL, asynchronous=True))
+
+def _get_client(provider: str, api_key_var: str, build, asynchronous: bool = False) -> Any:
+    api_key = os.environ.get(api_key_var)
+    if not api_key:
+        raise ValueError(f"{api_key_var} environment variable not set")
+    
+    # Check if Helicone is configured
+    helicone_key = os.environ.get("HELICONE_API_KEY") or None
+    key = (provider, api_key, helicone_key)
+    with _clients_lock:
+        if asynchronous:
+            registry = _async_clients.setdefault(asyncio.get_running_loop(), {})
         else:
-            client = OpenAI(api_key=api_key)
-        
-        # Format schema for prompt
-        schema_description = format_schema_for_prompt(schema_info)
-        
-        # Create prompt
-        prompt = f"""Given the following database schema:
+            registry = _clients
+        client = registry.get(key)
+        if client is None:
+            client = build(api_key, helicone_key)
+            registry[key] = client
+        return client
+
+def get_openai_client() -> OpenAI:
+    """
+    Get the shared OpenAI client for the configured API key
+    """
+    return _get_client("openai", "OPENAI_API_KEY", _build_openai_client)
+
+def get_anthropic_client() -> Anthropic:
+    """
+    Get the shared Anthropic client for the configured API key
+    """
+    return _get_client("anthropic", "ANTHROPIC_API_KEY", _build_anthropic_client)
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """
+    Get the shared async OpenAI client for the running event loop
+    """
+    return _get_client("openai", "OPENAI_API_KEY", _build_async_openai_client, asynchronous=True)
+
+def get_async_anthropic_client() -> AsyncAnthropic:
+    """
+    Get the shared async Anthropic client for the running event loop
+    """
+    return _get_client("anthropic", "ANTHROPIC_API_KEY", _build_async_anthropic_client, asynchronous=True)
+
+def reset_llm_clients() -> None:
+    """
+    Close and forget every shared client (used on shutdown and between tests)
+    
+    Async clients can only be closed from their event loop (see
+    aclose_llm_clients); here they are just dropped.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is not None:
+            close()
+
+async def aclose_llm_clients() -> None:
+    """
+    Close the async clients that belong to the running event loop
+    """
+    with _clients_lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+SQL_SYSTEM_PROMPT = "You are a SQL expert. Convert natural language to SQL queries."
+
+def build_sql_prompt(query_text: str, schema_info: Dict[str, Any]) -> str:
+    """
+    Build the natural language to SQL prompt
+    """
+    # Format schema for prompt
+    schema_description = format_schema_for_prompt(schema_info)
+    
+    return f"""Given the following database schema:
 
 {schema_description}
 
@@ -52,29 +185,43 @@ Rules:
 - NEVER include SQL comments (-- or /* */) in the query
 
 SQL Query:"""
+
+def clean_sql_response(text: str) -> str:
+    """
+    Strip whitespace and markdown code fences from a model's SQL answer
+    """
+    sql = text.strip()
+    if sql.startswith("```sql"):
+        sql = sql[6:]
+    if sql.startswith("```"):
+        sql = sql[3:]
+    if sql.endswith("```"):
+        sql = sql[:-3]
+    
+    return sql.strip()
+
+def generate_sql_with_openai(query_text: str, schema_info: Dict[str, Any]) -> str:
+    """
+    Generate SQL query using OpenAI API
+    """
+    try:
+        client = get_openai_client()
+        
+        # Create prompt
+        prompt = build_sql_prompt(query_text, schema_info)
         
         # Call OpenAI API
         response = client.chat.completions.create(
-            model="gpt-4.1-mini",
+            model=OPENAI_MODEL,
             messages=[
-                {"role": "system", "content": "You are a SQL expert. Convert natural language to SQL queries."},
+                {"role": "system", "content": SQL_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.1,
             max_tokens=500
         )
         
-        sql = response.choices[0].message.content.strip()
-        
-        # Clean up the SQL (remove markdown if present)
-        if sql.startswith("```sql"):
-            sql = sql[6:]
-        if sql.startswith("```"):
-            sql = sql[3:]
-        if sql.endswith("```"):
-            sql = sql[:-3]
-        
-        return sql.strip()
+        return clean_sql_response(response.choices[0].message.content)
         
     except Exception as e:
         raise Exception(f"Error generating SQL with OpenAI: {str(e)}")
@@ -84,53 +231,14 @@ def generate_sql_with_anthropic(query_text: str, schema_info: Dict[str, Any]) ->
     Generate SQL query using Anthropic API
     """
     try:
-        # Get API key from environment
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
-
-        # Check if Helicone is configured
-        helicone_key = os.environ.get("HELICONE_API_KEY")
-        if helicone_key:
-            # Use Helicone proxy for monitoring
-            client = Anthropic(
-                api_key=api_key,
-                base_url="https://anthropic.helicone.ai",
-                default_headers={
-                    "Helicone-Auth": f"Bearer {helicone_key}",
-                    "Helicone-Property-App": "tac-6",
-                    "Helicone-Property-Environment": "production"
-                }
-            )
-        else:
-            client = Anthropic(api_key=api_key)
-        
-        # Format schema for prompt
-        schema_description = format_schema_for_prompt(schema_info)
+        client = get_anthropic_client()
         
         # Create prompt
-        prompt = f"""Given the following database schema:
-
-{schema_description}
-
-Convert this natural language query to SQL: "{query_text}"
-
-Rules:
-- Return ONLY the SQL query, no explanations
-- Use proper SQLite syntax
-- Handle date/time queries appropriately (e.g., "last week" = date('now', '-7 days'))
-- Be careful with column names and table names
-- If the query is ambiguous, make reasonable assumptions
-- For multi-table queries, use proper JOIN conditions to avoid Cartesian products
-- Limit results to reasonable amounts (e.g., add LIMIT 100 for large result sets)
-- When joining tables, use meaningful relationships between tables
-- NEVER include SQL comments (-- or /* */) in the query
-
-SQL Query:"""
+        prompt = build_sql_prompt(query_text, schema_info)
         
         # Call Anthropic API
         response = client.messages.create(
-            model="claude-3-haiku-20240307",
+            model=ANTHROPIC_MODEL,
             max_tokens=500,
             temperature=0.1,
             messages=[
@@ -138,17 +246,61 @@ SQL Query:"""
             ]
         )
         
-        sql = response.content[0].text.strip()
+        return clean_sql_response(response.content[0].text)
         
-        # Clean up the SQL (remove markdown if present)
-        if sql.startswith("```sql"):
-            sql = sql[6:]
-        if sql.startswith("```"):
-            sql = sql[3:]
-        if sql.endswith("```"):
-            sql = sql[:-3]
+    except Exception as e:
+        raise Exception(f"Error generating SQL with Anthropic: {str(e)}")
+
+async def stream_sql_with_openai(query_text: str, schema_info: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Stream SQL tokens from the OpenAI API as they are generated
+    """
+    try:
+        client = get_async_openai_client()
         
-        return sql.strip()
+        # Create prompt
+        prompt = build_sql_prompt(query_text, schema_info)
+        
+        # Call OpenAI API
+        stream = await client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": SQL_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            max_tokens=500,
+            stream=True
+        )
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        
+    except Exception as e:
+        raise Exception(f"Error generating SQL with OpenAI: {str(e)}")
+
+async def stream_sql_with_anthropic(query_text: str, schema_info: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Stream SQL tokens from the Anthropic API as they are generated
+    """
+    try:
+        client = get_async_anthropic_client()
+        
+        # Create prompt
+        prompt = build_sql_prompt(query_text, schema_info)
+        
+        # Call Anthropic API
+        async with client.messages.stream(
+            model=ANTHROPIC_MODEL,
+            max_tokens=500,
+            temperature=0.1,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
         
     except Exception as e:
         raise Exception(f"Error generating SQL with Anthropic: {str(e)}")
@@ -171,31 +323,28 @@ def format_schema_for_prompt(schema_info: Dict[str, Any]) -> str:
     
     return "\n".join(lines)
 
+def build_prompt_schema(
+    query_text: str,
+    schema_info: Dict[str, Any],
+    schema_index: Optional[SchemaIndex] = None
+) -> Dict[str, Any]:
+    """
+    Keep only the tables and columns relevant to the question when the full
+    schema would exceed the prompt token budget (see core.schema_retrieval)
+    """
+    return select_schema(
+        schema_info,
+        query_text,
+        measure=lambda schema: estimate_tokens(format_schema_for_prompt(schema)),
+        index=schema_index
+    )
+
 def generate_random_query_with_openai(schema_info: Dict[str, Any]) -> str:
     """
     Generate a random natural language query using OpenAI API
     """
     try:
-        # Get API key from environment
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set")
-
-        # Check if Helicone is configured
-        helicone_key = os.environ.get("HELICONE_API_KEY")
-        if helicone_key:
-            # Use Helicone proxy for monitoring
-            client = OpenAI(
-                api_key=api_key,
-                base_url="https://oai.helicone.ai/v1",
-                default_headers={
-                    "Helicone-Auth": f"Bearer {helicone_key}",
-                    "Helicone-Property-App": "tac-6",
-                    "Helicone-Property-Environment": "production"
-                }
-            )
-        else:
-            client = OpenAI(api_key=api_key)
+        client = get_openai_client()
         
         # Format schema for prompt
         schema_description = format_schema_for_prompt(schema_info)
@@ -223,7 +372,7 @@ Natural language query:"""
         
         # Call OpenAI API
         response = client.chat.completions.create(
-            model="gpt-4.1-mini",
+            model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that generates interesting questions about data."},
                 {"role": "user", "content": prompt}
@@ -243,26 +392,7 @@ def generate_random_query_with_anthropic(schema_info: Dict[str, Any]) -> str:
     Generate a random natural language query using Anthropic API
     """
     try:
-        # Get API key from environment
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
-
-        # Check if Helicone is configured
-        helicone_key = os.environ.get("HELICONE_API_KEY")
-        if helicone_key:
-            # Use Helicone proxy for monitoring
-            client = Anthropic(
-                api_key=api_key,
-                base_url="https://anthropic.helicone.ai",
-                default_headers={
-                    "Helicone-Auth": f"Bearer {helicone_key}",
-                    "Helicone-Property-App": "tac-6",
-                    "Helicone-Property-Environment": "production"
-                }
-            )
-        else:
-            client = Anthropic(api_key=api_key)
+        client = get_anthropic_client()
         
         # Format schema for prompt
         schema_description = format_schema_for_prompt(schema_info)
@@ -290,7 +420,7 @@ Natural language query:"""
         
         # Call Anthropic API
         response = client.messages.create(
-            model="claude-3-haiku-20240307",
+            model=ANTHROPIC_MODEL,
             max_tokens=100,
             temperature=0.8,
             messages=[
@@ -320,9 +450,9 @@ def generate_random_query(schema_info: Dict[str, Any]) -> str:
     else:
         raise ValueError("No LLM API key found. Please set either OPENAI_API_KEY or ANTHROPIC_API_KEY")
 
-def generate_sql(request: QueryRequest, schema_info: Dict[str, Any]) -> str:
+def select_sql_provider(request: QueryRequest) -> str:
     """
-    Route to appropriate LLM provider based on API key availability and request preference.
+    Pick the LLM provider for SQL generation.
     Priority: 1) OpenAI API key exists, 2) Anthropic API key exists, 3) request.llm_provider
     """
     openai_key = os.environ.get("OPENAI_API_KEY")
@@ -330,12 +460,149 @@ def generate_sql(request: QueryRequest, schema_info: Dict[str, Any]) -> str:
     
     # Check API key availability first (OpenAI priority)
     if openai_key:
-        return generate_sql_with_openai(request.query, schema_info)
+        return "openai"
     elif anthropic_key:
-        return generate_sql_with_anthropic(request.query, schema_info)
+        return "anthropic"
     
-    # Fall back to request preference if both keys available or neither available
-    if request.llm_provider == "openai":
-        return generate_sql_with_openai(request.query, schema_info)
-    else:
-        return generate_sql_with_anthropic(request.query, schema_info)
\ No newline at end of file
+    # Fall back to request preference if neither key is available
+    return "openai" if request.llm_provider == "openai" else "anthropic"
+
+SQL_PROVIDER_KEYS = {"openai": "OPENAI_API_KEY", "anthropic": "ANTHROPIC_API_KEY"}
+
+def sql_provider_order(request: QueryRequest) -> List[str]:
+    """
+    Providers to try for SQL generation: the selected one, then the other
+    one as a hedge/fallback when both API keys are configured
+    """
+    primary = select_sql_provider(request)
+    secondary = "anthropic" if primary == "openai" else "openai"
+    if os.environ.get(SQL_PROVIDER_KEYS[primary]) and os.environ.get(SQL_PROVIDER_KEYS[secondary]):
+        return [primary, secondary]
+    return [primary]
+
+def is_usable_sql(sql: str) -> bool:
+    """
+    Whether a generated answer is non-empty SQL that passes the safety checks
+    """
+    if not sql or not sql.strip():
+        return False
+    try:
+        validate_sql_query(sql)
+    except Exception:
+        return False
+    return True
+
+def sql_model(provider: str) -> str:
+    """
+    The model a provider generates SQL with
+    """
+    return OPENAI_MODEL if provider == "openai" else ANTHROPIC_MODEL
+
+def _lookup_cached_sql(query_text: str, providers: List[str], schema_hash: str) -> Optional[str]:
+    """
+    Cached SQL for a question from any of ``providers``, in order; answers
+    are cached under the provider that wrote them, which may be a fallback
+    """
+    for name in providers:
+        sql = get_cached_sql(query_text, name, sql_model(name), schema_hash)
+        if sql is not None:
+            return sql
+    return None
+
+def generate_sql(
+    request: QueryRequest,
+    schema_info: Dict[str, Any],
+    schema_index: Optional[SchemaIndex] = None
+) -> str:
+    """
+    Route to appropriate LLM provider based on API key availability and request preference.
+    Priority: 1) OpenAI API key exists, 2) Anthropic API key exists, 3) request.llm_provider
+    
+    Answers are cached per question, provider/model and schema (see core.llm_cache).
+    Large schemas are pruned to the parts relevant to the question first. When
+    both providers are configured, a slow or failing primary is hedged with the
+    other provider (see core.llm_routing).
+    """
+    providers = sql_provider_order(request)
+    schema_hash = schema_fingerprint(format_schema_for_prompt(schema_info))
+    
+    try:
+        cached_sql = _lookup_cached_sql(request.query, providers, schema_hash)
+    except Exception as e:
+        # The cache is an optimisation; never fail a query because of it
+        logger.warning(f"SQL cache lookup failed: {str(e)}")
+        cached_sql = None
+    if cached_sql is not None:
+        return cached_sql
+    
+    prompt_schema = build_prompt_schema(request.query, schema_info, schema_index)
+    
+    def call(name: str):
+        generate = generate_sql_with_openai if name == "openai" else generate_sql_with_anthropic
+        return lambda: generate(request.query, prompt_schema)
+    
+    winner, sql = call_with_hedging([(name, call(name)) for name in providers], is_valid=is_usable_sql)
+    
+    # Cached under the provider that actually wrote the SQL
+    try:
+        store_cached_sql(request.query, winner, sql_model(winner), schema_hash, sql)
+    except Exception as e:
+        logger.warning(f"SQL cache store failed: {str(e)}")
+    return sql
+
+async def stream_sql(
+    request: QueryRequest,
+    schema_info: Dict[str, Any],
+    schema_index: Optional[SchemaIndex] = None
+) -> AsyncIterator[str]:
+    """
+    Async counterpart of generate_sql that yields SQL text as it is generated.
+    
+    Join the pieces and pass them through clean_sql_response to get the final
+    SQL. A cached answer is yielded as a single piece.
+    """
+    providers = sql_provider_order(request)
+    schema_hash = schema_fingerprint(format_schema_for_prompt(schema_info))
+    
+    try:
+        cached_sql = await run_blocking("db", _lookup_cached_sql, request.query, providers, schema_hash)
+    except Exception as e:
+        logger.warning(f"SQL cache lookup failed: {str(e)}")
+        cached_sql = None
+    if cached_sql is not None:
+        yield cached_sql
+        return
+    
+    prompt_schema = build_prompt_schema(request.query, schema_info, schema_index)
+    
+    # Tokens can't be taken back once sent, so streaming doesn't hedge; it
+    # falls back to the other provider only if nothing was streamed yet
+    parts = []
+    for attempt, name in enumerate(providers):
+        stats = get_provider_stats(name)
+        if attempt:
+            stats.count('hedged')
+        stats.count('requests')
+        stream = stream_sql_with_openai if name == "openai" else stream_sql_with_anthropic
+        start = time.perf_counter()
+        try:
+            async for text in stream(request.query, prompt_schema):
+                parts.append(text)
+                yield text
+        except Exception:
+            stats.count('errors')
+            if parts or attempt == len(providers) - 1:
+                raise
+            continue
+        stats.record_latency((time.perf_counter() - start) * 1000)
+        stats.count('wins')
+        break
+    
+    # Only cache answers that can be run; the caller reports the others
+    sql = clean_sql_response("".join(parts))
+    if not is_usable_sql(sql):
+        return
+    try:
+        await run_blocking("db", store_cached_sql, request.query, name, sql_model(name), schema_hash, sql)
+    except Exception as e:
+        logger.warning(f"SQL cache store failed: {str(e)}")
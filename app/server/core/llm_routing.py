@@ -0,0 +1,236 @@
+"""
+Deadlines, fallback and hedging for LLM calls across providers.
+
+When both providers are configured, a request goes to the primary provider
+first. If the primary fails, or is still running after its usual latency
+(a percentile of its recent latencies), the same request is fired at the
+secondary provider and the first valid answer wins. Every provider call has
+its own deadline, so one slow provider can't hold a query indefinitely.
+
+Per-provider latency histograms and counters are exposed through
+get_llm_routing_stats (and /api/metrics).
+
+Settings (environment variables):
+
+- LLM_HEDGE_PERCENTILE        latency percentile after which to hedge (default 95)
+- LLM_HEDGE_MIN_SAMPLES       samples needed before the percentile is trusted (default 20)
+- LLM_HEDGE_AFTER_SECONDS     hedge delay until then, and its lower bound (default 2)
+- LLM_OPENAI_DEADLINE_SECONDS / LLM_ANTHROPIC_DEADLINE_SECONDS
+                              per-provider deadline (default 20)
+"""
+
+import bisect
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from core.executors import get_executor
+
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "2"))
+DEFAULT_DEADLINE_SECONDS = 20.0
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+
+# Recent latencies kept per provider for percentile estimates
+LATENCY_WINDOW = 200
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when a provider misses its deadline."""
+
+    pass
+
+
+class ProviderStats:
+    """
+    Latency histogram and outcome counters for one provider.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._recent: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.wins = 0
+
+    def record_latency(self, latency_ms: float) -> None:
+        with self._lock:
+            self._buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+            self._recent.append(latency_ms)
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency (ms) at percentile p over the recent window, or None if empty"""
+        with self._lock:
+            recent = sorted(self._recent)
+        if not recent:
+            return None
+        rank = max(0, math.ceil(p / 100 * len(recent)) - 1)
+        return recent[rank]
+
+    def sample_count(self) -> int:
+        with self._lock:
+            return len(self._recent)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = list(self._buckets)
+            counters = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'hedged': self.hedged,
+                'wins': self.wins,
+            }
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            **counters,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'latency_histogram': dict(zip(labels, buckets)),
+        }
+
+
+_stats: Dict[str, ProviderStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_provider_stats(provider: str) -> ProviderStats:
+    with _stats_lock:
+        if provider not in _stats:
+            _stats[provider] = ProviderStats()
+        return _stats[provider]
+
+
+def get_llm_routing_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Latency histograms and counters for every provider used so far
+    """
+    with _stats_lock:
+        providers = dict(_stats)
+    return {name: stats.snapshot() for name, stats in providers.items()}
+
+
+def reset_llm_routing_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def provider_deadline(provider: str) -> float:
+    value = os.environ.get(f"LLM_{provider.upper()}_DEADLINE_SECONDS")
+    return float(value) if value else DEFAULT_DEADLINE_SECONDS
+
+
+def hedge_delay(provider: str) -> float:
+    """
+    Seconds to wait on a provider before hedging: its recent latency
+    percentile once there are enough samples, never less than LLM_HEDGE_AFTER_SECONDS
+    """
+    stats = get_provider_stats(provider)
+    if stats.sample_count() < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_AFTER_SECONDS
+    return max(LLM_HEDGE_AFTER_SECONDS, stats.percentile(LLM_HEDGE_PERCENTILE) / 1000)
+
+
+def _timed(provider: str, func: Callable[[], Any]) -> Callable[[], Any]:
+    def call() -> Any:
+        stats = get_provider_stats(provider)
+        stats.count('requests')
+        start = time.perf_counter()
+        try:
+            result = func()
+        except Exception:
+            stats.count('errors')
+            raise
+        stats.record_latency((time.perf_counter() - start) * 1000)
+        return result
+    return call
+
+
+class _Attempt:
+    def __init__(self, provider: str, func: Callable[[], Any]):
+        self.provider = provider
+        self.future: Future = get_executor("llm_calls").submit(_timed(provider, func))
+        self.deadline = time.monotonic() + provider_deadline(provider)
+
+
+def call_with_hedging(
+    providers: List[Tuple[str, Callable[[], Any]]],
+    is_valid: Callable[[Any], bool] = lambda result: bool(result)
+) -> Tuple[str, Any]:
+    """
+    Call the first provider, hedging or falling back to the next one
+
+    Args:
+        providers: (name, zero-argument call) pairs in priority order
+        is_valid: Whether a result is acceptable; invalid results count as failures
+
+    Returns:
+        Tuple of (winning provider name, result). If providers answered but
+        none validly, the first answer is returned so the caller can report it.
+
+    Raises:
+        The first error (or LLMTimeoutError) if no provider answers
+    """
+    pending = list(providers)
+    running: List[_Attempt] = []
+    errors: List[Exception] = []
+    invalid: List[Tuple[str, Any]] = []
+
+    def launch(hedge: bool) -> None:
+        provider, func = pending.pop(0)
+        if hedge:
+            get_provider_stats(provider).count('hedged')
+        running.append(_Attempt(provider, func))
+
+    launch(hedge=False)
+    hedge_at = time.monotonic() + hedge_delay(providers[0][0])
+
+    while running:
+        now = time.monotonic()
+        wake_at = min(attempt.deadline for attempt in running)
+        if pending:
+            wake_at = min(wake_at, hedge_at)
+        done, _ = wait([a.future for a in running], timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+
+        for attempt in [a for a in running if a.future in done]:
+            running.remove(attempt)
+            try:
+                result = attempt.future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            if is_valid(result):
+                get_provider_stats(attempt.provider).count('wins')
+                return attempt.provider, result
+            invalid.append((attempt.provider, result))
+
+        now = time.monotonic()
+        for attempt in [a for a in running if now >= a.deadline]:
+            # The call keeps running in its thread; its result is ignored
+            running.remove(attempt)
+            get_provider_stats(attempt.provider).count('timeouts')
+            errors.append(LLMTimeoutError(
+                f"{attempt.provider} did not respond within {provider_deadline(attempt.provider):g}s"
+            ))
+
+        if pending and (not running or now >= hedge_at):
+            # Fall back after a failure, or hedge a slow request
+            launch(hedge=True)
+
+    if invalid:
+        return invalid[0]
+    raise errors[0]
@@ -0,0 +1,169 @@
+"""
+Deadlines and cancellation for user queries.
+
+LLM-generated SQL can be arbitrarily expensive (a Cartesian join can run for
+minutes), so every user query runs under a QueryControl. The control installs
+a SQLite progress handler on the connection while the statement runs; SQLite
+calls it every few thousand virtual machine instructions, and the statement
+is interrupted as soon as the deadline passes or the query is cancelled.
+
+Queries are registered by request ID so they can be cancelled from another
+request (POST /api/query/{request_id}/cancel), and a query is cancelled
+automatically when the request that started it finishes or its client goes
+away, so abandoned queries stop using CPU.
+
+Settings (environment variables):
+
+- QUERY_TIMEOUT_SECONDS         deadline for /api/query pages, 0 disables (default 30)
+- EXPORT_QUERY_TIMEOUT_SECONDS  deadline for streamed query results and exports (default 600)
+- QUERY_MAX_ROWS                maximum rows a paged query can return in total (default 100000)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+QUERY_TIMEOUT_SECONDS = float(os.environ.get("QUERY_TIMEOUT_SECONDS", "30"))
+EXPORT_QUERY_TIMEOUT_SECONDS = float(os.environ.get("EXPORT_QUERY_TIMEOUT_SECONDS", "600"))
+QUERY_MAX_ROWS = int(os.environ.get("QUERY_MAX_ROWS", "100000"))
+
+# SQLite virtual machine instructions between progress handler calls
+PROGRESS_HANDLER_INSTRUCTIONS = 1000
+
+
+class QueryInterruptedError(Exception):
+    """Raised when a query is stopped before it finished."""
+
+    pass
+
+
+class QueryTimeoutError(QueryInterruptedError):
+    """Raised when a query runs past its deadline."""
+
+    pass
+
+
+class QueryCancelledError(QueryInterruptedError):
+    """Raised when a query is cancelled."""
+
+    pass
+
+
+class QueryControl:
+    """
+    Deadline and cancellation flag for one query.
+    """
+
+    def __init__(self, request_id: Optional[str] = None, timeout: Optional[float] = QUERY_TIMEOUT_SECONDS):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.timeout = timeout
+        self._cancelled = threading.Event()
+        self._deadline: Optional[float] = None
+        self._stopped: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Stop the query at its next progress check (or before it starts)"""
+        self._cancelled.set()
+
+    def _progress(self) -> int:
+        # Any non-zero return value makes SQLite interrupt the statement
+        if self._cancelled.is_set():
+            self._stopped = 'cancelled'
+            return 1
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self._stopped = 'timeout'
+            return 1
+        return 0
+
+    @contextmanager
+    def attached(self, conn: sqlite3.Connection) -> Iterator["QueryControl"]:
+        """
+        Enforce this control on a connection for the duration of the block.
+
+        The deadline starts when the block is entered.
+        """
+        if self.cancelled:
+            raise QueryCancelledError("Query was cancelled")
+        if self.timeout:
+            self._deadline = time.monotonic() + self.timeout
+        conn.set_progress_handler(self._progress, PROGRESS_HANDLER_INSTRUCTIONS)
+        try:
+            yield self
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def translate(self, error: Exception) -> Exception:
+        """
+        The error to report for an exception raised while this control was
+        attached: the interruption if the control stopped the statement,
+        otherwise the exception itself
+        """
+        if not isinstance(error, sqlite3.OperationalError) or self._stopped is None:
+            return error
+        if self._stopped == 'timeout':
+            return QueryTimeoutError(f"Query timed out after {self.timeout:g}s")
+        return QueryCancelledError("Query was cancelled")
+
+
+_active: Dict[str, QueryControl] = {}
+_active_lock = threading.Lock()
+
+
+def start_query(request_id: Optional[str] = None, timeout: Optional[float] = QUERY_TIMEOUT_SECONDS) -> QueryControl:
+    """
+    Create a control and register it so the query can be cancelled by ID
+    """
+    control = QueryControl(request_id, timeout)
+    with _active_lock:
+        _active[control.request_id] = control
+    return control
+
+
+def finish_query(control: QueryControl) -> None:
+    """
+    Unregister a query, stopping its statement if it is still running
+    """
+    control.cancel()
+    with _active_lock:
+        if _active.get(control.request_id) is control:
+            del _active[control.request_id]
+
+
+@contextmanager
+def track_query(request_id: Optional[str] = None, timeout: Optional[float] = QUERY_TIMEOUT_SECONDS) -> Iterator[QueryControl]:
+    """
+    Register a query for the duration of the block (see start_query)
+    """
+    control = start_query(request_id, timeout)
+    try:
+        yield control
+    finally:
+        finish_query(control)
+
+
+def cancel_query(request_id: str) -> bool:
+    """
+    Cancel a running query by request ID
+
+    Returns:
+        True if a query with this ID was running
+    """
+    with _active_lock:
+        control = _active.get(request_id)
+    if control is None:
+        return False
+    control.cancel()
+    return True
+
+
+def active_query_count() -> int:
+    with _active_lock:
+        return len(_active)
@@ -0,0 +1,213 @@
+"""
+Relevance ranking of tables and columns for schema prompts.
+
+Sending every table and column to the LLM is fine for a handful of tables but
+makes prompts huge for large databases. SchemaIndex is a small BM25 index over
+table names, column names and sample values; select_schema uses it to keep
+only the tables (and, if needed, columns) most relevant to a question within
+a token budget. Schemas that already fit the budget are left untouched.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Approximate token budget for the schema section of a prompt
+SCHEMA_PROMPT_TOKEN_BUDGET = int(os.environ.get("SCHEMA_PROMPT_TOKEN_BUDGET", "3000"))
+# Maximum number of tables included in a prompt
+SCHEMA_PROMPT_MAX_TABLES = int(os.environ.get("SCHEMA_PROMPT_MAX_TABLES", "15"))
+
+# Field weights, applied by repeating tokens in a table's document
+TABLE_NAME_WEIGHT = 3
+COLUMN_NAME_WEIGHT = 2
+SAMPLE_VALUE_WEIGHT = 1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+_STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'do', 'for', 'from', 'give',
+    'has', 'have', 'how', 'i', 'in', 'is', 'it', 'list', 'many', 'me', 'much',
+    'of', 'on', 'or', 'show', 'that', 'the', 'their', 'there', 'to', 'was',
+    'we', 'were', 'what', 'when', 'where', 'which', 'who', 'with', 'all',
+}
+
+
+def _stem(token: str) -> str:
+    # Just enough to match "orders" to "order" and "categories" to "category"
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text or identifiers (snake_case, camelCase) into normalised terms
+    """
+    tokens = []
+    for word in _WORD_RE.findall(str(text)):
+        word = word.lower()
+        if word not in _STOPWORDS:
+            tokens.append(_stem(word))
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token)"""
+    return (len(text) + 3) // 4
+
+
+class SchemaIndex:
+    """
+    BM25 index with one document per table
+    """
+
+    def __init__(self, schema_info: Dict[str, Any], sample_values: Optional[Dict[str, Dict[str, List[Any]]]] = None):
+        sample_values = sample_values or {}
+        self.table_names: List[str] = list(schema_info.get('tables', {}))
+        self._documents: Dict[str, Counter] = {}
+        self._column_terms: Dict[str, Dict[str, set]] = {}
+
+        for table_name, table_info in schema_info.get('tables', {}).items():
+            table_samples = sample_values.get(table_name, {})
+            document = Counter()
+            document.update(tokenize(table_name) * TABLE_NAME_WEIGHT)
+
+            column_terms = {}
+            for column_name in table_info.get('columns', {}):
+                name_terms = tokenize(column_name)
+                value_terms = [
+                    term
+                    for value in table_samples.get(column_name, [])
+                    for term in tokenize(value)
+                ]
+                document.update(name_terms * COLUMN_NAME_WEIGHT)
+                document.update(value_terms * SAMPLE_VALUE_WEIGHT)
+                column_terms[column_name] = set(name_terms) | set(value_terms)
+
+            self._documents[table_name] = document
+            self._column_terms[table_name] = column_terms
+
+        self._lengths = {name: sum(doc.values()) for name, doc in self._documents.items()}
+        count = len(self._documents)
+        self._average_length = (sum(self._lengths.values()) / count) if count else 0.0
+
+        document_frequency = Counter()
+        for document in self._documents.values():
+            document_frequency.update(document.keys())
+        self._idf = {
+            term: math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def rank_tables(self, query_text: str) -> List[Tuple[str, float]]:
+        """
+        Score every table against a question, best first (ties keep schema order)
+        """
+        terms = Counter(tokenize(query_text))
+        scores = []
+        for position, table_name in enumerate(self.table_names):
+            document = self._documents[table_name]
+            length_norm = 1 - BM25_B + BM25_B * (
+                self._lengths[table_name] / self._average_length if self._average_length else 0
+            )
+            score = 0.0
+            for term, query_count in terms.items():
+                frequency = document.get(term, 0)
+                if frequency:
+                    score += query_count * self._idf[term] * (
+                        frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+                    )
+            scores.append((table_name, score, position))
+
+        scores.sort(key=lambda item: (-item[1], item[2]))
+        return [(table_name, score) for table_name, score, _ in scores]
+
+    def rank_columns(self, table_name: str, query_text: str) -> List[Tuple[str, float]]:
+        """
+        Score a table's columns by the IDF of the question terms they match
+        """
+        terms = set(tokenize(query_text))
+        columns = self._column_terms.get(table_name, {})
+        scores = [
+            (column_name, sum(self._idf.get(term, 0.0) for term in terms & column_terms), position)
+            for position, (column_name, column_terms) in enumerate(columns.items())
+        ]
+        scores.sort(key=lambda item: (-item[1], item[2]))
+        return [(column_name, score) for column_name, score, _ in scores]
+
+
+def _with_columns(table_info: Dict[str, Any], column_names: Iterable[str]) -> Dict[str, Any]:
+    keep = set(column_names)
+    pruned = dict(table_info)
+    pruned['columns'] = {name: col_type for name, col_type in table_info['columns'].items() if name in keep}
+    return pruned
+
+
+def select_schema(
+    schema_info: Dict[str, Any],
+    query_text: str,
+    measure: Callable[[Dict[str, Any]], int],
+    index: Optional[SchemaIndex] = None,
+    token_budget: Optional[int] = None,
+    max_tables: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Reduce a schema to the parts most relevant to a question
+
+    Args:
+        schema_info: Schema as returned by get_database_schema
+        query_text: The natural language question
+        measure: Returns the prompt token cost of a schema dict
+        index: Prebuilt index for this schema (built on the fly if omitted)
+        token_budget: Maximum schema tokens (default SCHEMA_PROMPT_TOKEN_BUDGET)
+        max_tables: Maximum number of tables (default SCHEMA_PROMPT_MAX_TABLES)
+
+    Returns:
+        A schema dict of the same shape, holding the best-ranked tables first.
+        The schema itself is returned if it already fits.
+    """
+    token_budget = SCHEMA_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    max_tables = SCHEMA_PROMPT_MAX_TABLES if max_tables is None else max_tables
+    tables = schema_info.get('tables', {})
+
+    if len(tables) <= max_tables and measure(schema_info) <= token_budget:
+        return schema_info
+
+    index = index or SchemaIndex(schema_info)
+    selected: Dict[str, Any] = {}
+    remaining = token_budget
+
+    for table_name, score in index.rank_tables(query_text):
+        if len(selected) >= max_tables or table_name not in tables:
+            continue
+        table_info = tables[table_name]
+        cost = measure({'tables': {table_name: table_info}})
+
+        if cost > remaining:
+            if score <= 0:
+                continue
+            # A relevant but wide table: keep its best-matching columns
+            kept: List[str] = []
+            for column_name, _ in index.rank_columns(table_name, query_text):
+                candidate = _with_columns(table_info, kept + [column_name])
+                if measure({'tables': {table_name: candidate}}) > remaining:
+                    break
+                kept.append(column_name)
+            if not kept:
+                continue
+            table_info = _with_columns(table_info, kept)
+            cost = measure({'tables': {table_name: table_info}})
+
+        selected[table_name] = table_info
+        remaining -= cost
+
+    pruned = dict(schema_info)
+    pruned['tables'] = selected
+    return pruned
@@ -0,0 +1,181 @@
+"""
+Mergeable summaries for single-pass column statistics.
+
+- HyperLogLog estimates the number of distinct values in a few KB, with a
+  relative standard error of 1.04 / sqrt(2 ** precision).
+- SpaceSaving keeps the most frequent values in a fixed number of counters;
+  every reported count comes with the maximum amount it can be overestimated.
+
+Both are fed whole batches of values at a time (pandas Series) so the work
+per row stays in vectorised pandas/numpy code; only the few hundred counters
+of a Space-Saving summary are handled in Python. Both merge, so batches or
+partial results can be combined.
+
+Values are hashed with pandas' stable hashing, so sketches of the same data
+match across processes.
+"""
+
+import heapq
+import math
+from collections import Counter
+from operator import itemgetter
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_HLL_PRECISION = 12
+DEFAULT_SPACE_SAVING_CAPACITY = 256
+
+# z-score for the ~95% bounds reported by the estimators
+BOUNDS_Z = 1.96
+
+
+def hash_values(values: Union[pd.Series, pd.Index]) -> np.ndarray:
+    """Stable 64-bit hashes of non-null values"""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch with 2 ** precision one-byte registers.
+    """
+
+    def __init__(self, precision: int = DEFAULT_HLL_PRECISION):
+        # Ranks are computed in float64, which is exact for up to 52 bits
+        if not 12 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 12 and 18")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        if len(hashes) == 0:
+            return
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.intp)
+        rest = (hashes & np.uint64((1 << width) - 1)).astype(np.float64)
+        # frexp's exponent is the bit length, so this is the position of the
+        # leading one bit (width + 1 when rest is zero)
+        _, bit_length = np.frexp(rest)
+        rank = (width + 1 - bit_length).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values: Union[pd.Series, pd.Index]) -> None:
+        self.add_hashes(hash_values(values))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return raw
+
+    def bounds(self) -> Tuple[float, float]:
+        """~95% confidence interval of the distinct count"""
+        estimate = self.estimate()
+        margin = BOUNDS_Z * self.relative_error * estimate
+        return max(0.0, estimate - margin), estimate + margin
+
+
+class SpaceSaving:
+    """
+    Top-k frequent values summary.
+
+    Holds at most ``capacity`` counters. A counter's count never
+    underestimates its value's true count, and overestimates it by at most
+    its error; a value without a counter occurred at most ``floor`` times.
+    While ``floor`` is 0 every value seen has a counter and all counts are
+    exact.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_SPACE_SAVING_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+        self.errors: Dict[Any, int] = {}
+        self.floor = 0
+        self.total = 0
+
+    @property
+    def exact(self) -> bool:
+        return self.floor == 0
+
+    def _combine(self, counts: Dict[Any, int], errors: Dict[Any, int], floor: int, total: int) -> None:
+        """
+        Merge another summary's counters into this one (Space-Saving merge)
+
+        A value missing from one side may still have occurred there up to
+        that side's floor times, so it is credited (and charged as error)
+        that much. Only the ``capacity`` largest counters are kept.
+        """
+        merged = {}
+        merged_errors = {}
+        for value, count in self.counts.items():
+            other = counts.get(value)
+            if other is None:
+                merged[value] = count + floor
+                merged_errors[value] = self.errors[value] + floor
+            else:
+                merged[value] = count + other
+                merged_errors[value] = self.errors[value] + errors.get(value, 0)
+        for value, count in counts.items():
+            if value not in merged:
+                merged[value] = count + self.floor
+                merged_errors[value] = errors.get(value, 0) + self.floor
+
+        self.floor += floor
+        if len(merged) > self.capacity:
+            kept = heapq.nlargest(self.capacity + 1, merged.items(), key=itemgetter(1))
+            # Dropped values occurred at most as often as the largest of them
+            self.floor = max(self.floor, kept.pop()[1])
+            merged = dict(kept)
+            merged_errors = {value: merged_errors[value] for value in merged}
+        self.counts = merged
+        self.errors = merged_errors
+        self.total += total
+
+    def add(self, values: pd.Series) -> None:
+        """Count a batch of non-null values"""
+        self.add_counts(values.value_counts(sort=False))
+
+    def add_counts(self, counts: pd.Series) -> None:
+        """Count a batch given as per-value counts (Series.value_counts())"""
+        total = int(counts.sum())
+        floor = 0
+        if len(counts) > self.capacity:
+            # Only the batch's most frequent values can displace a counter;
+            # the rest are folded into the floor like a merged summary's
+            counts = counts.nlargest(self.capacity + 1)
+            floor = int(counts.iloc[-1])
+            counts = counts[counts > floor]
+        self._combine(dict(zip(counts.index.tolist(), counts.tolist())), {}, floor, total)
+
+    def merge(self, other: "SpaceSaving") -> None:
+        self._combine(other.counts, other.errors, other.floor, other.total)
+
+    def frequency_profile(self) -> Dict[int, int]:
+        """
+        Number of values seen exactly k times, for each k (only meaningful
+        while the summary is exact)
+        """
+        return dict(Counter(self.counts.values()))
+
+    def top(self, n: int) -> List[Tuple[Any, int, int]]:
+        """
+        The n most frequent values as (value, count, max overestimate)
+        """
+        return [
+            (value, count, self.errors[value])
+            for value, count in heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+        ]
@@ -1,47 +1,165 @@
+import base64
+import copy
+import hashlib
+import hmac
+import json
+import os
+import secrets
 import sqlite3
-from typing import Dict, Any
+import threading
+import time
+from contextlib import ExitStack
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+from .db import get_connection_manager
+from .insights_cache import table_content_version
+from .query_control import QueryControl, EXPORT_QUERY_TIMEOUT_SECONDS, QUERY_MAX_ROWS
+from .schema_retrieval import SchemaIndex
 from .sql_security import (
+    escape_identifier,
     execute_query_safely, 
     validate_sql_query, 
+    is_read_only_violation,
     SQLSecurityError
 )
 
-def execute_sql_safely(sql_query: str) -> Dict[str, Any]:
+# Schema cache for get_database_schema. The cached schema is reused until
+# PRAGMA schema_version changes (any CREATE/DROP/ALTER). Row counts are
+# remembered per table along with the table's identity (its root page and
+# CREATE statement), so DDL on other tables doesn't force a recount; only a
+# replaced or altered table is counted again. Appends and upserts add to the
+# count they find (see record_table_rows_added).
+_schema_cache_lock = threading.Lock()
+_schema_cache: Dict[str, Any] = {'db_path': None, 'schema_version': None, 'schema': None}
+_row_counts: Dict[str, Tuple[int, str, float]] = {}  # table_name: (row_count, table identity, counted at)
+
+# Content version (see insights_cache.table_content_version) of each table
+# when it was last analyzed; sqlite_stat1 row counts are only used while
+# the table still has that version
+_analyzed_versions: Dict[str, str] = {}
+
+# Relevance index used to prune schema prompts, rebuilt on the same schema
+# version changes as the schema cache
+_schema_index_cache: Dict[str, Any] = {'db_path': None, 'schema_version': None, 'index': None}
+
+# Distinct values sampled per text column for the relevance index
+SCHEMA_INDEX_SAMPLE_VALUES = 3
+
+# Default and maximum number of rows returned per /api/query page
+QUERY_PAGE_SIZE = int(os.environ.get("QUERY_PAGE_SIZE", "1000"))
+MAX_QUERY_PAGE_SIZE = int(os.environ.get("MAX_QUERY_PAGE_SIZE", "10000"))
+
+# Rows fetched from the cursor at a time when streaming results
+STREAM_BATCH_ROWS = 500
+
+# Key for signing page tokens, so a client can't swap in arbitrary SQL
+_PAGE_TOKEN_KEY = (
+    os.environ["QUERY_PAGE_TOKEN_SECRET"].encode()
+    if os.environ.get("QUERY_PAGE_TOKEN_SECRET")
+    else secrets.token_bytes(32)
+)
+
+def encode_page_token(sql_query: str, offset: int) -> str:
     """
-    Execute SQL query with safety checks
+    Build an opaque, signed continuation token for the next page of a query
+    """
+    payload = json.dumps({'sql': sql_query, 'offset': offset}, separators=(',', ':')).encode('utf-8')
+    signature = hmac.new(_PAGE_TOKEN_KEY, payload, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(signature + payload).decode('ascii')
+
+def decode_page_token(page_token: str) -> Tuple[str, int]:
+    """
+    Verify a continuation token and return its (sql, offset)
+    
+    Raises:
+        SQLSecurityError: If the token is malformed or was not issued by this server
+    """
+    try:
+        raw = base64.urlsafe_b64decode(page_token.encode('ascii'))
+        signature, payload = raw[:16], raw[16:]
+        expected = hmac.new(_PAGE_TOKEN_KEY, payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            raise ValueError("bad signature")
+        data = json.loads(payload)
+        return data['sql'], int(data['offset'])
+    except Exception:
+        raise SQLSecurityError("Invalid or expired page token")
+
+def _execute_read_only(cursor: sqlite3.Cursor, sql_query: str, control: Optional[QueryControl] = None) -> None:
+    """
+    Execute a user query on a read-only connection, reporting denied
+    writes as security errors and interruptions as timeouts/cancellations
     """
     try:
-        # Validate the SQL query for dangerous operations
-        validate_sql_query(sql_query)
-        
-        # Connect to database
-        conn = sqlite3.connect("db/database.db")
-        conn.row_factory = sqlite3.Row  # Enable column access by name
-        
-        # Execute query safely
-        # Note: Since this is a user-provided complete SQL query,
-        # we can't use parameterization. The validate_sql_query
-        # function provides protection against dangerous operations.
-        cursor = conn.cursor()
         cursor.execute(sql_query)
+    except sqlite3.DatabaseError as e:
+        if is_read_only_violation(e):
+            raise SQLSecurityError(f"Query is not allowed on a read-only connection: {str(e)}")
+        if control is not None:
+            raise control.translate(e)
+        raise
+
+def _open_query_cursor(stack: ExitStack, sql_query: str, control: QueryControl) -> sqlite3.Cursor:
+    """
+    Validate a query and execute it on a pooled reader owned by ``stack``,
+    under ``control`` until the stack is closed
+    """
+    # Validate the SQL query for dangerous operations
+    validate_sql_query(sql_query)
+    
+    conn = stack.enter_context(get_connection_manager().reader())
+    stack.enter_context(control.attached(conn))
+    cursor = conn.cursor()
+    stack.callback(cursor.close)
+    _execute_read_only(cursor, sql_query, control)
+    return cursor
+
+def _cursor_columns(cursor: sqlite3.Cursor) -> List[str]:
+    return [col[0] for col in cursor.description or []]
+
+def execute_sql_page(
+    sql_query: str,
+    page_size: int = QUERY_PAGE_SIZE,
+    offset: int = 0,
+    control: Optional[QueryControl] = None
+) -> Dict[str, Any]:
+    """
+    Execute a query and return a single page of its results.
+    
+    Rows before ``offset`` are skipped on the cursor and only ``page_size``
+    rows (plus one look-ahead row to detect more pages) are materialised;
+    skipping still costs a step per row, so deep pages are slower.
+    No page extends past QUERY_MAX_ROWS rows in total; the page that reaches
+    the cap is marked truncated if the query had more rows.
+    
+    Returns:
+        Dict with results, columns, has_more, truncated and error
+    """
+    control = control or QueryControl()
+    page_size = max(0, min(page_size, QUERY_MAX_ROWS - offset))
+    reaches_cap = offset + page_size >= QUERY_MAX_ROWS
+    try:
+        with ExitStack() as stack:
+            cursor = _open_query_cursor(stack, sql_query, control)
+            columns = _cursor_columns(cursor)
+            
+            # Skip rows from earlier pages without holding them in memory
+            while offset > 0:
+                skipped = cursor.fetchmany(min(offset, STREAM_BATCH_ROWS))
+                if not skipped:
+                    break
+                offset -= len(skipped)
+            
+            rows = cursor.fetchmany(page_size + 1)
         
-        # Get results
-        rows = cursor.fetchall()
-        
-        # Convert rows to dictionaries
-        results = []
-        columns = []
-        
-        if rows:
-            columns = list(rows[0].keys())
-            for row in rows:
-                results.append(dict(row))
-        
-        conn.close()
+        more_rows = len(rows) > page_size
+        truncated = more_rows and reaches_cap
+        results = [dict(zip(columns, row)) for row in rows[:page_size]]
         
         return {
             'results': results,
             'columns': columns,
+            'has_more': more_rows and not truncated,
+            'truncated': truncated,
             'error': None
         }
     
@@ -49,69 +167,439 @@ def execute_sql_safely(sql_query: str) -> Dict[str, Any]:
         return {
             'results': [],
             'columns': [],
+            'has_more': False,
+            'truncated': False,
             'error': f"Security error: {str(e)}"
         }
     except Exception as e:
         return {
             'results': [],
             'columns': [],
-            'error': str(e)
+            'has_more': False,
+            'truncated': False,
+            'error': str(control.translate(e))
         }
 
-def get_database_schema() -> Dict[str, Any]:
+def stream_sql_rows(
+    sql_query: str,
+    batch_size: int = STREAM_BATCH_ROWS,
+    control: Optional[QueryControl] = None
+) -> Tuple[List[str], Iterator[List[tuple]]]:
     """
-    Get complete database schema information
+    Execute a query and return its columns plus a lazy iterator of row batches.
+    
+    The query is validated and executed before returning, so errors surface
+    before any response has been started. The pooled connection is held until
+    the iterator is exhausted or closed, and ``control`` (by default an
+    EXPORT_QUERY_TIMEOUT_SECONDS deadline) applies until then.
+    
+    Returns:
+        Tuple of (column names, iterator of row-tuple batches)
     """
+    control = control or QueryControl(timeout=EXPORT_QUERY_TIMEOUT_SECONDS)
+    stack = ExitStack()
     try:
-        conn = sqlite3.connect("db/database.db")
+        cursor = _open_query_cursor(stack, sql_query, control)
+    except Exception:
+        stack.close()
+        raise
+    
+    return _cursor_columns(cursor), _CursorBatches(stack, cursor, batch_size, control)
+
+def stream_table_rows(table_name: str, batch_size: int = STREAM_BATCH_ROWS) -> Tuple[List[str], Iterator[List[tuple]]]:
+    """
+    Read every row of a table as a lazy iterator of row batches.
+    
+    Returns:
+        Tuple of (column names, iterator of row-tuple batches)
+    """
+    stack = ExitStack()
+    try:
+        conn = stack.enter_context(get_connection_manager().reader())
+        cursor = execute_query_safely(
+            conn,
+            "SELECT * FROM {table}",
+            identifier_params={'table': table_name}
+        )
+        stack.callback(cursor.close)
+    except Exception:
+        stack.close()
+        raise
+    
+    return _cursor_columns(cursor), _CursorBatches(stack, cursor, batch_size)
+
+# SQLite storage classes, as reported by typeof() (besides 'null')
+STORAGE_CLASSES = ('integer', 'real', 'text', 'blob')
+
+def scan_storage_classes(
+    sql_query: str,
+    column_count: int,
+    control: Optional[QueryControl] = None
+) -> List[Set[str]]:
+    """
+    Find which storage classes each result column of a query holds.
+    
+    SQLite types values rather than columns, so one column can mix integers,
+    reals and text. Columnar exports have to fix each column's type before
+    the first row is written, so this runs the query once more, inside
+    SQLite, to find a type every row fits; it costs about as much again as
+    the query itself.
+    
+    Returns:
+        For each column, the subset of STORAGE_CLASSES its values have
+        (NULLs aside)
+    """
+    if column_count == 0:
+        return []
+    control = control or QueryControl(timeout=EXPORT_QUERY_TIMEOUT_SECONDS)
+    validate_sql_query(sql_query)
+    
+    # The CTE column list names result columns by position, so duplicate or
+    # expression column names don't matter
+    names = [f"c{i}" for i in range(column_count)]
+    checks = [
+        f"max(typeof({name}) = '{storage_class}')"
+        for name in names
+        for storage_class in STORAGE_CLASSES
+    ]
+    scan_sql = (
+        f"WITH export_source({', '.join(names)}) AS (\n"
+        f"{sql_query.strip().rstrip('; ')}\n"
+        f") SELECT {', '.join(checks)} FROM export_source"
+    )
+    
+    with get_connection_manager().reader() as conn, control.attached(conn):
         cursor = conn.cursor()
+        try:
+            _execute_read_only(cursor, scan_sql, control)
+            flags = cursor.fetchone()
+        finally:
+            cursor.close()
+    
+    classes_per_column = len(STORAGE_CLASSES)
+    return [
+        {
+            storage_class
+            for storage_class, flag in zip(STORAGE_CLASSES, flags[i:i + classes_per_column])
+            if flag
+        }
+        for i in range(0, len(flags), classes_per_column)
+    ]
+
+def scan_table_storage_classes(table_name: str, column_count: int) -> List[Set[str]]:
+    """Find which storage classes each column of a table holds (see scan_storage_classes)"""
+    return scan_storage_classes(f"SELECT * FROM {escape_identifier(table_name)}", column_count)
+
+class _CursorBatches:
+    """
+    Iterator over fetchmany batches that releases its connection when done.
+    
+    Unlike a generator, close() releases the connection even if iteration
+    never started (e.g. the client disconnected before the first chunk).
+    """
+    
+    def __init__(
+        self,
+        stack: ExitStack,
+        cursor: sqlite3.Cursor,
+        batch_size: int,
+        control: Optional[QueryControl] = None
+    ):
+        self._stack = stack
+        self._cursor = cursor
+        self._batch_size = batch_size
+        self._control = control
+        self._closed = False
+    
+    def __iter__(self) -> "_CursorBatches":
+        return self
+    
+    def __next__(self) -> List[tuple]:
+        if self._closed:
+            raise StopIteration
+        try:
+            rows = self._cursor.fetchmany(self._batch_size)
+        except Exception as e:
+            self.close()
+            if self._control is not None:
+                raise self._control.translate(e)
+            raise
+        if not rows:
+            self.close()
+            raise StopIteration
+        return rows
+    
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stack.close()
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+def _table_identity(rootpage: int, create_sql: Optional[str]) -> str:
+    digest = hashlib.sha256((create_sql or "").encode("utf-8")).hexdigest()[:16]
+    return f"{rootpage}:{digest}"
+
+def _lookup_table_identity(conn: sqlite3.Connection, table_name: str) -> Optional[str]:
+    row = conn.execute(
+        "SELECT rootpage, sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table_name,)
+    ).fetchone()
+    return _table_identity(*row) if row else None
+
+def invalidate_schema_cache(table_name: Optional[str] = None) -> None:
+    """
+    Drop the cached schema, and the cached row count of one table (or all tables)
+    """
+    with _schema_cache_lock:
+        _schema_cache['schema'] = None
+        _schema_index_cache['index'] = None
+        if table_name is None:
+            _row_counts.clear()
+            _analyzed_versions.clear()
+        else:
+            _row_counts.pop(table_name, None)
+            _analyzed_versions.pop(table_name, None)
+
+def _use_database(db_path: str) -> None:
+    """
+    Drop cached row counts that belong to another database (call with
+    _schema_cache_lock held)
+    """
+    if _schema_cache['db_path'] != db_path:
+        _row_counts.clear()
+        _schema_cache.update(db_path=db_path, schema_version=None, schema=None)
+
+def record_table_row_count(table_name: str, row_count: int) -> None:
+    """
+    Remember a table's row count after writing it, so it is never recounted
+    """
+    manager = get_connection_manager()
+    with manager.reader() as conn:
+        version = _schema_version(conn)
+        identity = _lookup_table_identity(conn, table_name)
+    if identity is None:
+        return
+    
+    with _schema_cache_lock:
+        _use_database(manager.db_path)
+        _store_row_count(table_name, row_count, identity, time.time(), version)
+
+def record_table_rows_added(table_name: str, rows_added: int, since: float) -> int:
+    """
+    Add the rows an append or upsert started at ``since`` (a time.time())
+    added to a table to its cached row count, and return the new count.
+    
+    The table is counted instead if its count isn't cached, or was taken
+    after ``since`` and so may already include some of the rows.
+    """
+    manager = get_connection_manager()
+    with manager.reader() as conn:
+        version = _schema_version(conn)
+        identity = _lookup_table_identity(conn, table_name)
+        if identity is None:
+            raise ValueError(f"Table '{table_name}' not found")
+        
+        with _schema_cache_lock:
+            _use_database(manager.db_path)
+            cached = _row_counts.get(table_name)
+            if cached and cached[1] == identity and cached[2] <= since:
+                row_count = cached[0] + rows_added
+                _store_row_count(table_name, row_count, identity, cached[2], version)
+                return row_count
+        
+        row_count = execute_query_safely(
+            conn,
+            "SELECT COUNT(*) FROM {table}",
+            identifier_params={'table': table_name}
+        ).fetchone()[0]
+    
+    with _schema_cache_lock:
+        _store_row_count(table_name, row_count, identity, time.time(), version)
+    return row_count
+
+def _store_row_count(table_name: str, row_count: int, identity: str, counted_at: float, version: int) -> None:
+    """
+    Cache a table's row count and patch it into the cached schema (call with
+    _schema_cache_lock held)
+    """
+    _row_counts[table_name] = (row_count, identity, counted_at)
+    cached = _schema_cache['schema']
+    if cached and _schema_cache['schema_version'] == version and table_name in cached['tables']:
+        cached['tables'][table_name]['row_count'] = row_count
+    else:
+        _schema_cache['schema'] = None
+
+def record_table_analyzed(conn: sqlite3.Connection, table_name: str) -> None:
+    """
+    Note that ANALYZE has just been run on a table over ``conn``, so its
+    sqlite_stat1 row count can be used until the table is written again
+    """
+    content_version = table_content_version(conn, table_name)
+    with _schema_cache_lock:
+        if content_version is None:
+            _analyzed_versions.pop(table_name, None)
+        else:
+            _analyzed_versions[table_name] = content_version
+
+def get_database_schema() -> Dict[str, Any]:
+    """
+    Get complete database schema information (served from cache while unchanged)
+    """
+    try:
+        manager = get_connection_manager()
+        with manager.reader() as conn:
+            version = _schema_version(conn)
+            
+            with _schema_cache_lock:
+                if (_schema_cache['schema'] is not None
+                        and _schema_cache['db_path'] == manager.db_path
+                        and _schema_cache['schema_version'] == version):
+                    return copy.deepcopy(_schema_cache['schema'])
+                _use_database(manager.db_path)
+            
+            schema = _read_database_schema(conn)
+        
+        with _schema_cache_lock:
+            _schema_cache.update(db_path=manager.db_path, schema_version=version, schema=schema)
+        return copy.deepcopy(schema)
         
-        # Get all tables safely
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
+    except Exception as e:
+        return {'tables': {}, 'error': str(e)}
+
+def _estimate_row_count(conn: sqlite3.Connection, table_name: str) -> Optional[int]:
+    """
+    Row count recorded by the last ANALYZE, if the table hasn't been written since
+    """
+    with _schema_cache_lock:
+        analyzed_version = _analyzed_versions.get(table_name)
+    if analyzed_version is None or analyzed_version != table_content_version(conn, table_name):
+        return None
+    
+    try:
+        row = conn.execute(
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1",
+            (table_name,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # No sqlite_stat1 table until ANALYZE has been run
+        return None
+    if not row or not row[0]:
+        return None
+    return int(str(row[0]).split()[0])
+
+def _table_row_count(conn: sqlite3.Connection, table_name: str, identity: str) -> int:
+    """
+    Row count from the incremental cache, sqlite_stat1, or (last resort) COUNT(*)
+    """
+    with _schema_cache_lock:
+        cached = _row_counts.get(table_name)
+    if cached and cached[1] == identity:
+        return cached[0]
+    
+    row_count = _estimate_row_count(conn, table_name)
+    if row_count is None:
+        # Get row count safely
+        cursor_count = execute_query_safely(
+            conn,
+            "SELECT COUNT(*) FROM {table}",
+            identifier_params={'table': table_name}
+        )
+        row_count = cursor_count.fetchone()[0]
+    
+    with _schema_cache_lock:
+        _row_counts[table_name] = (row_count, identity, time.time())
+    return row_count
+
+def _read_database_schema(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """
+    Read table columns and row counts over an open connection
+    """
+    cursor = conn.cursor()
+    
+    # Get all tables safely
+    cursor.execute("SELECT name, rootpage, sql FROM sqlite_master WHERE type='table'")
+    tables = cursor.fetchall()
+    
+    schema = {'tables': {}}
+    
+    for table in tables:
+        table_name, rootpage, create_sql = table
         
-        schema = {'tables': {}}
+        # Skip system tables
+        if table_name.startswith('sqlite_'):
+            continue
         
-        for table in tables:
-            table_name = table[0]
+        try:
+            # Get columns for each table using safe query execution
+            cursor_info = execute_query_safely(
+                conn,
+                "PRAGMA table_info({table})",
+                identifier_params={'table': table_name}
+            )
+            columns_info = cursor_info.fetchall()
             
-            # Skip system tables
-            if table_name.startswith('sqlite_'):
-                continue
+            columns = {}
+            for col in columns_info:
+                columns[col[1]] = col[2]  # column_name: data_type
+            
+            schema['tables'][table_name] = {
+                'columns': columns,
+                'row_count': _table_row_count(conn, table_name, _table_identity(rootpage, create_sql))
+            }
             
+        except SQLSecurityError:
+            # Skip tables with invalid names
+            continue
+    
+    return schema
+
+def get_schema_index() -> SchemaIndex:
+    """
+    Get the relevance index over table names, column names and sample values
+    (cached until the schema changes)
+    """
+    schema = get_database_schema()
+    manager = get_connection_manager()
+    
+    with manager.reader() as conn:
+        version = _schema_version(conn)
+        with _schema_cache_lock:
+            if (_schema_index_cache['index'] is not None
+                    and _schema_index_cache['db_path'] == manager.db_path
+                    and _schema_index_cache['schema_version'] == version):
+                return _schema_index_cache['index']
+        
+        index = SchemaIndex(schema, _read_sample_values(conn, schema))
+    
+    with _schema_cache_lock:
+        _schema_index_cache.update(db_path=manager.db_path, schema_version=version, index=index)
+    return index
+
+def _read_sample_values(conn: sqlite3.Connection, schema: Dict[str, Any]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Sample a few distinct short values from each text column
+    """
+    samples: Dict[str, Dict[str, List[str]]] = {}
+    
+    for table_name, table_info in schema.get('tables', {}).items():
+        table_samples = {}
+        for column_name, column_type in table_info['columns'].items():
+            column_type = (column_type or '').upper()
+            if column_type and not any(t in column_type for t in ('CHAR', 'TEXT', 'CLOB')):
+                continue
             try:
-                # Get columns for each table using safe query execution
-                cursor_info = execute_query_safely(
-                    conn,
-                    "PRAGMA table_info({table})",
-                    identifier_params={'table': table_name}
-                )
-                columns_info = cursor_info.fetchall()
-                
-                columns = {}
-                for col in columns_info:
-                    columns[col[1]] = col[2]  # column_name: data_type
-                
-                # Get row count safely
-                cursor_count = execute_query_safely(
+                cursor = execute_query_safely(
                     conn,
-                    "SELECT COUNT(*) FROM {table}",
-                    identifier_params={'table': table_name}
+                    "SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT ?",
+                    params=(SCHEMA_INDEX_SAMPLE_VALUES,),
+                    identifier_params={'table': table_name, 'column': column_name}
                 )
-                row_count = cursor_count.fetchone()[0]
-                
-                schema['tables'][table_name] = {
-                    'columns': columns,
-                    'row_count': row_count
-                }
-                
-            except SQLSecurityError:
-                # Skip tables with invalid names
+                values = [row[0] for row in cursor.fetchall()]
+            except (SQLSecurityError, sqlite3.Error):
                 continue
-        
-        conn.close()
-        
-        return schema
-        
-    except Exception as e:
-        return {'tables': {}, 'error': str(e)}
\ No newline at end of file
+            table_samples[column_name] = [v for v in values if isinstance(v, str) and len(v) <= 64]
+        samples[table_name] = table_samples
+    
+    return samples
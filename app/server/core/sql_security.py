@@ -150,9 +150,87 @@ def execute_query_safely(
     return cursor
 
 
+# Single-pass SQL lexer: each match is one token with its leading whitespace.
+# The token's first character tells its kind, so no per-kind groups are
+# needed. String and quoted-identifier bodies use unrolled loops so an
+# unterminated quote can't cause backtracking; it lexes as a lone quote.
+_SQL_TOKEN_RE = re.compile(
+    r"""\s*(
+        [A-Za-z_][A-Za-z0-9_$]*                         # word
+      | '[^']*(?:''[^']*)*'                             # string literal
+      | (?:0[xX][0-9A-Fa-f]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)  # number
+      | --|/\*|\*/                                      # comment markers
+      | "[^"]*(?:""[^"]*)*"|`[^`]*(?:``[^`]*)*`|\[[^\]]*\]  # quoted identifier
+      | \?\d*|[:@$][A-Za-z0-9_]+                        # parameter
+      | \|\||<<|>>|<=|>=|==|!=|<>                        # two-character operator
+      | \S                                              # anything else, including ; and lone quotes
+    )""",
+    re.VERBOSE,
+)
+
+# Statements a query may start with (after any opening parentheses)
+READ_ONLY_STATEMENTS = frozenset({"SELECT", "WITH", "VALUES"})
+
+# Keywords that modify data, schema or connection state, wherever they appear
+WRITE_KEYWORDS = frozenset({
+    "INSERT", "UPDATE", "DELETE", "DROP", "CREATE", "ALTER", "TRUNCATE",
+    "ATTACH", "DETACH", "PRAGMA", "VACUUM", "REINDEX", "ANALYZE",
+    "GRANT", "REVOKE",
+})
+
+# Keywords that need a look at the next token: REPLACE is also a function,
+# EXEC/EXECUTE only matter as procedure calls, OR may start a tautology
+_POSITIONAL_KEYWORDS = frozenset({"REPLACE", "EXEC", "EXECUTE", "OR"})
+
+_COMMENT_TOKENS = frozenset({"--", "/*", "*/"})
+_UNTERMINATED_TOKENS = frozenset({"'", '"', "`", "["})
+
+
+def tokenize_sql(query: str) -> List[str]:
+    """
+    Split a SQL query into tokens in a single pass.
+
+    String literals, quoted identifiers, numbers and comment markers are
+    each one token, so their contents are never mistaken for keywords.
+    Whitespace is dropped.
+    """
+    return _SQL_TOKEN_RE.findall(query)
+
+
+def _literal_value(token: str) -> Optional[str]:
+    """Value of a literal token, None for other tokens
+
+    Double-quoted tokens count too: SQLite reads them as strings when no
+    such column exists, and identical identifiers compare equal anyway.
+    """
+    if token[0] in "'\"" and len(token) > 1:
+        return token[1:-1].replace(token[0] * 2, token[0])
+    if token[0].isdigit() or (token[0] == "." and len(token) > 1):
+        return token
+    return None
+
+
+def _check_positional_keyword(tokens: List[str], i: int, word: str) -> None:
+    following = tokens[i + 1] if i + 1 < len(tokens) else ""
+    if word == "REPLACE" and following != "(":
+        raise SQLSecurityError("Query contains potentially dangerous operation: REPLACE")
+    if word in ("EXEC", "EXECUTE") and following == "(":
+        raise SQLSecurityError(f"Query contains potentially dangerous operation: {word}")
+    if word == "OR" and i + 3 < len(tokens) and tokens[i + 2] in ("=", "=="):
+        # OR '1'='1' and friends: a comparison of two equal literals
+        left = _literal_value(tokens[i + 1])
+        if left is not None and left == _literal_value(tokens[i + 3]):
+            raise SQLSecurityError("Query contains potential SQL injection pattern")
+
+
 def validate_sql_query(query: str) -> bool:
     """
-    Validate a SQL query to ensure it doesn't contain dangerous operations.
+    Validate a SQL query to ensure it is a single read-only statement.
+
+    The query is tokenised once, so keywords inside string literals and
+    quoted identifiers are ignored, and the statement is classified by its
+    structure (what it starts with, which keywords it uses) rather than by
+    a chain of pattern scans over the raw text.
 
     Args:
         query: The SQL query to validate
@@ -163,50 +241,108 @@ def validate_sql_query(query: str) -> bool:
     Raises:
         SQLSecurityError: If the query contains dangerous operations
     """
-    # Normalize query for checking
-    normalized_query = query.upper().strip()
-
-    # List of dangerous operations
-    dangerous_patterns = [
-        r"\bDROP\s+(?:TABLE|DATABASE|INDEX|VIEW)\b",
-        r"\bDELETE\s+FROM\b",
-        r"\bTRUNCATE\s+TABLE\b",
-        r"\bEXEC(?:UTE)?\s*\(",
-        r"\bCREATE\s+(?:TABLE|DATABASE|INDEX|VIEW)\b",
-        r"\bALTER\s+TABLE\b",
-        r"\bGRANT\b",
-        r"\bREVOKE\b",
-        r"\bINSERT\s+INTO\b.*\bSELECT\b",  # Prevent INSERT...SELECT
-        r"\bUPDATE\b.*\bSET\b",
-        r";\s*(?:DROP|DELETE|UPDATE|INSERT)",  # Multiple dangerous statements (allow SELECT)
-    ]
-
-    for pattern in dangerous_patterns:
-        if re.search(pattern, normalized_query):
-            raise SQLSecurityError(
-                f"Query contains potentially dangerous operation: {pattern}"
-            )
+    tokens = tokenize_sql(query)
+    token_set = set(tokens)
 
-    # Check for comment injection attempts
-    if "--" in query or "/*" in query or "*/" in query:
+    if token_set & _COMMENT_TOKENS:
         raise SQLSecurityError("Query contains SQL comments which are not allowed")
+    if token_set & _UNTERMINATED_TOKENS:
+        raise SQLSecurityError("Query contains an unterminated string or quoted identifier")
+
+    if ";" in token_set:
+        # Only trailing semicolons are allowed
+        end = tokens.index(";")
+        if any(token != ";" for token in tokens[end:]):
+            raise SQLSecurityError("Query contains multiple statements, only a single SELECT is allowed")
+        tokens = tokens[:end]
+
+    if not tokens:
+        return True
+
+    first = next((token for token in tokens if token != "("), "").upper()
+    if first not in READ_ONLY_STATEMENTS:
+        raise SQLSecurityError(f"Only SELECT queries are allowed, query starts with: {first}")
+
+    # Literals and quoted identifiers keep their quotes, so they can't
+    # collide with keywords here
+    words = {token.upper() for token in token_set}
+    dangerous = words & WRITE_KEYWORDS
+    if dangerous:
+        raise SQLSecurityError(
+            f"Query contains potentially dangerous operation: {', '.join(sorted(dangerous))}"
+        )
 
-    # Check for common injection patterns
-    injection_patterns = [
-        r"'\s*OR\s*'?1'?\s*=\s*'?1",  # 'OR 1=1
-        r'"\s*OR\s*"?1"?\s*=\s*"?1',  # "OR 1=1
-        # r"\bUNION\s+(?:ALL\s+)?SELECT\b",  # UNION SELECT - example injection pattern an llm might unintentionally try
-        r"'[^']*\s*;\s*(?:SELECT|DROP|DELETE|UPDATE|INSERT|CREATE|ALTER|EXEC)",  # SQL injection after quote and semicolon
-        r'"[^"]*\s*;\s*(?:SELECT|DROP|DELETE|UPDATE|INSERT|CREATE|ALTER|EXEC)',  # SQL injection after quote and semicolon
-    ]
-
-    for pattern in injection_patterns:
-        if re.search(pattern, normalized_query, re.IGNORECASE):
-            raise SQLSecurityError("Query contains potential SQL injection pattern")
+    positional = words & _POSITIONAL_KEYWORDS
+    if positional:
+        for i, token in enumerate(tokens):
+            word = token.upper()
+            if word in positional:
+                _check_positional_keyword(tokens, i, word)
 
     return True
 
 
+# Pragmas that only report on the schema; they may take a table or index name
+_INTROSPECTION_PRAGMAS = frozenset({
+    "table_info", "table_xinfo", "table_list", "index_list", "index_info",
+    "index_xinfo", "foreign_key_list", "database_list", "collation_list",
+    "function_list", "module_list", "pragma_list", "compile_options",
+})
+
+# Pragmas that are read-only when queried, but change state when given a value
+_QUERY_ONLY_PRAGMAS = frozenset({
+    "schema_version", "user_version", "data_version", "application_id",
+    "page_count", "page_size", "freelist_count", "journal_mode", "encoding",
+})
+
+_READ_ACTIONS = frozenset({
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+    sqlite3.SQLITE_TRANSACTION,
+})
+
+
+def read_only_authorizer(
+    action: int,
+    arg1: Optional[str],
+    arg2: Optional[str],
+    db_name: Optional[str],
+    trigger: Optional[str],
+) -> int:
+    """
+    sqlite3 authorizer callback that only lets statements read.
+
+    Writes, DDL, ATTACH/DETACH and pragmas that change state are denied when
+    the statement is prepared, whatever the SQL text looks like. Install it
+    with conn.set_authorizer(read_only_authorizer).
+    """
+    if action in _READ_ACTIONS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA:
+        name = (arg1 or "").lower()
+        if name in _INTROSPECTION_PRAGMAS or (name in _QUERY_ONLY_PRAGMAS and arg2 is None):
+            return sqlite3.SQLITE_OK
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_UPDATE and arg1 in ("sqlite_master", "sqlite_schema"):
+        # Reported when table-valued pragma functions (pragma_table_info(...))
+        # load the schema; SQLite itself refuses real writes to this table
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def is_read_only_violation(error: Exception) -> bool:
+    """
+    Whether a sqlite3 error came from the read-only authorizer or a
+    read-only connection
+    """
+    message = str(error).lower()
+    return isinstance(error, sqlite3.DatabaseError) and (
+        "not authorized" in message or "readonly database" in message
+    )
+
+
 def sanitize_value_for_like(value: str) -> str:
     """
     Sanitize a value for use in a LIKE clause by escaping special characters.
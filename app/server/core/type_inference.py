@@ -0,0 +1,274 @@
+"""
+Column type inference for ingestion.
+
+Every column of an upload gets a kind, inferred from the first batch of rows
+or given by a schema hint, which decides its declared SQLite type and how
+its values are stored:
+
+- integer    INTEGER; whole-number floats (e.g. a column with NULLs, which
+             pandas reads as float) are stored as integers
+- real       REAL
+- boolean    INTEGER 0/1 (true/false, yes/no, t/f, y/n, 1/0)
+- date       DATE, ISO 8601 text (YYYY-MM-DD)
+- datetime   DATETIME, ISO 8601 text (YYYY-MM-DD HH:MM:SS, converted to UTC
+             when the value has a time zone)
+- timestamp  INTEGER seconds since the Unix epoch
+- category   TEXT; held as a pandas categorical while converting
+- text       TEXT
+
+Dates are only inferred from ISO 8601 values and booleans from true/false;
+other formats need a hint. Later batches are converted to the kinds chosen
+for the first one, and a value that does not convert is stored unchanged,
+so nothing is lost to a wrong guess.
+"""
+
+import re
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+# Declared SQLite type for each column kind
+COLUMN_KINDS = {
+    'integer': 'INTEGER',
+    'real': 'REAL',
+    'boolean': 'INTEGER',
+    'date': 'DATE',
+    'datetime': 'DATETIME',
+    'timestamp': 'INTEGER',
+    'category': 'TEXT',
+    'text': 'TEXT',
+}
+
+# Text columns with at most this share of distinct values are categorical
+CATEGORY_MAX_DISTINCT_FRACTION = 0.5
+
+# Largest integer a float64 represents exactly
+_MAX_EXACT_FLOAT_INTEGER = 2 ** 53
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DATETIME_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?$"
+)
+
+_BOOLEAN_STRINGS = {
+    'true': 1, 'false': 0, 'yes': 1, 'no': 0,
+    't': 1, 'f': 0, 'y': 1, 'n': 0, '1': 1, '0': 0,
+}
+
+
+def validate_schema_hints(hints: Optional[Mapping[str, str]]) -> Dict[str, str]:
+    """
+    Check a column -> kind mapping, normalising kinds to lowercase
+
+    Raises:
+        ValueError: If a kind is not one of COLUMN_KINDS
+    """
+    validated = {}
+    for column, kind in (hints or {}).items():
+        kind = str(kind).strip().lower()
+        if kind not in COLUMN_KINDS:
+            raise ValueError(
+                f"Unknown type '{kind}' for column '{column}'; "
+                f"expected one of: {', '.join(COLUMN_KINDS)}"
+            )
+        validated[str(column)] = kind
+    return validated
+
+
+def _is_whole(numbers: pd.Series) -> bool:
+    return bool(((numbers % 1 == 0) & (numbers.abs() < _MAX_EXACT_FLOAT_INTEGER)).all())
+
+
+def infer_kind(values: pd.Series) -> str:
+    """
+    The kind of a column, judged from a sample of its values
+    """
+    non_null = values.dropna()
+    if non_null.empty:
+        # pandas reads an empty CSV column as float
+        return 'real' if pd.api.types.is_float_dtype(values.dtype) else 'text'
+
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return 'integer'
+    if pd.api.types.is_float_dtype(values.dtype):
+        return 'integer' if _is_whole(non_null) else 'real'
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return 'datetime'
+
+    inferred = pd.api.types.infer_dtype(non_null, skipna=True)
+    if inferred == 'boolean':
+        return 'boolean'
+    if inferred == 'integer':
+        return 'integer'
+    if inferred in ('floating', 'mixed-integer-float'):
+        return 'integer' if _is_whole(non_null.astype(float)) else 'real'
+    if inferred != 'string':
+        return 'text'
+
+    text = non_null.str.strip()
+    lowered = text.str.lower()
+    if lowered.isin(['true', 'false']).all():
+        return 'boolean'
+    if text.str.match(_DATE_RE).all() and pd.to_datetime(text, errors='coerce', format='ISO8601').notna().all():
+        return 'date'
+    is_datetime = text.str.match(_DATE_RE) | text.str.match(_DATETIME_RE)
+    if is_datetime.all() and pd.to_datetime(text, errors='coerce', format='ISO8601', utc=True).notna().all():
+        return 'datetime'
+    if non_null.nunique() <= len(non_null) * CATEGORY_MAX_DISTINCT_FRACTION:
+        return 'category'
+    return 'text'
+
+
+def plan_column_kinds(frame: pd.DataFrame, hints: Optional[Mapping[str, str]] = None) -> Dict[str, str]:
+    """
+    Kind of every column of the first batch, hints taking precedence
+    """
+    hints = hints or {}
+    return {column: hints.get(column) or infer_kind(frame[column]) for column in frame.columns}
+
+
+def _keep_unconverted(original: pd.Series, converted: pd.Series) -> pd.Series:
+    """Fall back to the original value wherever conversion produced a null"""
+    lost = converted.isna() & original.notna()
+    if not lost.any():
+        return converted
+    return converted.astype(object).where(~lost, original)
+
+
+def _parse_datetimes(values: pd.Series) -> pd.Series:
+    """
+    Parse to UTC datetimes: ISO 8601 text quickly, anything else per value,
+    numbers as epoch seconds
+    """
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return pd.to_datetime(values, unit='s', errors='coerce', utc=True)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return pd.to_datetime(values, utc=True)
+    text = values.where(values.isna(), values.astype(str).str.strip())
+    parsed = pd.to_datetime(text, errors='coerce', format='ISO8601', utc=True)
+    unparsed = parsed.isna() & text.notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(text[unparsed], errors='coerce', format='mixed', utc=True)
+    return parsed
+
+
+def _format_datetimes(parsed: pd.Series, unit: str) -> pd.Series:
+    """
+    ISO 8601 text of UTC datetimes at day or second resolution (much faster
+    than Series.dt.strftime)
+    """
+    naive = parsed.dt.tz_localize(None).to_numpy()
+    text = np.datetime_as_string(naive, unit=unit)
+    if unit != 'D':
+        text = np.char.replace(text, 'T', ' ')
+    return pd.Series(text, index=parsed.index, dtype=object).where(parsed.notna())
+
+
+def convert_series(values: pd.Series, kind: str) -> pd.Series:
+    """
+    Convert a column's values for storage as ``kind``
+    """
+    if kind == 'text':
+        return values
+    if kind == 'category':
+        return values.astype('category') if values.dtype == object else values
+
+    if kind in ('integer', 'real'):
+        if pd.api.types.is_bool_dtype(values.dtype):
+            values = values.astype(object)
+        numbers = pd.to_numeric(values, errors='coerce')
+        if kind == 'integer' and _is_whole(numbers.dropna()):
+            if numbers.notna().all():
+                numbers = pd.to_numeric(numbers, downcast='integer')
+            else:
+                numbers = numbers.astype('Int64')
+        return _keep_unconverted(values, numbers)
+
+    if kind == 'boolean':
+        if pd.api.types.is_bool_dtype(values.dtype):
+            return values
+        text = values.astype(str).str.strip().str.lower()
+        flags = text.map(_BOOLEAN_STRINGS).where(values.notna()).astype('Int64')
+        return _keep_unconverted(values, flags)
+
+    parsed = _parse_datetimes(values)
+    if kind == 'date':
+        converted = _format_datetimes(parsed, 'D')
+    elif kind == 'datetime':
+        converted = _format_datetimes(parsed, 's')
+    elif pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        # timestamp: numbers already are epoch seconds
+        return values
+    else:
+        converted = (parsed - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+        converted = converted.astype('Int64')
+    return _keep_unconverted(values, converted)
+
+
+def convert_frame(frame: pd.DataFrame, kinds: Mapping[str, str]) -> pd.DataFrame:
+    """
+    Convert every column of a batch to its planned kind
+    """
+    return pd.DataFrame(
+        {column: convert_series(frame[column], kinds.get(column, 'text')) for column in frame.columns},
+        index=frame.index
+    )
+
+
+def declared_type(kind: str) -> str:
+    return COLUMN_KINDS.get(kind, 'TEXT')
+
+
+def kind_of_declared_type(declared: str) -> str:
+    """
+    The kind to convert values to when writing into an existing column
+    """
+    declared = (declared or '').upper()
+    for kind in ('integer', 'real', 'date', 'datetime'):
+        if COLUMN_KINDS[kind] == declared:
+            return kind
+    return 'text'
+
+
+def sqlite_affinity(declared: str) -> str:
+    """
+    SQLite's type affinity for a declared column type (section 3.1 of
+    https://www.sqlite.org/datatype3.html)
+    """
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return 'INTEGER'
+    if any(name in declared for name in ('CHAR', 'CLOB', 'TEXT')):
+        return 'TEXT'
+    if 'BLOB' in declared or not declared:
+        return 'BLOB'
+    if any(name in declared for name in ('REAL', 'FLOA', 'DOUB')):
+        return 'REAL'
+    return 'NUMERIC'
+
+
+# Affinities (besides TEXT and BLOB, which take anything) that can hold each kind
+_COMPATIBLE_AFFINITIES = {
+    'integer': ('INTEGER', 'REAL', 'NUMERIC'),
+    'boolean': ('INTEGER', 'REAL', 'NUMERIC'),
+    'timestamp': ('INTEGER', 'REAL', 'NUMERIC'),
+    'real': ('REAL', 'NUMERIC'),
+    # DATE and DATETIME have NUMERIC affinity
+    'date': ('NUMERIC',),
+    'datetime': ('NUMERIC',),
+    'category': (),
+    'text': (),
+}
+
+
+def is_compatible(kind: str, declared: str) -> bool:
+    """
+    Whether values of ``kind`` can be written into a column declared ``declared``
+    without changing what the column holds
+    """
+    affinity = sqlite_affinity(declared)
+    return affinity in ('TEXT', 'BLOB') or affinity in _COMPATIBLE_AFFINITIES.get(kind, ())
+
@@ -1,19 +1,18 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from datetime import datetime
+import asyncio
 import os
 import sqlite3
 import traceback
 from dotenv import load_dotenv
 import logging
 import sys
-import csv
-import io
-from typing import List, Dict, Any
+import json
+from typing import List, Dict, Any, Optional, Set, Tuple, AsyncIterator
 
 from core.data_models import (
-    FileUploadResponse,
     QueryRequest,
     QueryResponse,
     DatabaseSchemaResponse,
@@ -24,14 +23,80 @@ from core.data_models import (
     ColumnInfo,
     RandomQueryResponse,
     TableExportRequest,
-    QueryExportRequest
+    QueryExportRequest,
+    ExecutorStats,
+    LLMCacheStats,
+    LLMProviderStats,
+    MetricsResponse,
+    CancelQueryResponse,
+    IndexRecommendation,
+    IndexRecommendationsResponse,
+    ApplyIndexesResponse,
+    IngestJob,
+    IngestJobListResponse,
+    IngestBatchResponse
+)
+from core.file_processor import normalize_schema_hints, validate_ingest_mode
+from core.compression import check_decompressor, split_compression
+from core.ingest_jobs import (
+    cancel_job,
+    get_job,
+    list_jobs,
+    recover_jobs,
+    shutdown_job_pool,
+    submit_batch,
+    submit_job,
+    table_name_for,
+    upload_format
+)
+from core.llm_processor import (
+    generate_sql,
+    generate_random_query,
+    stream_sql,
+    clean_sql_response,
+    reset_llm_clients,
+    aclose_llm_clients
+)
+from core.sql_processor import (
+    execute_sql_page,
+    stream_sql_rows,
+    stream_table_rows,
+    scan_storage_classes,
+    scan_table_storage_classes,
+    encode_page_token,
+    decode_page_token,
+    get_database_schema,
+    get_schema_index,
+    invalidate_schema_cache,
+    QUERY_PAGE_SIZE,
+    MAX_QUERY_PAGE_SIZE
 )
-from core.file_processor import convert_csv_to_sqlite, convert_json_to_sqlite, convert_jsonl_to_sqlite
-from core.llm_processor import generate_sql, generate_random_query
-from core.sql_processor import execute_sql_safely, get_database_schema
 from core.insights import generate_insights
+from core.insights_cache import database_key, forget_cached_insights
+from core.index_advisor import (
+    INDEX_ADVISOR_AUTO_CREATE,
+    create_recommended_indexes,
+    forget_table_usage,
+    get_index_recommendations,
+    record_query_usage
+)
+from core.query_control import (
+    QueryControl,
+    QueryInterruptedError,
+    start_query,
+    finish_query,
+    track_query,
+    cancel_query,
+    EXPORT_QUERY_TIMEOUT_SECONDS
+)
+from core.llm_cache import forget_cached_sql, get_llm_cache_stats
+from core.llm_routing import get_llm_routing_stats
+from core.export_processor import ExportFormat, project_batches, resolve_export_format
+from core.executors import run_blocking, iterate_blocking, get_executor_stats, shutdown_executors
+from core.db import get_connection_manager, close_all_connections
 from core.sql_security import (
     execute_query_safely,
+    escape_identifier,
     validate_identifier,
     check_table_exists,
     SQLSecurityError
@@ -73,91 +138,384 @@ app_start_time = datetime.now()
 # Ensure database directory exists
 os.makedirs("db", exist_ok=True)
 
-@app.post("/api/upload", response_model=FileUploadResponse)
-async def upload_file(file: UploadFile = File(...)) -> FileUploadResponse:
-    """Upload and convert .json, .jsonl or .csv file to SQLite table"""
+@app.on_event("startup")
+async def resume_ingest_jobs() -> None:
+    """Resubmit uploads that were still queued when the server last stopped"""
+    try:
+        await run_blocking("ingest", recover_jobs)
+    except Exception as e:
+        logger.error(f"[ERROR] Resuming ingest jobs failed: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_worker_pools() -> None:
+    """Stop the blocking-work executors and close pooled connections on shutdown"""
+    await aclose_llm_clients()
+    shutdown_executors(wait=False)
+    shutdown_job_pool(wait=False)
+    reset_llm_clients()
+    close_all_connections()
+
+def parse_schema_hints(schema_hints: Optional[str]) -> Optional[Dict[str, str]]:
+    """Parse and validate the schema_hints form field (a JSON object)"""
+    if not schema_hints:
+        return None
+    try:
+        hints = json.loads(schema_hints)
+        if not isinstance(hints, dict):
+            raise ValueError("schema_hints must be a JSON object")
+        return normalize_schema_hints(hints)
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid schema_hints: {str(e)}")
+
+@app.post("/api/upload", response_model=IngestJob)
+async def upload_file(
+    file: UploadFile = File(...),
+    schema_hints: Optional[str] = Form(None),
+    mode: str = Form('replace'),
+    key_columns: Optional[str] = Form(None)
+) -> IngestJob:
+    """
+    Queue a .json, .jsonl or .csv file for conversion to a SQLite table.
+    The file may be gzip, bzip2, xz or Zstandard compressed (.csv.gz etc.).
+    
+    Returns the ingest job straight away; follow it with GET /api/jobs/{job_id}.
+    ``schema_hints`` is an optional JSON object of column name -> type
+    (integer, real, boolean, date, datetime, timestamp, category or text)
+    overriding the inferred column types. ``mode`` replaces the table
+    (default), appends to it or upserts into it on the comma-separated
+    ``key_columns``.
+    """
     try:
         # Validate file type
-        if not file.filename.endswith(('.csv', '.json', '.jsonl')):
-            raise HTTPException(400, "Only .csv, .json, and .jsonl files are supported")
+        file_format = upload_format(file.filename or "")
+        if file_format is None:
+            raise HTTPException(400, "Only .csv, .json, and .jsonl files (optionally .gz, .bz2, .xz or .zst compressed) are supported")
+        try:
+            check_decompressor(split_compression(file.filename)[1])
+        except ValueError as e:
+            raise HTTPException(400, str(e))
         
-        # Generate table name from filename
-        table_name = file.filename.rsplit('.', 1)[0].lower().replace(' ', '_')
+        # Validate schema hints before reading any data
+        hints = parse_schema_hints(schema_hints)
         
-        # Read file content
-        content = await file.read()
+        keys = [key.strip() for key in (key_columns or "").split(",") if key.strip()]
+        try:
+            validate_ingest_mode(mode, keys)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        options = {'schema_hints': hints, 'mode': mode, 'key_columns': keys}
         
-        # Convert to SQLite based on file type
-        if file.filename.endswith('.csv'):
-            result = convert_csv_to_sqlite(content, table_name)
-        elif file.filename.endswith('.jsonl'):
-            result = convert_jsonl_to_sqlite(content, table_name)
-        else:
-            result = convert_json_to_sqlite(content, table_name)
+        # Generate table name from filename
+        table_name = table_name_for(file.filename)
         
-        response = FileUploadResponse(
-            table_name=result['table_name'],
-            table_schema=result['schema'],
-            row_count=result['row_count'],
-            sample_data=result['sample_data']
-        )
-        logger.info(f"[SUCCESS] File upload: {response}")
+        # Spool the upload and hand it to the ingest workers
+        job = await run_blocking("ingest", submit_job, file.file, file.filename, table_name, file_format, options)
+        
+        response = IngestJob(**job)
+        logger.info(f"[SUCCESS] File upload queued: {response.job_id} ({file.filename})")
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"[ERROR] File upload failed: {str(e)}")
         logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
-        return FileUploadResponse(
+        return IngestJob(
+            job_id="",
+            file_name=file.filename or "",
             table_name="",
-            table_schema={},
-            row_count=0,
-            sample_data=[],
+            file_format="",
+            mode=mode,
+            status="failed",
             error=str(e)
         )
 
-@app.post("/api/query", response_model=QueryResponse)
-async def process_natural_language_query(request: QueryRequest) -> QueryResponse:
-    """Process natural language query and return SQL results"""
+@app.post("/api/upload/batch", response_model=IngestBatchResponse)
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    schema_hints: Optional[str] = Form(None)
+) -> IngestBatchResponse:
+    """
+    Queue several files, or the .csv, .json and .jsonl files in .zip and
+    .tar(.gz/.bz2/.xz) archives, as one ingest job per file.
+    
+    Each file replaces the table named after it; the files are parsed in
+    parallel by the ingest workers. ``schema_hints`` applies to every file.
+    Nothing is queued if any file is unsupported or two files would load
+    the same table.
+    """
     try:
-        # Get database schema
-        schema_info = get_database_schema()
+        hints = parse_schema_hints(schema_hints)
+        uploads = [(file.filename or "", file.file) for file in files]
         
-        # Generate SQL using routing logic
-        sql = generate_sql(request, schema_info)
+        jobs = await run_blocking("ingest", submit_batch, uploads, {'schema_hints': hints})
         
-        # Execute SQL query
-        start_time = datetime.now()
-        result = execute_sql_safely(sql)
-        execution_time = (datetime.now() - start_time).total_seconds() * 1000
-        
-        if result['error']:
-            raise Exception(result['error'])
-        
-        response = QueryResponse(
-            sql=sql,
-            results=result['results'],
-            columns=result['columns'],
-            row_count=len(result['results']),
-            execution_time_ms=execution_time
-        )
-        logger.info(f"[SUCCESS] Query processed: SQL={sql}, rows={len(result['results'])}, time={execution_time}ms")
+        response = IngestBatchResponse(jobs=[IngestJob(**job) for job in jobs])
+        logger.info(f"[SUCCESS] Batch upload queued: {len(jobs)} jobs ({', '.join(name for name, _ in uploads)})")
         return response
     except Exception as e:
-        logger.error(f"[ERROR] Query processing failed: {str(e)}")
+        logger.error(f"[ERROR] Batch upload failed: {str(e)}")
         logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
-        return QueryResponse(
-            sql="",
-            results=[],
-            columns=[],
-            row_count=0,
-            execution_time_ms=0,
-            error=str(e)
-        )
+        return IngestBatchResponse(jobs=[], error=str(e))
+
+@app.get("/api/jobs", response_model=IngestJobListResponse)
+async def list_ingest_jobs(limit: int = Query(50, ge=1, le=500)) -> IngestJobListResponse:
+    """List recent ingest jobs, newest first"""
+    try:
+        jobs = await run_blocking("db", list_jobs, limit)
+        return IngestJobListResponse(jobs=[IngestJob(**job) for job in jobs])
+    except Exception as e:
+        logger.error(f"[ERROR] Listing ingest jobs failed: {str(e)}")
+        logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
+        return IngestJobListResponse(jobs=[], error=str(e))
+
+@app.get("/api/jobs/{job_id}", response_model=IngestJob)
+async def get_ingest_job(job_id: str) -> IngestJob:
+    """Status and progress (bytes parsed, rows written, throughput) of an ingest job"""
+    job = await run_blocking("db", get_job, job_id)
+    if job is None:
+        raise HTTPException(404, f"Job '{job_id}' not found")
+    return IngestJob(**job)
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=IngestJob)
+async def cancel_ingest_job(job_id: str) -> IngestJob:
+    """Cancel an ingest job; a running job is rolled back, keeping any previous table"""
+    job = await run_blocking("db", cancel_job, job_id)
+    if job is None:
+        raise HTTPException(404, f"Job '{job_id}' not found")
+    logger.info(f"[SUCCESS] Ingest job cancellation requested: {job_id} ({job['status']})")
+    return IngestJob(**job)
+
+async def resolve_query_sql(request: QueryRequest) -> Tuple[str, int]:
+    """
+    Get the SQL (and row offset) for a query request.
+    
+    A continuation token carries the SQL of an earlier page, so the LLM is only
+    called for the first page.
+    """
+    if request.page_token:
+        return decode_page_token(request.page_token)
+    
+    # Get database schema and its relevance index for prompt pruning
+    schema_info = await run_blocking("db", get_database_schema)
+    schema_index = await run_blocking("db", get_schema_index)
+    
+    # Generate SQL using routing logic
+    sql = await run_blocking("llm", generate_sql, request, schema_info, schema_index)
+    return sql, 0
+
+async def run_query_page(request: QueryRequest, sql: str, offset: int, control: QueryControl) -> QueryResponse:
+    """
+    Execute one page of a query's SQL under its deadline, raising if it fails
+    """
+    page_size = min(request.page_size or QUERY_PAGE_SIZE, MAX_QUERY_PAGE_SIZE)
+    
+    # Execute SQL query
+    start_time = datetime.now()
+    result = await run_blocking("db", execute_sql_page, sql, page_size, offset, control)
+    execution_time = (datetime.now() - start_time).total_seconds() * 1000
+    
+    if result['error']:
+        if not request.page_token:
+            # Don't keep serving cached SQL that fails to run
+            await run_blocking("db", forget_cached_sql, sql)
+        raise Exception(result['error'])
+    
+    if not offset:
+        await advise_indexes(sql)
+    
+    return QueryResponse(
+        sql=sql,
+        results=result['results'],
+        columns=result['columns'],
+        row_count=len(result['results']),
+        execution_time_ms=execution_time,
+        has_more=result['has_more'],
+        next_page_token=encode_page_token(sql, offset + page_size) if result['has_more'] else None,
+        truncated=result['truncated'],
+        request_id=control.request_id
+    )
+
+# Background index creation tasks, kept referenced until they finish
+_index_tasks: Set[asyncio.Task] = set()
+
+async def create_indexes() -> None:
+    """
+    Create recommended indexes (used as a background task)
+    """
+    try:
+        created = await run_blocking("ingest", create_recommended_indexes)
+        if created:
+            logger.info(f"[SUCCESS] Indexes created: {created}")
+    except Exception as e:
+        logger.error(f"[ERROR] Index creation failed: {str(e)}")
+
+async def advise_indexes(sql: str) -> None:
+    """
+    Record the columns a query used, creating indexes in the background once
+    a column becomes hot if INDEX_ADVISOR_AUTO_CREATE is set
+    """
+    became_hot = await run_blocking("db", record_query_usage, sql)
+    if became_hot and INDEX_ADVISOR_AUTO_CREATE:
+        task = asyncio.create_task(create_indexes())
+        _index_tasks.add(task)
+        task.add_done_callback(_index_tasks.discard)
+
+# Seconds between checks for a client that went away mid-query
+DISCONNECT_POLL_SECONDS = 0.5
+
+async def cancel_on_disconnect(http_request: Request, control: QueryControl) -> None:
+    """
+    Cancel a query once its client has disconnected
+    """
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+    logger.info(f"[SUCCESS] Query {control.request_id} cancelled: client disconnected")
+    control.cancel()
+
+@app.post("/api/query", response_model=QueryResponse)
+async def process_natural_language_query(request: QueryRequest, http_request: Request) -> QueryResponse:
+    """
+    Process natural language query and return one page of SQL results
+    
+    Later pages (requested with page_token) re-run the SQL and skip the rows
+    of earlier pages on the cursor, so page N costs about N pages' worth of
+    rows; generated SQL has no key to resume from. Fetch deep result sets
+    with /api/query/ndjson or /api/export/query instead.
+    """
+    with track_query(request.request_id) as control:
+        watcher = asyncio.create_task(cancel_on_disconnect(http_request, control))
+        try:
+            sql, offset = await resolve_query_sql(request)
+            response = await run_query_page(request, sql, offset, control)
+            logger.info(f"[SUCCESS] Query processed: SQL={sql}, rows={response.row_count}, time={response.execution_time_ms}ms")
+            return response
+        except Exception as e:
+            logger.error(f"[ERROR] Query processing failed: {str(e)}")
+            logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
+            return QueryResponse(
+                sql="",
+                results=[],
+                columns=[],
+                row_count=0,
+                execution_time_ms=0,
+                request_id=control.request_id,
+                error=str(e)
+            )
+        finally:
+            watcher.cancel()
+
+@app.post("/api/query/{request_id}/cancel", response_model=CancelQueryResponse)
+async def cancel_running_query(request_id: str) -> CancelQueryResponse:
+    """Cancel a running query or query export by its request ID"""
+    cancelled = cancel_query(request_id)
+    if cancelled:
+        logger.info(f"[SUCCESS] Query cancelled: {request_id}")
+    return CancelQueryResponse(request_id=request_id, cancelled=cancelled)
+
+def sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    """
+    Encode one server-sent event
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8')
+
+async def generate_query_events(request: QueryRequest) -> AsyncIterator[bytes]:
+    """
+    Yield SSE events for a query: token (SQL text as it is generated), sql
+    (the final SQL), then results (the first page) or error
+    
+    The query is cancelled if the client disconnects, which closes this generator.
+    """
+    with track_query(request.request_id) as control:
+        try:
+            if request.page_token:
+                sql, offset = decode_page_token(request.page_token)
+            else:
+                schema_info = await run_blocking("db", get_database_schema)
+                schema_index = await run_blocking("db", get_schema_index)
+                
+                parts = []
+                async for text in stream_sql(request, schema_info, schema_index):
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+                sql, offset = clean_sql_response("".join(parts)), 0
+            
+            yield sse_event("sql", {"sql": sql})
+            
+            response = await run_query_page(request, sql, offset, control)
+            logger.info(f"[SUCCESS] Query streamed: SQL={sql}, rows={response.row_count}, time={response.execution_time_ms}ms")
+            yield sse_event("results", response.model_dump(mode="json"))
+        except Exception as e:
+            logger.error(f"[ERROR] Query stream failed: {str(e)}")
+            logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
+            yield sse_event("error", {"error": str(e), "request_id": control.request_id})
+
+@app.post("/api/query/stream")
+async def stream_query_events(request: QueryRequest) -> StreamingResponse:
+    """Process natural language query, streaming the SQL as it is generated and then the results (SSE)"""
+    return StreamingResponse(
+        generate_query_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def generate_ndjson_rows(
+    sql: str,
+    columns: List[str],
+    batches,
+    offset: int,
+    control: QueryControl
+) -> AsyncIterator[bytes]:
+    """
+    Yield query results as NDJSON: a meta line, one JSON array per row, then an end line
+    """
+    yield (json.dumps({"type": "meta", "sql": sql, "columns": columns, "request_id": control.request_id}) + "\n").encode('utf-8')
+    
+    row_count = 0
+    try:
+        async for rows in iterate_blocking("db", batches):
+            if offset:
+                skipped = min(offset, len(rows))
+                rows = rows[skipped:]
+                offset -= skipped
+            row_count += len(rows)
+            yield "".join(json.dumps(row, default=str) + "\n" for row in rows).encode('utf-8')
+    except Exception as e:
+        logger.error(f"[ERROR] Query stream failed after {row_count} rows: {str(e)}")
+        yield (json.dumps({"type": "error", "error": str(e)}) + "\n").encode('utf-8')
+        return
+    finally:
+        # Stops the statement if the client went away mid-stream
+        finish_query(control)
+    
+    logger.info(f"[SUCCESS] Query streamed: rows={row_count}")
+    yield (json.dumps({"type": "end", "row_count": row_count}) + "\n").encode('utf-8')
+
+@app.post("/api/query/ndjson")
+async def stream_natural_language_query(request: QueryRequest) -> StreamingResponse:
+    """Process natural language query and stream every result row as NDJSON"""
+    control = start_query(request.request_id, EXPORT_QUERY_TIMEOUT_SECONDS)
+    try:
+        sql, offset = await resolve_query_sql(request)
+        columns, batches = await run_blocking("db", stream_sql_rows, sql, control=control)
+    except SQLSecurityError as e:
+        finish_query(control)
+        raise HTTPException(400, f"Security error: {str(e)}")
+    except Exception as e:
+        finish_query(control)
+        logger.error(f"[ERROR] Query stream failed: {str(e)}")
+        logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
+        raise HTTPException(400, f"Query execution failed: {str(e)}")
+    
+    return StreamingResponse(
+        generate_ndjson_rows(sql, columns, batches, offset, control),
+        media_type="application/x-ndjson"
+    )
 
 @app.get("/api/schema", response_model=DatabaseSchemaResponse)
 async def get_database_schema_endpoint() -> DatabaseSchemaResponse:
     """Get current database schema and table information"""
     try:
-        schema = get_database_schema()
+        schema = await run_blocking("db", get_database_schema)
         tables = []
         
         for table_name, table_info in schema['tables'].items():
@@ -196,7 +554,9 @@ async def get_database_schema_endpoint() -> DatabaseSchemaResponse:
 async def generate_insights_endpoint(request: InsightsRequest) -> InsightsResponse:
     """Generate statistical insights for table columns"""
     try:
-        insights = generate_insights(request.table_name, request.column_names)
+        insights = await run_blocking(
+            "db", generate_insights, request.table_name, request.column_names, request.sample_rate
+        )
         response = InsightsResponse(
             table_name=request.table_name,
             insights=insights,
@@ -219,7 +579,7 @@ async def generate_random_query_endpoint() -> RandomQueryResponse:
     """Generate a random natural language query based on database schema"""
     try:
         # Get database schema
-        schema_info = get_database_schema()
+        schema_info = await run_blocking("db", get_database_schema)
         
         # Check if there are any tables
         if not schema_info.get('tables'):
@@ -229,7 +589,7 @@ async def generate_random_query_endpoint() -> RandomQueryResponse:
             )
         
         # Generate random query using LLM
-        random_query = generate_random_query(schema_info)
+        random_query = await run_blocking("llm", generate_random_query, schema_info)
         
         response = RandomQueryResponse(query=random_query)
         logger.info(f"[SUCCESS] Random query generated: {random_query}")
@@ -242,16 +602,19 @@ async def generate_random_query_endpoint() -> RandomQueryResponse:
             error=str(e)
         )
 
+def _list_tables() -> List[tuple]:
+    """List table names in the database (blocking)"""
+    with get_connection_manager().reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        return cursor.fetchall()
+
 @app.get("/api/health", response_model=HealthCheckResponse)
 async def health_check() -> HealthCheckResponse:
     """Health check endpoint with database status"""
     try:
         # Check database connection
-        conn = sqlite3.connect("db/database.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        conn.close()
+        tables = await run_blocking("db", _list_tables)
         
         uptime = (datetime.now() - app_start_time).total_seconds()
         
@@ -273,21 +636,11 @@ async def health_check() -> HealthCheckResponse:
             uptime_seconds=0
         )
 
-@app.delete("/api/table/{table_name}")
-async def delete_table(table_name: str):
-    """Delete a table from the database"""
-    try:
-        # Validate table name using security module
-        try:
-            validate_identifier(table_name, "table")
-        except SQLSecurityError as e:
-            raise HTTPException(400, str(e))
-        
-        conn = sqlite3.connect("db/database.db")
-        
+def _drop_table(table_name: str) -> None:
+    """Drop an existing table (blocking), raising 404 if it does not exist"""
+    with get_connection_manager().writer() as conn:
         # Check if table exists using secure method
         if not check_table_exists(conn, table_name):
-            conn.close()
             raise HTTPException(404, f"Table '{table_name}' not found")
         
         # Drop the table using safe query execution with DDL permission
@@ -298,7 +651,68 @@ async def delete_table(table_name: str):
             allow_ddl=True
         )
         conn.commit()
-        conn.close()
+        database = database_key(conn)
+    
+    invalidate_schema_cache(table_name)
+    forget_cached_insights(database, table_name)
+    forget_table_usage(database, table_name)
+
+@app.get("/api/metrics", response_model=MetricsResponse)
+async def get_metrics() -> MetricsResponse:
+    """Report executor queue depth and throughput, SQL cache effectiveness and LLM latencies"""
+    executors = {
+        name: ExecutorStats(**stats)
+        for name, stats in get_executor_stats().items()
+    }
+    llm_cache = await run_blocking("db", get_llm_cache_stats)
+    llm_providers = {
+        name: LLMProviderStats(**stats)
+        for name, stats in get_llm_routing_stats().items()
+    }
+    return MetricsResponse(
+        executors=executors,
+        llm_cache=LLMCacheStats(**llm_cache),
+        llm_providers=llm_providers
+    )
+
+@app.get("/api/indexes/recommendations", response_model=IndexRecommendationsResponse)
+async def get_index_recommendations_endpoint() -> IndexRecommendationsResponse:
+    """Columns that executed queries filter, join, group or sort on often enough to index"""
+    try:
+        recommendations = await run_blocking("db", get_index_recommendations)
+        response = IndexRecommendationsResponse(
+            recommendations=[IndexRecommendation(**recommendation) for recommendation in recommendations]
+        )
+        logger.info(f"[SUCCESS] Index recommendations: {len(recommendations)}")
+        return response
+    except Exception as e:
+        logger.error(f"[ERROR] Index recommendations failed: {str(e)}")
+        logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
+        return IndexRecommendationsResponse(recommendations=[], error=str(e))
+
+@app.post("/api/indexes/apply", response_model=ApplyIndexesResponse)
+async def apply_index_recommendations() -> ApplyIndexesResponse:
+    """Create the recommended indexes that fit within INDEX_ADVISOR_MAX_INDEX_BYTES"""
+    try:
+        created = await run_blocking("ingest", create_recommended_indexes)
+        logger.info(f"[SUCCESS] Indexes created: {created}")
+        return ApplyIndexesResponse(created=created)
+    except Exception as e:
+        logger.error(f"[ERROR] Index creation failed: {str(e)}")
+        logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
+        return ApplyIndexesResponse(created=[], error=str(e))
+
+@app.delete("/api/table/{table_name}")
+async def delete_table(table_name: str):
+    """Delete a table from the database"""
+    try:
+        # Validate table name using security module
+        try:
+            validate_identifier(table_name, "table")
+        except SQLSecurityError as e:
+            raise HTTPException(400, str(e))
+        
+        await run_blocking("db", _drop_table, table_name)
         
         response = {"message": f"Table '{table_name}' deleted successfully"}
         logger.info(f"[SUCCESS] Table deleted: {table_name}")
@@ -310,51 +724,85 @@ async def delete_table(table_name: str):
         logger.error(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
         raise HTTPException(500, f"Error deleting table: {str(e)}")
 
-def generate_csv_response(results: List[Dict[str, Any]], columns: List[str], filename: str = "export.csv") -> StreamingResponse:
+async def generate_export_stream(chunks, batches, control: Optional[QueryControl] = None) -> AsyncIterator[bytes]:
     """
-    Generate a CSV file from query results and return as streaming response
-
-    Args:
-        results: List of dictionaries containing the data
-        columns: List of column names
-        filename: Name for the downloaded file
-
-    Returns:
-        StreamingResponse with CSV content
+    Drive a blocking chunk encoder from the db pool, releasing the cursor when done
     """
-    # Create a string buffer to write CSV data
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=columns, lineterminator='\n')
-
-    # Write header
-    writer.writeheader()
-
-    # Write data rows
-    for row in results:
-        # Handle None/NULL values by converting to empty string
-        cleaned_row = {k: ('' if v is None else v) for k, v in row.items()}
-        writer.writerow(cleaned_row)
-
-    # Get the CSV string and encode to bytes
-    csv_content = output.getvalue()
-    output.close()
-
-    # Create a bytes buffer for the response
-    bytes_output = io.BytesIO(csv_content.encode('utf-8'))
-
-    # Return streaming response with appropriate headers
+    try:
+        async for chunk in iterate_blocking("db", chunks):
+            yield chunk
+    finally:
+        if control is not None:
+            # Stops the statement if the client went away mid-export
+            finish_query(control)
+        await run_blocking("db", batches.close)
+
+def export_response(
+    source_columns: List[str],
+    batches,
+    filename: str,
+    export_format: ExportFormat,
+    columns: Optional[List[str]] = None,
+    control: Optional[QueryControl] = None,
+    storage_classes: Optional[List[Set[str]]] = None
+) -> StreamingResponse:
+    """
+    Stream row batches to the client as a download, optionally re-ordered to columns
+    
+    storage_classes (per source column) fix the column types of columnar formats.
+    """
+    columns = columns or source_columns
+    rows = project_batches(source_columns, batches, columns)
+    if storage_classes is None:
+        chunks = export_format.encoder(columns, rows)
+    else:
+        if columns != source_columns:
+            by_name = dict(zip(source_columns, storage_classes))
+            storage_classes = [by_name.get(name, set()) for name in columns]
+        chunks = export_format.encoder(columns, rows, storage_classes)
+    content_type = export_format.media_type
+    if export_format.name == "csv":
+        content_type += "; charset=utf-8"
     return StreamingResponse(
-        bytes_output,
-        media_type="text/csv",
+        generate_export_stream(chunks, batches, control),
+        media_type=export_format.media_type,
         headers={
             "Content-Disposition": f"attachment; filename={filename}",
-            "Content-Type": "text/csv; charset=utf-8"
+            "Content-Type": content_type
         }
     )
 
+def get_export_format(requested: Optional[str], accept: Optional[str]) -> ExportFormat:
+    """Resolve the requested export format, raising 400 if it cannot be served"""
+    try:
+        return resolve_export_format(requested, accept)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+def _open_table_export(table_name: str, export_format: ExportFormat):
+    """
+    Open a streaming cursor over a table (blocking), raising 404 if it does not exist
+    
+    Returns the columns, the row batches and, for columnar formats, the storage
+    classes of each column.
+    """
+    with get_connection_manager().reader() as conn:
+        if not check_table_exists(conn, table_name):
+            raise HTTPException(404, f"Table '{table_name}' not found")
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({escape_identifier(table_name)})")]
+    storage_classes = None
+    if export_format.requires_pyarrow:
+        storage_classes = scan_table_storage_classes(table_name, len(columns))
+    columns, batches = stream_table_rows(table_name, export_format.batch_rows)
+    return columns, batches, storage_classes
+
 @app.get("/api/export/table/{table_name}")
-async def export_table(table_name: str) -> StreamingResponse:
-    """Export entire table as CSV file"""
+async def export_table(
+    table_name: str,
+    format: Optional[str] = Query(None, description="csv, ndjson, parquet or arrow"),
+    accept: Optional[str] = Header(None)
+) -> StreamingResponse:
+    """Export entire table as a CSV, NDJSON, Parquet or Arrow file"""
     try:
         # Validate table name
         try:
@@ -362,39 +810,18 @@ async def export_table(table_name: str) -> StreamingResponse:
         except SQLSecurityError as e:
             raise HTTPException(400, str(e))
 
-        conn = sqlite3.connect("db/database.db")
-
-        # Check if table exists
-        if not check_table_exists(conn, table_name):
-            conn.close()
-            raise HTTPException(404, f"Table '{table_name}' not found")
-
-        # Query all data from the table
-        results = execute_query_safely(
-            conn,
-            "SELECT * FROM {table}",
-            identifier_params={'table': table_name}
-        ).fetchall()
-
-        # Get column names
-        cursor_info = execute_query_safely(
-            conn,
-            "PRAGMA table_info({table})",
-            identifier_params={'table': table_name}
+        export_format = get_export_format(format, accept)
+        columns, batches, storage_classes = await run_blocking(
+            "db", _open_table_export, table_name, export_format
         )
-        columns = [row[1] for row in cursor_info.fetchall()]
-        conn.close()
-
-        # Convert results to list of dictionaries
-        data = []
-        for row in results:
-            data.append(dict(zip(columns, row)))
 
         # Generate filename
-        filename = f"{table_name}_export.csv"
+        filename = f"{table_name}_export.{export_format.extension}"
 
-        logger.info(f"[SUCCESS] Table export: {table_name}, rows: {len(data)}")
-        return generate_csv_response(data, columns, filename)
+        logger.info(f"[SUCCESS] Table export started: {table_name} ({export_format.name})")
+        return export_response(
+            columns, batches, filename, export_format, storage_classes=storage_classes
+        )
 
     except HTTPException:
         raise
@@ -404,21 +831,48 @@ async def export_table(table_name: str) -> StreamingResponse:
         raise HTTPException(500, f"Error exporting table: {str(e)}")
 
 @app.post("/api/export/query")
-async def export_query_results(request: QueryExportRequest) -> StreamingResponse:
-    """Export query results as CSV file"""
+async def export_query_results(
+    request: QueryExportRequest,
+    format: Optional[str] = Query(None, description="csv, ndjson, parquet or arrow"),
+    accept: Optional[str] = Header(None)
+) -> StreamingResponse:
+    """Export query results as a CSV, NDJSON, Parquet or Arrow file"""
     try:
-        # Execute the SQL query safely
-        result = execute_sql_safely(request.sql)
+        export_format = get_export_format(format, accept)
 
-        if result['error']:
-            raise HTTPException(400, f"Query execution failed: {result['error']}")
+        # Execute the SQL query safely
+        control = start_query(request.request_id, EXPORT_QUERY_TIMEOUT_SECONDS)
+        storage_classes = None
+        try:
+            columns, batches = await run_blocking(
+                "db", stream_sql_rows, request.sql, export_format.batch_rows, control
+            )
+            if export_format.requires_pyarrow:
+                try:
+                    storage_classes = await run_blocking(
+                        "db", scan_storage_classes, request.sql, len(columns), control
+                    )
+                except Exception:
+                    await run_blocking("db", batches.close)
+                    raise
+        except SQLSecurityError as e:
+            finish_query(control)
+            raise HTTPException(400, f"Query execution failed: Security error: {str(e)}")
+        except (sqlite3.Error, QueryInterruptedError) as e:
+            finish_query(control)
+            raise HTTPException(400, f"Query execution failed: {str(e)}")
+        except Exception:
+            finish_query(control)
+            raise
 
         # Generate filename based on timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"query_results_{timestamp}.csv"
+        filename = f"query_results_{timestamp}.{export_format.extension}"
 
-        logger.info(f"[SUCCESS] Query export: rows: {len(result['results'])}")
-        return generate_csv_response(result['results'], request.columns, filename)
+        logger.info(f"[SUCCESS] Query export started ({export_format.name}): {request.sql}")
+        return export_response(
+            columns, batches, filename, export_format, request.columns, control, storage_classes
+        )
 
     except HTTPException:
         raise
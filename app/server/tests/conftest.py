@@ -0,0 +1,21 @@
+import pytest
+from core import db
+from core.llm_processor import reset_llm_clients
+from core.llm_routing import reset_llm_routing_stats
+
+
+@pytest.fixture(autouse=True)
+def isolated_database(tmp_path, monkeypatch):
+    """Point the shared connection pools at per-test database files"""
+    monkeypatch.setattr(db, "DATABASE_PATH", str(tmp_path / "database.db"))
+    monkeypatch.setattr(db, "METADATA_DATABASE_PATH", str(tmp_path / "metadata.db"))
+    yield
+    db.close_all_connections()
+
+
+@pytest.fixture(autouse=True)
+def fresh_llm_clients():
+    """Don't let one test's (possibly mocked) LLM clients or latencies leak into another"""
+    yield
+    reset_llm_clients()
+    reset_llm_routing_stats()
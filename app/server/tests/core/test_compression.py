@@ -0,0 +1,48 @@
+import bz2
+import gzip
+import io
+import lzma
+import pytest
+from core import compression
+from core.compression import check_decompressor, open_decompressed, split_compression
+
+CSV = b"id,name\n" + b"".join(f"{i},user{i}\n".encode() for i in range(1000))
+
+
+class TestCompression:
+
+    def test_split_compression(self):
+        assert split_compression("events.csv.gz") == ("events.csv", "gzip")
+        assert split_compression("Events.JSONL.ZST") == ("Events.JSONL", "zstd")
+        assert split_compression("events.json.bz2") == ("events.json", "bz2")
+        assert split_compression("events.csv") == ("events.csv", None)
+
+    @pytest.mark.parametrize("name,compress", [
+        ("gzip", gzip.compress),
+        ("bz2", bz2.compress),
+        ("xz", lzma.compress),
+    ])
+    def test_open_decompressed(self, name, compress):
+        source = io.BytesIO(compress(CSV))
+        with open_decompressed(source, name) as stream:
+            assert stream.read(8) == b"id,name\n"
+            assert stream.read() == CSV[8:]
+        # Reads the compressed stream incrementally and leaves it open
+        assert source.tell() == len(source.getvalue())
+        assert not source.closed
+
+    def test_zstd(self):
+        zstandard = pytest.importorskip("zstandard")
+        frames = zstandard.ZstdCompressor().compress(CSV[:500]) + zstandard.ZstdCompressor().compress(CSV[500:])
+
+        with open_decompressed(io.BytesIO(frames), "zstd") as stream:
+            assert stream.read() == CSV
+
+    def test_zstd_needs_zstandard(self, monkeypatch):
+        monkeypatch.setattr(compression, "zstandard", None)
+
+        with pytest.raises(ValueError, match="pip install zstandard"):
+            open_decompressed(io.BytesIO(b""), "zstd")
+        with pytest.raises(ValueError, match="pip install zstandard"):
+            check_decompressor("zstd")
+        check_decompressor("gzip")
@@ -0,0 +1,160 @@
+import sqlite3
+import threading
+import pytest
+from core import db
+from core.db import ConnectionManager, DatabaseBusyError, get_connection_manager, close_all_connections
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """Create a connection manager over a temporary database file"""
+    manager = ConnectionManager(str(tmp_path / "test.db"), read_pool_size=2)
+    yield manager
+    manager.close()
+
+
+class TestConnectionManager:
+
+    def test_writer_enables_wal_and_pragmas(self, manager):
+        with manager.writer() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -65536
+
+    def test_readers_are_reused(self, manager):
+        with manager.reader() as first:
+            pass
+        with manager.reader() as second:
+            pass
+
+        assert first is second
+        assert manager.stats()['open_readers'] == 1
+
+    def test_reader_sees_committed_data_while_writer_is_busy(self, manager):
+        with manager.writer() as conn:
+            conn.execute("CREATE TABLE items (id INTEGER)")
+            conn.execute("INSERT INTO items VALUES (1)")
+            conn.commit()
+
+        with manager.writer() as conn:
+            conn.execute("BEGIN")
+            conn.execute("INSERT INTO items VALUES (2)")
+
+            # WAL lets a reader run while the write transaction is open
+            with manager.reader() as reader:
+                assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+
+            conn.commit()
+
+        with manager.reader() as reader:
+            assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+
+    def test_read_pool_is_bounded(self, manager):
+        acquired = threading.Event()
+
+        with manager.reader(), manager.reader():
+            assert manager.stats()['open_readers'] == 2
+
+            def borrow():
+                with manager.reader():
+                    acquired.set()
+
+            thread = threading.Thread(target=borrow)
+            thread.start()
+            # The third borrower waits until a reader is returned
+            assert not acquired.wait(0.2)
+
+        thread.join(5)
+        assert acquired.is_set()
+        assert manager.stats()['open_readers'] == 2
+
+    def test_waiting_for_a_reader_times_out(self, manager, monkeypatch):
+        monkeypatch.setattr(db, "READ_TIMEOUT", 0.1)
+
+        with manager.reader(), manager.reader():
+            with pytest.raises(DatabaseBusyError, match="Database busy"):
+                with manager.reader():
+                    pass
+
+        # The pool still hands out readers once they are returned
+        with manager.reader() as reader:
+            assert reader.execute("SELECT 1").fetchone()[0] == 1
+
+    def test_writer_rolls_back_on_error(self, manager):
+        with manager.writer() as conn:
+            conn.execute("CREATE TABLE items (id INTEGER)")
+            conn.commit()
+
+        with pytest.raises(ValueError):
+            with manager.writer() as conn:
+                conn.execute("INSERT INTO items VALUES (1)")
+                raise ValueError("boom")
+
+        with manager.reader() as reader:
+            assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+
+    def test_in_memory_database_shares_one_connection(self):
+        manager = ConnectionManager(":memory:")
+        try:
+            with manager.writer() as conn:
+                conn.execute("CREATE TABLE items (id INTEGER)")
+            with manager.reader() as conn:
+                assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+        finally:
+            manager.close()
+
+    def test_readers_are_read_only(self, manager, tmp_path):
+        with manager.writer() as conn:
+            conn.execute("CREATE TABLE items (id INTEGER)")
+            conn.commit()
+
+        with manager.reader() as conn:
+            # Introspection still works
+            assert conn.execute("PRAGMA table_info(items)").fetchall()
+            assert conn.execute("SELECT name FROM pragma_table_info('items')").fetchall() == [('id',)]
+            assert conn.execute("PRAGMA schema_version").fetchone()[0] > 0
+
+            for statement in [
+                "INSERT INTO items VALUES (1)",
+                "DELETE FROM items",
+                "DROP TABLE items",
+                "CREATE TABLE other (id INTEGER)",
+                f"ATTACH DATABASE '{tmp_path / 'other.db'}' AS other",
+                "PRAGMA user_version = 5",
+            ]:
+                with pytest.raises(sqlite3.DatabaseError):
+                    conn.execute(statement)
+
+        with manager.writer() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+
+    def test_in_memory_reader_is_read_only_for_the_block(self):
+        manager = ConnectionManager(":memory:")
+        try:
+            with manager.writer() as conn:
+                conn.execute("CREATE TABLE items (id INTEGER)")
+            with manager.reader() as conn:
+                with pytest.raises(sqlite3.DatabaseError):
+                    conn.execute("INSERT INTO items VALUES (1)")
+            with manager.writer() as conn:
+                conn.execute("INSERT INTO items VALUES (1)")
+                assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+        finally:
+            manager.close()
+
+    def test_closed_manager_rejects_connections(self, manager):
+        manager.close()
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            with manager.reader():
+                pass
+
+    def test_get_connection_manager_is_shared_per_path(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+
+        assert get_connection_manager(path) is get_connection_manager(path)
+
+        first = get_connection_manager(path)
+        close_all_connections()
+        assert get_connection_manager(path) is not first
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import pytest
+from core.executors import (
+    BoundedExecutor,
+    ExecutorSaturatedError,
+    get_executor,
+    get_executor_stats,
+    run_blocking
+)
+
+
+class TestExecutors:
+
+    def test_run_blocking_runs_off_event_loop_thread(self):
+        # Blocking work must not run on the thread driving the event loop
+        async def main():
+            loop_thread = threading.get_ident()
+            worker_thread = await run_blocking("db", threading.get_ident)
+            return loop_thread, worker_thread
+
+        loop_thread, worker_thread = asyncio.run(main())
+
+        assert loop_thread != worker_thread
+
+    def test_run_blocking_passes_arguments_and_errors(self):
+        def divide(a, b=1):
+            return a / b
+
+        assert asyncio.run(run_blocking("db", divide, 6, b=3)) == 2
+
+        with pytest.raises(ZeroDivisionError):
+            asyncio.run(run_blocking("db", divide, 1, b=0))
+
+    def test_unknown_executor(self):
+        with pytest.raises(ValueError):
+            get_executor("nonexistent")
+
+    def test_executor_rejects_when_queue_full(self):
+        executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        try:
+            running = executor.submit(block)
+            started.wait(5)
+            queued = executor.submit(block)
+
+            assert executor.stats()['running'] == 1
+            assert executor.stats()['queued'] == 1
+
+            with pytest.raises(ExecutorSaturatedError):
+                executor.submit(block)
+            assert executor.stats()['rejected'] == 1
+        finally:
+            release.set()
+            running.result(5)
+            queued.result(5)
+            executor.shutdown()
+
+        assert executor.stats()['completed'] == 2
+        assert executor.stats()['queued'] == 0
+
+    def test_get_executor_stats_reports_all_pools(self):
+        stats = get_executor_stats()
+
+        assert set(stats) == {"db", "llm", "llm_calls", "ingest"}
+        for pool_stats in stats.values():
+            assert pool_stats['workers'] >= 1
+            assert pool_stats['queued'] >= 0
@@ -0,0 +1,145 @@
+import csv
+import io
+import json
+import pytest
+from core.export_processor import (
+    arrow_type_for_storage,
+    iter_arrow_chunks,
+    iter_csv_chunks,
+    iter_ndjson_chunks,
+    iter_parquet_chunks,
+    project_batches,
+    resolve_export_format
+)
+
+
+class TestExportProcessor:
+
+    def test_csv_header_is_sent_before_first_batch(self):
+        def batches():
+            raise AssertionError("batches read before header was sent")
+            yield []
+
+        chunks = iter_csv_chunks(['id', 'name'], batches())
+
+        assert next(chunks) == b'id,name\n'
+
+    def test_csv_one_chunk_per_batch(self):
+        batches = [[(1, 'a'), (2, None)], [(3, 'c,d')]]
+
+        chunks = list(iter_csv_chunks(['id', 'name'], batches))
+
+        assert len(chunks) == 3
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+        assert rows == [['id', 'name'], ['1', 'a'], ['2', ''], ['3', 'c,d']]
+
+    def test_csv_without_rows_is_header_only(self):
+        assert b''.join(iter_csv_chunks(['id'], [])) == b'id\n'
+
+    def test_project_batches_reorders_and_fills_missing(self):
+        batches = [[(1, 'a')], [(2, 'b')]]
+
+        projected = list(project_batches(['id', 'name'], batches, ['name', 'extra', 'id']))
+
+        assert projected == [[('a', None, 1)], [('b', None, 2)]]
+
+    def test_project_batches_passes_through_matching_columns(self):
+        batches = [[(1, 'a')]]
+
+        assert list(project_batches(['id', 'name'], batches, ['id', 'name'])) == batches
+
+    def test_ndjson_writes_one_object_per_row(self):
+        chunks = list(iter_ndjson_chunks(['id', 'name'], [[(1, 'a')], [(2, None)]]))
+
+        lines = b''.join(chunks).decode('utf-8').splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {'id': 1, 'name': 'a'},
+            {'id': 2, 'name': None}
+        ]
+
+    def test_resolve_export_format(self):
+        assert resolve_export_format().name == 'csv'
+        assert resolve_export_format('NDJSON').name == 'ndjson'
+        assert resolve_export_format(None, 'application/x-ndjson, */*').name == 'ndjson'
+        assert resolve_export_format(None, 'text/html, */*').name == 'csv'
+
+        with pytest.raises(ValueError) as exc_info:
+            resolve_export_format('xml')
+        assert "Unsupported export format" in str(exc_info.value)
+
+
+class TestColumnarExport:
+
+    @pytest.fixture(autouse=True)
+    def arrow(self):
+        return pytest.importorskip("pyarrow")
+
+    def test_arrow_stream_round_trip(self, arrow):
+        batches = [[(1, 'a', 1.5), (2, None, None)], [(3, 'c', 2.0)]]
+
+        data = b''.join(iter_arrow_chunks(['id', 'name', 'score'], batches))
+
+        table = arrow.ipc.open_stream(data).read_all()
+        assert table.schema.field('id').type == arrow.int64()
+        assert table.schema.field('score').type == arrow.float64()
+        assert table.column('name').to_pylist() == ['a', None, 'c']
+
+    def test_parquet_round_trip_one_row_group_per_batch(self, arrow):
+        import pyarrow.parquet as pq
+        batches = [[(1, 'a')], [(2, 'b')], [(3, 'c')]]
+
+        data = b''.join(iter_parquet_chunks(['id', 'name'], batches))
+
+        parquet_file = pq.ParquetFile(io.BytesIO(data))
+        assert parquet_file.metadata.num_row_groups == 3
+        assert parquet_file.read().to_pylist() == [
+            {'id': 1, 'name': 'a'},
+            {'id': 2, 'name': 'b'},
+            {'id': 3, 'name': 'c'}
+        ]
+
+    def test_columnar_export_without_rows_keeps_columns(self, arrow):
+        data = b''.join(iter_arrow_chunks(['id', 'name'], []))
+
+        assert arrow.ipc.open_stream(data).read_all().column_names == ['id', 'name']
+
+    def test_mixed_values_in_text_column_are_stringified(self, arrow):
+        # SQLite allows any value in any column; a column first seen as text
+        # keeps its type and later values are converted
+        batches = [[('a',), (None,)], [(5,), ('b',)]]
+
+        data = b''.join(iter_arrow_chunks(['value'], batches))
+
+        assert arrow.ipc.open_stream(data).read_all().column('value').to_pylist() == ['a', None, '5', 'b']
+
+    @pytest.mark.parametrize("encoder", [iter_arrow_chunks, iter_parquet_chunks])
+    def test_storage_classes_fix_types_of_mixed_columns(self, arrow, encoder):
+        # The first batch alone looks like int64 columns
+        batches = [[(1, 1), (2, 2)], [(2.5, 'N/A')]]
+        storage_classes = [{'integer', 'real'}, {'integer', 'text'}]
+
+        data = b''.join(encoder(['score', 'value'], batches, storage_classes))
+
+        if encoder is iter_arrow_chunks:
+            table = arrow.ipc.open_stream(data).read_all()
+        else:
+            import pyarrow.parquet as pq
+            table = pq.read_table(io.BytesIO(data))
+
+        assert table.schema.field('score').type == arrow.float64()
+        assert table.column('score').to_pylist() == [1.0, 2.0, 2.5]
+        assert table.schema.field('value').type == arrow.string()
+        assert table.column('value').to_pylist() == ['1', '2', 'N/A']
+
+    def test_storage_classes_map_to_arrow_types(self, arrow):
+        assert arrow_type_for_storage({'integer'}) == arrow.int64()
+        assert arrow_type_for_storage({'real'}) == arrow.float64()
+        assert arrow_type_for_storage({'blob'}) == arrow.binary()
+        assert arrow_type_for_storage({'text', 'blob'}) == arrow.string()
+        assert arrow_type_for_storage(set()) == arrow.string()
+
+    def test_real_values_are_never_truncated_into_an_inferred_integer_column(self, arrow):
+        batches = [[(1,), (2,)], [(2.5,)]]
+
+        with pytest.raises(ValueError, match="REAL values"):
+            b''.join(iter_parquet_chunks(['score'], batches))
@@ -1,6 +1,9 @@
+import io
+import json
+import sqlite3
 import pytest
 from pathlib import Path
-from core.file_processor import convert_csv_to_sqlite, convert_json_to_sqlite, convert_jsonl_to_sqlite, flatten_json_object, discover_jsonl_fields
+from core.file_processor import convert_csv_to_sqlite, convert_json_to_sqlite, convert_jsonl_to_sqlite, flatten_json_object, _iter_json_array_objects
 
 
 @pytest.fixture
@@ -86,6 +89,152 @@ class TestFileProcessor:
         
         assert "Error converting CSV to SQLite" in str(exc_info.value)
     
+    def test_convert_csv_to_sqlite_chunked_file_object(self, tmp_path):
+        # Stream a file object in chunks smaller than the file
+        csv_data = b"id,name,score\n" + b"".join(
+            f"{i},user{i},{i * 1.5}\n".encode() for i in range(1, 26)
+        )
+        db_path = str(tmp_path / "test.db")
+        
+        result = convert_csv_to_sqlite(io.BytesIO(csv_data), "scores", db_path, chunk_size=4)
+        
+        assert result['row_count'] == 25
+        assert result['schema'] == {'id': 'INTEGER', 'name': 'TEXT', 'score': 'REAL'}
+        
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT id, name, score FROM scores ORDER BY id").fetchall()
+        conn.close()
+        assert len(rows) == 25
+        assert rows[-1] == (25, 'user25', 37.5)
+    
+    def test_convert_csv_to_sqlite_failure_keeps_existing_table(self, tmp_path, test_assets_dir):
+        # A failed replace must roll back and leave the previous table in place
+        db_path = str(tmp_path / "test.db")
+        with open(test_assets_dir / "test_users.csv", 'rb') as f:
+            convert_csv_to_sqlite(f.read(), "users", db_path)
+        
+        with open(test_assets_dir / "invalid.csv", 'rb') as f:
+            with pytest.raises(Exception):
+                convert_csv_to_sqlite(f.read(), "users", db_path, chunk_size=2)
+        
+        conn = sqlite3.connect(db_path)
+        count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        conn.close()
+        assert count == 4
+    
+    def test_convert_csv_to_sqlite_typed_columns(self, tmp_path):
+        # Dates, booleans and categories get proper types; hints override inference
+        csv_data = (
+            b"Order Id,placed,paid,status,zip,amount\n"
+            b"1,2024-01-31,true,new,00501,\n"
+            b"2,2024-02-01,false,paid,02134,12.5\n"
+            b"3,2024-02-02,true,new,10001,3\n"
+        )
+        db_path = str(tmp_path / "test.db")
+        
+        result = convert_csv_to_sqlite(
+            csv_data, "orders", db_path, schema_hints={'Order Id': 'text', 'zip': 'text'}
+        )
+        
+        assert result['schema'] == {
+            'order_id': 'TEXT', 'placed': 'DATE', 'paid': 'INTEGER',
+            'status': 'TEXT', 'zip': 'TEXT', 'amount': 'REAL'
+        }
+        
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT order_id, placed, paid, status, zip, amount FROM orders").fetchall()
+        conn.close()
+        assert rows[0] == ('1', '2024-01-31', 1, 'new', '00501', None)
+        assert rows[1] == ('2', '2024-02-01', 0, 'paid', '02134', 12.5)
+    
+    def test_convert_csv_to_sqlite_invalid_schema_hint(self, tmp_path):
+        with pytest.raises(Exception) as exc_info:
+            convert_csv_to_sqlite(b"id\n1\n", "ids", str(tmp_path / "test.db"), schema_hints={'id': 'uuid'})
+        assert "Unknown type 'uuid'" in str(exc_info.value)
+    
+    def test_convert_csv_to_sqlite_append(self, tmp_path):
+        db_path = str(tmp_path / "test.db")
+        convert_csv_to_sqlite(b"id,score\n1,1.5\n2,2.5\n", "scores", db_path)
+        
+        result = convert_csv_to_sqlite(b"id,score,note\n3,3,late\n", "scores", db_path, mode='append')
+        
+        assert result['rows_written'] == 1
+        assert result['rows_added'] == 1
+        # Counted by the server from its cached count, not rescanned here
+        assert result['row_count'] is None
+        assert result['schema'] == {'id': 'INTEGER', 'score': 'REAL', 'note': 'TEXT'}
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT id, score, note FROM scores ORDER BY id").fetchall()
+        conn.close()
+        assert rows == [(1, 1.5, None), (2, 2.5, None), (3, 3.0, 'late')]
+    
+    def test_convert_csv_to_sqlite_upsert(self, tmp_path):
+        db_path = str(tmp_path / "test.db")
+        convert_csv_to_sqlite(b"id,name,score\n1,ada,10\n2,grace,20\n", "people", db_path)
+        
+        result = convert_csv_to_sqlite(
+            b"ID,score\n2,25\n3,30\n", "people", db_path, mode='upsert', key_columns=['ID']
+        )
+        
+        assert result['rows_written'] == 2
+        # One row updated, one added
+        assert result['rows_added'] == 1
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT id, name, score FROM people ORDER BY id").fetchall()
+        conn.close()
+        # Columns missing from the upload keep their values
+        assert rows == [(1, 'ada', 10), (2, 'grace', 25), (3, None, 30)]
+    
+    def test_convert_csv_to_sqlite_incompatible_append(self, tmp_path):
+        db_path = str(tmp_path / "test.db")
+        convert_csv_to_sqlite(b"id,score\n1,1\n", "scores", db_path)
+        
+        with pytest.raises(Exception) as exc_info:
+            convert_csv_to_sqlite(b"id,score\n2,high\n", "scores", db_path, mode='append')
+        assert "Column 'score' is INTEGER" in str(exc_info.value)
+        
+        with pytest.raises(Exception) as exc_info:
+            convert_csv_to_sqlite(b"id,score\n2,2\n", "scores", db_path, mode='upsert', key_columns=['name'])
+        assert "Key columns not found in upload: name" in str(exc_info.value)
+        
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0] == 1
+        conn.close()
+    
+    def test_convert_csv_to_sqlite_upsert_needs_unique_keys(self, tmp_path):
+        db_path = str(tmp_path / "test.db")
+        convert_csv_to_sqlite(b"id,score\n1,1\n1,2\n", "scores", db_path)
+        
+        with pytest.raises(Exception) as exc_info:
+            convert_csv_to_sqlite(b"id,score\n1,3\n", "scores", db_path, mode='upsert', key_columns=['id'])
+        assert "not unique" in str(exc_info.value)
+        
+        with pytest.raises(Exception) as exc_info:
+            convert_csv_to_sqlite(b"id\n1\n", "scores", db_path, mode='merge')
+        assert "Unknown ingest mode 'merge'" in str(exc_info.value)
+    
+    def test_commit_batches_keeps_committed_chunks(self, tmp_path):
+        """Test that an append committed chunk by chunk keeps the chunks written before a failure"""
+        db_path = str(tmp_path / "test.db")
+        convert_csv_to_sqlite(b"id\n0\n", "scores", db_path)
+        
+        def fail_after_two_chunks(rows_written):
+            if rows_written >= 4:
+                raise RuntimeError("cancelled")
+        
+        with pytest.raises(Exception):
+            convert_csv_to_sqlite(
+                b"id\n" + b"".join(f"{i}\n".encode() for i in range(1, 11)), "scores", db_path,
+                chunk_size=2, mode='append', progress=fail_after_two_chunks, commit_batches=True
+            )
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0] == 5
+        conn.close()
+        
+        with pytest.raises(Exception) as exc_info:
+            convert_csv_to_sqlite(b"id\n1\n", "scores", db_path, commit_batches=True)
+        assert "Only appends and upserts can be committed batch by batch" in str(exc_info.value)
+    
     def test_convert_json_to_sqlite_success(self, test_db, test_assets_dir):
         # Load real JSON file
         json_file = test_assets_dir / "test_products.json"
@@ -149,6 +298,43 @@ class TestFileProcessor:
         
         assert "JSON array is empty" in str(exc_info.value)
     
+    def test_convert_json_to_sqlite_streams_nested_objects(self, tmp_path):
+        """Test that a JSON array is streamed in batches and nested objects are flattened"""
+        db_path = str(tmp_path / "test.db")
+        json_data = b'[' + b','.join(
+            f'{{"id": {i}, "user": {{"name": "user{i}"}}, "tags": ["a", "b"]}}'.encode() for i in range(10)
+        ) + b']'
+        batches = []
+        
+        result = convert_json_to_sqlite(io.BytesIO(json_data), "events", db_path, chunk_size=4, progress=batches.append)
+        
+        assert result['row_count'] == 10
+        assert list(result['schema']) == ['id', 'user__name', 'tags_0', 'tags_1']
+        assert batches == [4, 8, 10]
+    
+    def test_iter_json_array_objects_across_reads(self):
+        """Test that elements, numbers and multi-byte characters split across reads are parsed whole"""
+        objects = [{"id": 12345678, "name": "Zoë ✓", "nested": {"values": [1.5, None, True]}}] * 20
+        json_data = ('\ufeff [ ' + ' , '.join(json.dumps(obj, ensure_ascii=False) for obj in objects) + ' ]\n').encode()
+        
+        for read_size in (1, 3, 7, 64, len(json_data)):
+            assert list(_iter_json_array_objects(io.BytesIO(json_data), read_size=read_size)) == objects
+        assert list(_iter_json_array_objects(b'[]')) == []
+    
+    @pytest.mark.parametrize("json_data,message", [
+        (b'[{"a": 1},]', "Invalid JSON"),
+        (b'[{"a": 1}', "unterminated array"),
+        (b'[{"a": 1} {"a": 2}]', "expected ',' or ']'"),
+        (b'[{"a": 1}, {"a": tru}]', "Invalid JSON"),
+        (b'[{"a": 1}] [', "extra data after the array"),
+        (b'[{"a": 1}, 2]', "JSON must be an array of objects"),
+        (b'[{"a": "\xff"}]', "not valid UTF-8"),
+    ])
+    def test_iter_json_array_objects_invalid(self, json_data, message):
+        with pytest.raises(ValueError) as exc_info:
+            list(_iter_json_array_objects(io.BytesIO(json_data), read_size=4))
+        assert message in str(exc_info.value)
+    
     def test_flatten_json_object_nested_dict(self):
         """Test flattening nested dictionary objects"""
         obj = {
@@ -207,47 +393,6 @@ class TestFileProcessor:
         assert flatten_json_object(True) == {"": True}
         assert flatten_json_object(None) == {"": None}
     
-    def test_discover_jsonl_fields_basic(self):
-        """Test field discovery with basic JSONL content"""
-        jsonl_content = b'{"name": "John", "age": 30}\n{"name": "Jane", "age": 25, "city": "NYC"}'
-        
-        fields = discover_jsonl_fields(jsonl_content)
-        
-        assert fields == {"name", "age", "city"}
-    
-    def test_discover_jsonl_fields_nested(self):
-        """Test field discovery with nested structures"""
-        jsonl_content = b'{"user": {"name": "John", "profile": {"age": 30}}}\n{"user": {"name": "Jane", "profile": {"city": "NYC"}}}'
-        
-        fields = discover_jsonl_fields(jsonl_content)
-        
-        assert fields == {"user__name", "user__profile__age", "user__profile__city"}
-    
-    def test_discover_jsonl_fields_arrays(self):
-        """Test field discovery with arrays"""
-        jsonl_content = b'{"items": ["a", "b"]}\n{"items": ["c", "d", "e"]}'
-        
-        fields = discover_jsonl_fields(jsonl_content)
-        
-        assert fields == {"items_0", "items_1", "items_2"}
-    
-    def test_discover_jsonl_fields_invalid_json(self):
-        """Test field discovery with invalid JSON"""
-        jsonl_content = b'{"valid": "json"}\n{invalid json}'
-        
-        with pytest.raises(ValueError) as exc_info:
-            discover_jsonl_fields(jsonl_content)
-        
-        assert "Invalid JSON on line 2" in str(exc_info.value)
-    
-    def test_discover_jsonl_fields_empty_lines(self):
-        """Test field discovery with empty lines"""
-        jsonl_content = b'{"name": "John"}\n\n{"name": "Jane"}\n'
-        
-        fields = discover_jsonl_fields(jsonl_content)
-        
-        assert fields == {"name"}
-    
     def test_convert_jsonl_to_sqlite_success(self, test_db, test_assets_dir):
         """Test successful JSONL to SQLite conversion with real file"""
         jsonl_file = test_assets_dir / "sample_data.jsonl"
@@ -392,4 +537,72 @@ class TestFileProcessor:
         assert jane_data is not None
         assert jane_data['age'] is None
         assert jane_data['city'] == 'NYC'
-        assert jane_data['profile__bio'] == 'Engineer'
\ No newline at end of file
+        assert jane_data['profile__bio'] == 'Engineer'
+    
+    def test_convert_jsonl_to_sqlite_schema_evolves_across_batches(self, tmp_path):
+        """Test that keys first seen in later batches are added as new columns"""
+        jsonl_data = (
+            b'{"id": 1, "name": "John"}\n'
+            b'{"id": 2, "name": "Jane"}\n'
+            b'{"id": 3, "profile": {"city": "NYC"}, "score": 9.5}\n'
+        )
+        db_path = str(tmp_path / "test.db")
+        
+        result = convert_jsonl_to_sqlite(io.BytesIO(jsonl_data), "people", db_path, chunk_size=2)
+        
+        assert result['row_count'] == 3
+        assert list(result['schema']) == ['id', 'name', 'profile__city', 'score']
+        assert result['schema']['score'] == 'REAL'
+        
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT id, name, profile__city, score FROM people ORDER BY id").fetchall()
+        conn.close()
+        assert rows == [(1, 'John', None, None), (2, 'Jane', None, None), (3, None, 'NYC', 9.5)]
+    
+    def test_convert_jsonl_to_sqlite_typed_columns(self, tmp_path):
+        """Test that dates are stored as ISO text and hints override inference"""
+        jsonl_data = (
+            b'{"id": 1, "seen": "2024-01-31T10:00:00+02:00", "day": "31/01/2024", "ok": true}\n'
+            b'{"id": 2, "seen": "2024-02-01T09:00:00Z", "day": "01/02/2024", "ok": false}\n'
+        )
+        db_path = str(tmp_path / "test.db")
+        
+        result = convert_jsonl_to_sqlite(io.BytesIO(jsonl_data), "visits", db_path, schema_hints={'day': 'date'})
+        
+        assert result['schema'] == {'id': 'INTEGER', 'seen': 'DATETIME', 'day': 'DATE', 'ok': 'INTEGER'}
+        
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT seen, day, ok FROM visits ORDER BY id").fetchall()
+        conn.close()
+        assert rows == [('2024-01-31 08:00:00', '2024-01-31', 1), ('2024-02-01 09:00:00', '2024-01-02', 0)]
+    
+    def test_convert_jsonl_to_sqlite_upsert(self, tmp_path):
+        """Test that upserted records update matching rows and add new columns"""
+        db_path = str(tmp_path / "test.db")
+        convert_jsonl_to_sqlite(b'{"id": 1, "name": "John", "age": 30}\n{"id": 2, "name": "Jane", "age": 25}', "people", db_path)
+        
+        result = convert_jsonl_to_sqlite(
+            b'{"id": 2, "age": 26, "city": "NYC"}\n{"id": 3, "name": "Bob"}',
+            "people", db_path, mode='upsert', key_columns=['id']
+        )
+        
+        assert result['rows_added'] == 1
+        assert list(result['schema']) == ['id', 'name', 'age', 'city']
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT id, name, age, city FROM people ORDER BY id").fetchall()
+        conn.close()
+        assert rows == [(1, 'John', 30, None), (2, 'Jane', 26, 'NYC'), (3, 'Bob', None, None)]
+    
+    def test_convert_jsonl_to_sqlite_invalid_json_keeps_existing_table(self, tmp_path):
+        """Test that a parse error late in the file rolls back the whole upload"""
+        db_path = str(tmp_path / "test.db")
+        convert_jsonl_to_sqlite(b'{"name": "John"}', "people", db_path)
+        
+        with pytest.raises(Exception) as exc_info:
+            convert_jsonl_to_sqlite(b'{"name": "Jane"}\n{"name": "Bob"}\n{broken', "people", db_path, chunk_size=1)
+        assert "Invalid JSON on line 3" in str(exc_info.value)
+        
+        conn = sqlite3.connect(db_path)
+        names = conn.execute("SELECT name FROM people").fetchall()
+        conn.close()
+        assert names == [('John',)]
@@ -0,0 +1,157 @@
+import sqlite3
+import pytest
+from core import index_advisor
+from core.db import get_connection_manager
+from core.index_advisor import (
+    auto_index_name,
+    create_recommended_indexes,
+    extract_indexable_columns,
+    get_index_recommendations,
+    record_query_usage
+)
+from core.insights import refresh_table_insights
+from core.sql_processor import get_database_schema
+from core.sql_security import validate_identifier
+
+TABLES = {
+    'orders': ('orders', {'id': 'id', 'customer_id': 'customer_id', 'status': 'status', 'total': 'total'}),
+    'customers': ('Customers', {'id': 'id', 'name': 'name', 'country': 'country'}),
+}
+
+
+@pytest.fixture
+def orders(monkeypatch):
+    """A 1000-row table, which counts as large for these tests"""
+    monkeypatch.setattr(index_advisor, "INDEX_ADVISOR_MIN_ROWS", 100)
+    with get_connection_manager().writer() as conn:
+        conn.execute("CREATE TABLE orders (id INTEGER, customer_id INTEGER, status TEXT, total REAL)")
+        conn.executemany(
+            "INSERT INTO orders VALUES (?, ?, ?, ?)",
+            [(i, i % 200, ["new", "paid"][i % 2], i * 1.5) for i in range(1000)]
+        )
+        conn.commit()
+        refresh_table_insights(conn, "orders")
+
+
+def run_times(sql, times=3):
+    return [record_query_usage(sql) for _ in range(times)]
+
+
+class TestExtractIndexableColumns:
+
+    def test_filters(self):
+        columns = extract_indexable_columns("SELECT * FROM orders WHERE status = 'paid' AND total > 10", TABLES)
+        assert columns == {('orders', 'status'): {'filter'}, ('orders', 'total'): {'filter'}}
+
+    def test_joins_with_aliases(self):
+        columns = extract_indexable_columns(
+            "SELECT c.name, SUM(o.total) FROM orders o JOIN customers AS c ON o.customer_id = c.id "
+            "WHERE c.country = 'NZ' GROUP BY c.name ORDER BY 2 DESC",
+            TABLES
+        )
+        assert columns == {
+            ('orders', 'customer_id'): {'join'},
+            ('Customers', 'id'): {'join'},
+            ('Customers', 'country'): {'filter'},
+            ('Customers', 'name'): {'group'},
+        }
+
+    def test_using_and_subqueries(self):
+        columns = extract_indexable_columns(
+            "SELECT * FROM orders JOIN customers USING (id) "
+            "WHERE customer_id IN (SELECT id FROM customers WHERE country = 'NZ') ORDER BY total",
+            TABLES
+        )
+        assert columns[('orders', 'id')] == {'join'}
+        assert columns[('Customers', 'id')] == {'join'}
+        assert columns[('Customers', 'country')] == {'filter'}
+        assert columns[('orders', 'customer_id')] == {'filter'}
+        assert columns[('orders', 'total')] == {'order'}
+
+    def test_ignores_projections_functions_and_unknown_names(self):
+        columns = extract_indexable_columns(
+            "SELECT status, total FROM orders WHERE lower(status) = 'x' ORDER BY missing",
+            TABLES
+        )
+        assert columns == {('orders', 'status'): {'filter'}}
+
+
+class TestIndexAdvisor:
+
+    def test_hot_columns_are_recommended(self, orders):
+        assert run_times("SELECT * FROM orders WHERE customer_id = 5") == [False, False, True]
+        run_times("SELECT * FROM orders WHERE total > 10", times=2)
+
+        recommendations = get_index_recommendations()
+        assert [(r['column_name'], r['hits'], r['clauses']) for r in recommendations] == [
+            ('customer_id', 3, ['filter'])
+        ]
+        assert recommendations[0]['index_name'] == "idx_auto_orders_customer_id"
+
+    def test_unselective_and_small_tables_are_skipped(self, orders, monkeypatch):
+        # status has two values (known from the stored insights)
+        run_times("SELECT * FROM orders WHERE status = 'paid'")
+        assert get_index_recommendations() == []
+
+        run_times("SELECT * FROM orders WHERE customer_id = 5")
+        monkeypatch.setattr(index_advisor, "INDEX_ADVISOR_MIN_ROWS", 5000)
+        assert get_index_recommendations() == []
+
+    def test_create_indexes_and_analyze(self, orders):
+        run_times("SELECT * FROM orders WHERE customer_id = 5")
+
+        assert create_recommended_indexes() == ["idx_auto_orders_customer_id"]
+
+        # EXPLAIN doesn't reload a changed schema, so ask the writer (which made the change)
+        with get_connection_manager().writer() as conn:
+            plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM orders WHERE customer_id = 5").fetchall()
+            assert "idx_auto_orders_customer_id" in plan[0][-1]
+            stats = conn.execute("SELECT idx FROM sqlite_stat1 WHERE tbl = 'orders'").fetchall()
+            assert ("idx_auto_orders_customer_id",) in stats
+
+        # Already indexed, so no longer recommended
+        assert get_index_recommendations() == []
+
+    def test_size_cap(self, orders):
+        run_times("SELECT * FROM orders WHERE customer_id = 5")
+
+        assert create_recommended_indexes(max_bytes=100) == []
+        assert len(get_index_recommendations()) == 1
+
+    def test_failed_index_does_not_stop_the_others(self, orders, monkeypatch):
+        run_times("SELECT * FROM orders WHERE customer_id = 5 AND total > 10")
+        estimate = index_advisor._estimate_index_bytes
+
+        def fail_for_total(conn, table_name, column_name, row_count):
+            if column_name == 'total':
+                raise sqlite3.OperationalError("disk I/O error")
+            return estimate(conn, table_name, column_name, row_count)
+        monkeypatch.setattr(index_advisor, "_estimate_index_bytes", fail_for_total)
+
+        assert create_recommended_indexes() == ["idx_auto_orders_customer_id"]
+
+    def test_analyzed_tables_take_row_counts_from_sqlite_stat1(self, orders):
+        run_times("SELECT * FROM orders WHERE customer_id = 5")
+        create_recommended_indexes()
+        with get_connection_manager().writer() as conn:
+            conn.execute("UPDATE sqlite_stat1 SET stat = '5000 25' WHERE tbl = 'orders'")
+            conn.commit()
+
+        assert get_database_schema()['tables']['orders']['row_count'] == 5000
+
+
+class TestAutoIndexName:
+
+    def test_short_names_are_kept(self):
+        assert auto_index_name("orders", "customer_id") == "idx_auto_orders_customer_id"
+
+    def test_long_or_unusual_names_are_shortened_and_hashed(self):
+        long_name = auto_index_name("t" * 80, "c" * 80)
+        spaced = auto_index_name("order items", "unit price")
+
+        assert len(long_name) == index_advisor.MAX_AUTO_INDEX_NAME_LENGTH
+        assert long_name != auto_index_name("t" * 80, "c" * 81)
+        assert spaced.startswith("idx_auto_order_items_unit_price_")
+        assert spaced != auto_index_name("order_items", "unit_price")
+        for name in (long_name, spaced):
+            assert validate_identifier(name, "index")
@@ -0,0 +1,312 @@
+import bz2
+import gzip
+import io
+import os
+import tarfile
+import time
+import zipfile
+import pytest
+from core import compression, db, ingest_jobs
+from core.db import get_connection_manager
+from core.executors import ExecutorSaturatedError
+from core.sql_processor import get_database_schema
+from core.ingest_jobs import (
+    cancel_job,
+    create_job,
+    get_job,
+    list_jobs,
+    publish_job,
+    recover_jobs,
+    run_job,
+    submit_batch,
+    submit_job
+)
+
+CSV = b"id,name\n" + b"".join(f"{i},user{i}\n".encode() for i in range(100))
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "INGEST_SPOOL_DIR", str(tmp_path))
+
+
+def table_rows(table_name):
+    with get_connection_manager().reader() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+
+class TestIngestJobs:
+
+    def test_run_job(self):
+        job_id = create_job(io.BytesIO(CSV), "users.csv", "users", "csv")
+        job = get_job(job_id)
+        assert job['status'] == 'queued'
+        assert job['bytes_total'] == len(CSV)
+        spool_path = ingest_jobs._execute("SELECT spool_path FROM ingest_jobs")[0][0]
+
+        assert run_job(job_id) == 'staged'
+        staging_path = ingest_jobs._execute("SELECT staging_path FROM ingest_jobs")[0][0]
+        assert os.path.exists(staging_path)
+        assert get_job(job_id)['status'] == 'running'
+        assert publish_job(job_id) == 'succeeded'
+
+        job = get_job(job_id)
+        assert job['status'] == 'succeeded'
+        assert job['bytes_parsed'] == len(CSV)
+        assert job['rows_written'] == 100
+        assert job['bytes_per_second'] > 0
+        assert job['result']['row_count'] == 100
+        assert job['result']['table_schema'] == {'id': 'INTEGER', 'name': 'TEXT'}
+        assert table_rows("users") == 100
+        assert not os.path.exists(spool_path)
+        assert not os.path.exists(staging_path)
+        # A job only runs once
+        assert run_job(job_id) is None
+        assert publish_job(job_id) is None
+
+    @pytest.mark.parametrize("file_name,content", [
+        ("users.csv.gz", gzip.compress(CSV)),
+        ("users.jsonl.bz2", bz2.compress(b"".join(f'{{"id": {i}}}\n'.encode() for i in range(100)))),
+        ("users.json.gz", gzip.compress(b"[" + b",".join(f'{{"id": {i}}}'.encode() for i in range(100)) + b"]")),
+    ])
+    def test_compressed_upload(self, file_name, content):
+        assert ingest_jobs.upload_format(file_name) == file_name.split('.')[1]
+        assert ingest_jobs.table_name_for(file_name) == "users"
+        job_id = create_job(io.BytesIO(content), file_name, "users", ingest_jobs.upload_format(file_name))
+
+        assert run_job(job_id) == 'staged'
+        assert publish_job(job_id) == 'succeeded'
+        job = get_job(job_id)
+        # Progress is measured in uploaded (compressed) bytes
+        assert job['bytes_parsed'] == job['bytes_total'] == len(content)
+        assert job['rows_written'] == 100
+        assert table_rows("users") == 100
+
+    def test_zstd_upload_needs_zstandard(self, monkeypatch):
+        monkeypatch.setattr(compression, "zstandard", None)
+
+        with pytest.raises(ValueError, match="pip install zstandard"):
+            create_job(io.BytesIO(b"data"), "users.csv.zst", "users", "csv")
+        with pytest.raises(ValueError, match="pip install zstandard"):
+            submit_batch([("users.csv.zst", io.BytesIO(b"data"))])
+        assert list_jobs() == []
+
+    def test_corrupt_compressed_upload(self):
+        job_id = create_job(io.BytesIO(b"not gzip"), "users.csv.gz", "users", "csv")
+
+        assert run_job(job_id) == 'failed'
+        assert "gzip" in get_job(job_id)['error'].lower()
+
+    def test_append_job_writes_directly(self):
+        job_id = create_job(io.BytesIO(CSV), "users.csv", "users", "csv", options={'mode': 'append'})
+
+        assert run_job(job_id) == 'written'
+        assert table_rows("users") == 100
+        assert publish_job(job_id) == 'succeeded'
+        job = get_job(job_id)
+        assert job['rows_written'] == 100
+        assert job['result']['row_count'] == 100
+
+    def test_append_and_upsert_add_to_the_cached_row_count(self):
+        job_id = create_job(io.BytesIO(CSV), "users.csv", "users", "csv")
+        run_job(job_id)
+        publish_job(job_id)
+        # Rows the cache doesn't know about show that the table isn't recounted
+        with get_connection_manager().writer() as conn:
+            conn.execute("INSERT INTO users VALUES (1000, 'unseen')")
+            conn.commit()
+
+        append = create_job(io.BytesIO(b"id,name\n100,new\n"), "users.csv", "users", "csv", options={'mode': 'append'})
+        assert run_job(append) == 'written'
+        assert publish_job(append) == 'succeeded'
+        assert get_job(append)['result']['row_count'] == 101
+
+        upsert = create_job(
+            io.BytesIO(b"id,name\n100,renamed\n101,newer\n"), "users.csv", "users", "csv",
+            options={'mode': 'upsert', 'key_columns': ['id']}
+        )
+        assert run_job(upsert) == 'written'
+        assert publish_job(upsert) == 'succeeded'
+        assert get_job(upsert)['result']['row_count'] == 102
+        assert get_database_schema()['tables']['users']['row_count'] == 102
+        assert table_rows("users") == 103
+
+    def test_publish_during_append(self, monkeypatch):
+        monkeypatch.setenv("SQLITE_BUSY_TIMEOUT", "100")
+        monkeypatch.setattr(db, "WRITER_BUSY_TIMEOUT", 100)
+        staged = create_job(io.BytesIO(CSV), "users.csv", "users", "csv")
+        assert run_job(staged) == 'staged'
+        run_job(create_job(io.BytesIO(b"id\n0\n"), "events.csv", "events", "csv", options={'mode': 'append'}))
+
+        # A second path to the same file gets its own connection, like a worker process
+        worker_path = os.path.join(os.path.dirname(db.DATABASE_PATH), ".", os.path.basename(db.DATABASE_PATH))
+        append = create_job(
+            io.BytesIO(CSV), "events.csv", "events", "csv",
+            options={'mode': 'append', 'chunk_size': 10}, db_path=worker_path
+        )
+        published = []
+        report = ingest_jobs._JobProgress.__call__
+        def publish_then_report(self, rows_written):
+            if not published:
+                published.append(publish_job(staged))
+            report(self, rows_written)
+        monkeypatch.setattr(ingest_jobs._JobProgress, "__call__", publish_then_report)
+
+        assert run_job(append) == 'written'
+        assert published == ['succeeded']
+        assert table_rows("users") == 100
+        assert table_rows("events") == 101
+
+    def test_cancel_staged_job(self):
+        job_id = create_job(io.BytesIO(CSV), "users.csv", "users", "csv")
+        assert run_job(job_id) == 'staged'
+
+        cancel_job(job_id)
+        assert publish_job(job_id) == 'cancelled'
+        assert get_job(job_id)['status'] == 'cancelled'
+        with get_connection_manager().reader() as conn:
+            assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'users'").fetchone() is None
+
+    def test_failed_job(self):
+        job_id = create_job(
+            io.BytesIO(b"id\n1\n"), "users.csv", "users", "csv",
+            options={'mode': 'upsert', 'key_columns': ['name']}
+        )
+
+        assert run_job(job_id) == 'failed'
+        job = get_job(job_id)
+        assert "Key columns not found in upload: name" in job['error']
+        assert job['mode'] == 'upsert'
+
+    def test_cancel_queued_job(self):
+        job_id = create_job(io.BytesIO(CSV), "users.csv", "users", "csv")
+
+        assert cancel_job(job_id)['status'] == 'cancelled'
+        assert run_job(job_id) is None
+        assert cancel_job("missing") is None
+
+    def test_cancel_running_job_keeps_previous_table(self, monkeypatch):
+        previous = create_job(io.BytesIO(b"id\n1\n"), "users.csv", "users", "csv")
+        run_job(previous)
+        publish_job(previous)
+        job_id = create_job(io.BytesIO(CSV), "users.csv", "users", "csv")
+
+        report = ingest_jobs._JobProgress.__call__
+        def cancel_then_report(self, rows_written):
+            cancel_job(job_id)
+            report(self, rows_written)
+        monkeypatch.setattr(ingest_jobs._JobProgress, "__call__", cancel_then_report)
+
+        assert run_job(job_id) == 'cancelled'
+        assert get_job(job_id)['status'] == 'cancelled'
+        assert table_rows("users") == 1
+
+    def test_queue_limit(self, monkeypatch):
+        monkeypatch.setattr(ingest_jobs, "INGEST_JOB_QUEUE", 1)
+        create_job(io.BytesIO(CSV), "a.csv", "a", "csv")
+
+        with pytest.raises(ExecutorSaturatedError):
+            create_job(io.BytesIO(CSV), "b.csv", "b", "csv")
+        assert [job['file_name'] for job in list_jobs()] == ["a.csv"]
+
+    def test_recover_jobs(self, monkeypatch):
+        queued = create_job(io.BytesIO(CSV), "a.csv", "a", "csv")
+        running = create_job(io.BytesIO(CSV), "b.csv", "b", "csv")
+        ingest_jobs._execute("UPDATE ingest_jobs SET status = 'running' WHERE job_id = ?", (running,))
+        started = []
+        monkeypatch.setattr(ingest_jobs, "start_job", started.append)
+
+        recover_jobs()
+
+        assert started == [queued]
+        assert get_job(running)['status'] == 'failed'
+        assert get_job(running)['error'] == 'Interrupted by a server restart'
+
+
+def zip_archive(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+def tar_archive(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    buffer.seek(0)
+    return buffer
+
+
+class TestSubmitBatch:
+
+    @pytest.fixture(autouse=True)
+    def started(self, monkeypatch):
+        started = []
+        monkeypatch.setattr(ingest_jobs, "start_job", started.append)
+        return started
+
+    def test_files_and_archives(self, started):
+        archive = zip_archive({
+            "data/Sales Q1.csv": CSV,
+            "data/events.jsonl.gz": gzip.compress(b'{"id": 1}\n{"id": 2}\n'),
+            "data/readme.txt": b"ignored",
+            "__MACOSX/data/._orders.csv": b"ignored",
+        })
+        tarball = tar_archive({"export/products.json": b'[{"id": 1}]', "export/.hidden.csv": b"id\n1\n"})
+
+        jobs = submit_batch([("users.csv", io.BytesIO(CSV)), ("data.zip", archive), ("export.tar.gz", tarball)])
+
+        assert [(job['file_name'], job['table_name']) for job in jobs] == [
+            ("users.csv", "users"),
+            ("data/Sales Q1.csv", "sales_q1"),
+            ("data/events.jsonl.gz", "events"),
+            ("export/products.json", "products"),
+        ]
+        assert started == [job['job_id'] for job in jobs]
+
+        for job in jobs:
+            assert run_job(job['job_id']) == 'staged'
+            assert publish_job(job['job_id']) == 'succeeded'
+        assert table_rows("sales_q1") == 100
+        assert table_rows("events") == 2
+        assert table_rows("products") == 1
+
+    def test_duplicate_tables_are_rejected(self, started):
+        archive = zip_archive({"a/users.csv": CSV, "b/users.csv": CSV})
+
+        with pytest.raises(ValueError, match="would both load table 'users'"):
+            submit_batch([("data.zip", archive)])
+        assert started == []
+        assert [job['status'] for job in list_jobs()] == ['cancelled']
+
+    def test_unsupported_files(self):
+        with pytest.raises(ValueError, match="Unsupported file: notes.txt"):
+            submit_batch([("users.csv", io.BytesIO(CSV)), ("notes.txt", io.BytesIO(b""))])
+        with pytest.raises(ValueError, match="No .csv, .json or .jsonl files found"):
+            submit_batch([("empty.zip", zip_archive({"readme.txt": b""}))])
+        assert list_jobs() == []
+
+
+class TestIngestWorkerPool:
+
+    @pytest.fixture(autouse=True)
+    def job_pool(self):
+        yield
+        ingest_jobs.shutdown_job_pool()
+
+    def test_submit_job(self):
+        job = submit_job(io.BytesIO(CSV), "users.csv", "users", "csv")
+        assert job['status'] in ('queued', 'running')
+
+        deadline = time.time() + 60
+        while get_job(job['job_id'])['status'] not in ingest_jobs.FINISHED_STATUSES and time.time() < deadline:
+            time.sleep(0.1)
+
+        assert get_job(job['job_id'])['status'] == 'succeeded'
+        assert table_rows("users") == 100
@@ -0,0 +1,140 @@
+import random
+import pytest
+from core import insights
+from core.db import get_connection_manager, get_metadata_connection_manager
+from core.file_processor import convert_csv_to_sqlite, publish_staged_table
+from core.insights import generate_insights
+from core.insights_cache import database_key, table_content_version
+
+
+@pytest.fixture
+def orders():
+    """A table with low- and high-cardinality columns and some NULLs"""
+    rnd = random.Random(0)
+    rows = [
+        (i, rnd.choice(["new", "paid", "shipped"]), None if i % 10 == 0 else i * 0.5)
+        for i in range(5000)
+    ]
+    with get_connection_manager().writer() as conn:
+        conn.execute("CREATE TABLE orders (id INTEGER, status TEXT, amount REAL)")
+        conn.executemany("INSERT INTO orders VALUES (?, ?, ?)", rows)
+        conn.commit()
+    return rows
+
+
+def by_name(results):
+    return {insight.column_name: insight for insight in results}
+
+
+class TestGenerateInsights:
+
+    def test_exact_statistics(self, orders):
+        results = by_name(generate_insights("orders"))
+
+        amount = results['amount']
+        assert amount.null_count == 500
+        assert amount.min_value == 0.5
+        assert amount.max_value == 4999 * 0.5
+        assert amount.sample_rate is None
+        assert amount.error_bounds['null_count'].lower == amount.error_bounds['null_count'].upper == 500
+
+        status = results['status']
+        assert status.unique_values == 3
+        assert status.error_bounds['unique_values'].upper == 3
+        expected = sorted(
+            ((sum(1 for row in orders if row[1] == value), value) for value in ("new", "paid", "shipped")),
+            reverse=True
+        )
+        assert [(m['count'], m['value']) for m in status.most_common] == expected
+        assert all(m['count_lower'] == m['count'] == m['count_upper'] for m in status.most_common)
+
+    def test_high_cardinality_is_approximate_with_bounds(self, orders):
+        results = by_name(generate_insights("orders", ["id"]))
+
+        bounds = results['id'].error_bounds['unique_values']
+        assert bounds.lower <= 5000 <= bounds.upper
+        assert abs(results['id'].unique_values - 5000) < 250
+
+    def test_sampled_insights(self, orders):
+        results = by_name(generate_insights("orders", sample_rate=0.2))
+
+        status = results['status']
+        assert status.sample_rate == 0.2
+        # Exact statistics don't depend on the sample
+        assert results['amount'].null_count == 500
+        assert status.unique_values == 3
+        assert status.error_bounds['unique_values'].lower == 3
+        for m in status.most_common:
+            # Counts are scaled up from the sample
+            true_count = sum(1 for row in orders if row[1] == m['value'])
+            assert m['count_lower'] <= m['count'] <= m['count_upper']
+            assert abs(m['count'] - true_count) < true_count * 0.3
+
+        bounds = results['id'].error_bounds['unique_values']
+        assert bounds.lower <= 5000 <= bounds.upper
+
+    def test_large_tables_are_sampled_by_default(self, orders, monkeypatch):
+        monkeypatch.setattr(insights, "INSIGHTS_SAMPLE_MIN_ROWS", 1000)
+        monkeypatch.setattr(insights, "INSIGHTS_SAMPLE_ROWS", 2500)
+
+        results = generate_insights("orders", ["status"])
+        assert results[0].sample_rate == 0.5
+
+
+class TestStoredInsights:
+
+    def test_ingest_stores_insights(self, monkeypatch):
+        convert_csv_to_sqlite(b"name,age\nada,36\ngrace,45\nada,36\n", "people")
+
+        def fail(*args, **kwargs):
+            raise AssertionError("insights were recomputed")
+        monkeypatch.setattr(insights, "_compute_insights", fail)
+
+        results = by_name(generate_insights("people"))
+        assert results['name'].unique_values == 2
+        assert results['age'].max_value == 45
+        assert [i.column_name for i in generate_insights("people", ["age"])] == ["age"]
+
+    def test_published_table_keeps_staged_insights(self, tmp_path, monkeypatch):
+        staging_path = str(tmp_path / "staging.db")
+        convert_csv_to_sqlite(b"name,age\nada,36\ngrace,45\n", "people", staging_path)
+        convert_csv_to_sqlite(b"name\nold\n", "people")
+
+        assert publish_staged_table(staging_path, "people") == 2
+
+        def fail(*args, **kwargs):
+            raise AssertionError("insights were recomputed")
+        monkeypatch.setattr(insights, "_compute_insights", fail)
+        assert by_name(generate_insights("people"))['age'].max_value == 45
+
+    def test_lookups_do_not_take_the_metadata_writer(self, monkeypatch):
+        convert_csv_to_sqlite(b"name,age\nada,36\n", "people")
+
+        def no_writer():
+            raise AssertionError("lookup took the metadata writer")
+        with monkeypatch.context() as patched:
+            patched.setattr(get_metadata_connection_manager(), "writer", no_writer)
+            assert by_name(generate_insights("people"))['age'].max_value == 36
+
+    def test_changed_table_is_recomputed(self, orders):
+        assert by_name(generate_insights("orders"))['id'].null_count == 0
+
+        with get_connection_manager().writer() as conn:
+            conn.execute("INSERT INTO orders VALUES (NULL, 'new', 1.0)")
+            conn.commit()
+
+        assert by_name(generate_insights("orders"))['id'].null_count == 1
+
+    def test_content_version(self, orders):
+        with get_connection_manager().reader() as conn:
+            version = table_content_version(conn, "orders")
+            assert table_content_version(conn, "missing") is None
+
+        with get_connection_manager().writer() as conn:
+            assert database_key(conn) != ""
+            assert table_content_version(conn, "orders") == version
+            conn.execute("DROP TABLE orders")
+            conn.execute("CREATE TABLE orders (id INTEGER, status TEXT)")
+            conn.execute("INSERT INTO orders VALUES (1, 'new')")
+            conn.commit()
+            assert table_content_version(conn, "orders") != version
@@ -0,0 +1,132 @@
+import os
+import pytest
+from unittest.mock import patch
+from core import llm_cache
+from core.data_models import QueryRequest
+from core.llm_cache import (
+    clear_llm_cache,
+    forget_cached_sql,
+    get_cached_sql,
+    get_llm_cache_stats,
+    normalize_query_text,
+    store_cached_sql
+)
+from core.db import get_metadata_connection_manager
+from core.llm_processor import generate_sql
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    clear_llm_cache()
+    yield
+    clear_llm_cache()
+
+
+class TestLLMCache:
+
+    def test_store_and_hit(self):
+        store_cached_sql("How many users?", "openai", "m", "schema1", "SELECT COUNT(*) FROM users")
+
+        assert get_cached_sql("how many users", "openai", "m", "schema1") is None
+        assert get_cached_sql("  How many   users ", "openai", "m", "schema1") == "SELECT COUNT(*) FROM users"
+
+        stats = get_llm_cache_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['entries'] == 1
+
+    def test_key_includes_provider_model_and_schema(self):
+        store_cached_sql("q", "openai", "m", "schema1", "SELECT 1")
+
+        assert get_cached_sql("q", "anthropic", "m", "schema1") is None
+        assert get_cached_sql("q", "openai", "other", "schema1") is None
+        assert get_cached_sql("q", "openai", "m", "schema2") is None
+
+    def test_new_schema_purges_old_entries(self):
+        store_cached_sql("q1", "openai", "m", "schema1", "SELECT 1")
+        store_cached_sql("q2", "openai", "m", "schema2", "SELECT 2")
+
+        assert get_llm_cache_stats()['entries'] == 1
+        assert get_cached_sql("q2", "openai", "m", "schema2") == "SELECT 2"
+
+    def test_ttl_expiry(self, monkeypatch):
+        store_cached_sql("q", "openai", "m", "s", "SELECT 1")
+
+        now = llm_cache.time.time()
+        monkeypatch.setattr(llm_cache.time, "time", lambda: now + llm_cache.LLM_CACHE_TTL_SECONDS + 1)
+
+        assert get_cached_sql("q", "openai", "m", "s") is None
+        assert get_llm_cache_stats()['entries'] == 0
+
+    def test_lru_eviction(self, monkeypatch):
+        monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_ENTRIES", 2)
+        clock = iter(range(1000, 2000))
+        monkeypatch.setattr(llm_cache.time, "time", lambda: next(clock))
+
+        store_cached_sql("a", "openai", "m", "s", "SELECT 'a'")
+        store_cached_sql("b", "openai", "m", "s", "SELECT 'b'")
+        assert get_cached_sql("a", "openai", "m", "s") is not None  # a is now most recent
+        store_cached_sql("c", "openai", "m", "s", "SELECT 'c'")
+
+        assert get_cached_sql("b", "openai", "m", "s") is None
+        assert get_cached_sql("a", "openai", "m", "s") == "SELECT 'a'"
+        assert get_llm_cache_stats()['evictions'] == 1
+
+    def test_lookups_do_not_take_the_writer(self, monkeypatch):
+        assert get_cached_sql("q", "openai", "m", "s") is None  # No table yet
+        store_cached_sql("q", "openai", "m", "s", "SELECT 1")
+
+        def no_writer():
+            raise AssertionError("lookup took the metadata writer")
+        with monkeypatch.context() as patched:
+            patched.setattr(get_metadata_connection_manager(), "writer", no_writer)
+            for _ in range(llm_cache._TOUCH_BATCH_SIZE - 1):
+                assert get_cached_sql("q", "openai", "m", "s") == "SELECT 1"
+
+    def test_hits_are_written_in_batches(self, monkeypatch):
+        monkeypatch.setattr(llm_cache, "_TOUCH_BATCH_SIZE", 2)
+        store_cached_sql("a", "openai", "m", "s", "SELECT 'a'")
+        store_cached_sql("b", "openai", "m", "s", "SELECT 'b'")
+
+        def last_used():
+            with get_metadata_connection_manager().reader() as conn:
+                return dict(conn.execute("SELECT query_text, last_used_at FROM llm_sql_cache").fetchall())
+        before = last_used()
+
+        get_cached_sql("a", "openai", "m", "s")
+        assert last_used() == before
+        get_cached_sql("b", "openai", "m", "s")
+        after = last_used()
+        assert after['a'] > before['a'] and after['b'] > before['b']
+
+    def test_forget_cached_sql(self):
+        store_cached_sql("q", "openai", "m", "s", "SELECT broken")
+
+        forget_cached_sql("SELECT broken")
+
+        assert get_cached_sql("q", "openai", "m", "s") is None
+
+    def test_disabled_with_zero_ttl(self, monkeypatch):
+        monkeypatch.setattr(llm_cache, "LLM_CACHE_TTL_SECONDS", 0)
+
+        store_cached_sql("q", "openai", "m", "s", "SELECT 1")
+
+        assert get_cached_sql("q", "openai", "m", "s") is None
+
+    def test_normalize_query_text(self):
+        assert normalize_query_text("  Show\n all   users?? ") == "Show all users"
+
+    @patch('core.llm_processor.generate_sql_with_openai')
+    def test_generate_sql_uses_cache_until_schema_changes(self, mock_openai_func):
+        mock_openai_func.return_value = "SELECT * FROM users"
+        request = QueryRequest(query="Show all users")
+        schema = {'tables': {'users': {'columns': {'id': 'INTEGER'}, 'row_count': 1}}}
+
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}):
+            assert generate_sql(request, schema) == "SELECT * FROM users"
+            assert generate_sql(request, schema) == "SELECT * FROM users"
+            assert mock_openai_func.call_count == 1
+
+            schema['tables']['users']['columns']['name'] = 'TEXT'
+            generate_sql(request, schema)
+            assert mock_openai_func.call_count == 2
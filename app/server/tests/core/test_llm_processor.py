@@ -1,11 +1,15 @@
 import pytest
 import os
+import asyncio
 from unittest.mock import patch, MagicMock
 from core.llm_processor import (
     generate_sql_with_openai, 
     generate_sql_with_anthropic, 
     format_schema_for_prompt,
-    generate_sql
+    generate_sql,
+    get_openai_client,
+    get_anthropic_client,
+    stream_sql
 )
 from core.data_models import QueryRequest
 
@@ -284,4 +288,167 @@ class TestLLMProcessor:
             result = generate_sql(request, schema_info)
             
             assert result == "SELECT * FROM sales"
-            mock_openai_func.assert_called_once_with("Show sales data", schema_info)
\ No newline at end of file
+            mock_openai_func.assert_called_once_with("Show sales data", schema_info)
+    
+    @patch('core.llm_processor.OpenAI')
+    def test_openai_client_is_reused_across_calls(self, mock_openai_class):
+        mock_client = MagicMock()
+        mock_openai_class.return_value = mock_client
+        mock_client.chat.completions.create.return_value.choices[0].message.content = "SELECT 1"
+        
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}, clear=True):
+            generate_sql_with_openai("first", {'tables': {}})
+            generate_sql_with_openai("second", {'tables': {}})
+        
+        mock_openai_class.assert_called_once()
+        options = mock_openai_class.call_args[1]
+        assert options['api_key'] == 'test-key'
+        assert options['http_client'] is not None
+        assert 'base_url' not in options
+    
+    @patch('core.llm_processor.OpenAI')
+    def test_openai_client_rebuilt_when_api_key_changes(self, mock_openai_class):
+        mock_openai_class.side_effect = lambda **options: MagicMock()
+        
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'key-1'}, clear=True):
+            first = get_openai_client()
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'key-2'}, clear=True):
+            second = get_openai_client()
+        
+        assert first is not second
+        assert mock_openai_class.call_count == 2
+    
+    @patch('core.llm_processor.Anthropic')
+    def test_anthropic_client_uses_helicone_when_configured(self, mock_anthropic_class):
+        with patch.dict(os.environ, {'ANTHROPIC_API_KEY': 'test-key', 'HELICONE_API_KEY': 'helicone'}, clear=True):
+            get_anthropic_client()
+        
+        options = mock_anthropic_class.call_args[1]
+        assert options['base_url'] == "https://anthropic.helicone.ai"
+        assert options['default_headers']['Helicone-Auth'] == "Bearer helicone"
+
+
+class FakeOpenAIStream:
+    """Async iterator of chat completion chunks, usable as a context manager"""
+    
+    def __init__(self, pieces):
+        self.chunks = []
+        for piece in pieces:
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = piece
+            self.chunks.append(chunk)
+        self.closed = False
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class FakeAnthropicStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        pass
+    
+    @property
+    def text_stream(self):
+        async def iterate():
+            for piece in self.pieces:
+                yield piece
+        return iterate()
+
+
+class TestAsyncLLMProcessor:
+    
+    @staticmethod
+    def collect(request, schema_info):
+        async def main():
+            return [piece async for piece in stream_sql(request, schema_info)]
+        return asyncio.run(main())
+    
+    @patch('core.llm_processor.AsyncOpenAI')
+    def test_stream_sql_with_openai_yields_tokens(self, mock_async_openai_class):
+        stream = FakeOpenAIStream(["```sql\nSELECT *", " FROM users", "\n```"])
+        
+        async def create(**kwargs):
+            assert kwargs['stream'] is True
+            assert kwargs['model'] == 'gpt-4.1-mini'
+            return stream
+        mock_async_openai_class.return_value.chat.completions.create = create
+        
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}, clear=True):
+            pieces = self.collect(QueryRequest(query="Show all users"), {'tables': {}})
+        
+        assert pieces == ["```sql\nSELECT *", " FROM users", "\n```"]
+        assert stream.closed
+    
+    @patch('core.llm_processor.AsyncAnthropic')
+    def test_stream_sql_with_anthropic_yields_tokens(self, mock_async_anthropic_class):
+        mock_async_anthropic_class.return_value.messages.stream.return_value = FakeAnthropicStream(
+            ["SELECT name", " FROM products"]
+        )
+        
+        with patch.dict(os.environ, {'ANTHROPIC_API_KEY': 'test-key'}, clear=True):
+            pieces = self.collect(QueryRequest(query="Product names"), {'tables': {}})
+        
+        assert "".join(pieces) == "SELECT name FROM products"
+        call_args = mock_async_anthropic_class.return_value.messages.stream.call_args
+        assert call_args[1]['model'] == 'claude-3-haiku-20240307'
+    
+    @patch('core.llm_processor.AsyncOpenAI')
+    def test_stream_sql_caches_cleaned_sql(self, mock_async_openai_class):
+        calls = []
+        
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return FakeOpenAIStream(["```sql\nSELECT 1", "\n```"])
+        mock_async_openai_class.return_value.chat.completions.create = create
+        request = QueryRequest(query="One")
+        
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}, clear=True):
+            assert "".join(self.collect(request, {'tables': {}})) == "```sql\nSELECT 1\n```"
+            # The second call is answered from the SQL cache
+            assert self.collect(request, {'tables': {}}) == ["SELECT 1"]
+        
+        assert len(calls) == 1
+    
+    @patch('core.llm_processor.AsyncOpenAI')
+    def test_stream_sql_does_not_cache_unusable_sql(self, mock_async_openai_class):
+        calls = []
+        
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return FakeOpenAIStream(["DROP TABLE users"])
+        mock_async_openai_class.return_value.chat.completions.create = create
+        request = QueryRequest(query="Remove users")
+        
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}, clear=True):
+            self.collect(request, {'tables': {}})
+            self.collect(request, {'tables': {}})
+        
+        assert len(calls) == 2
+    
+    @patch('core.llm_processor.AsyncOpenAI')
+    def test_stream_sql_wraps_provider_errors(self, mock_async_openai_class):
+        async def create(**kwargs):
+            raise RuntimeError("rate limited")
+        mock_async_openai_class.return_value.chat.completions.create = create
+        
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}, clear=True):
+            with pytest.raises(Exception) as exc_info:
+                self.collect(QueryRequest(query="Show all users"), {'tables': {}})
+        
+        assert "Error generating SQL with OpenAI: rate limited" in str(exc_info.value)
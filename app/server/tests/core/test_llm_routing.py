@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from core import llm_routing
+from core.data_models import QueryRequest
+from core.llm_cache import get_cached_sql, schema_fingerprint
+from core.llm_processor import ANTHROPIC_MODEL, OPENAI_MODEL, format_schema_for_prompt, generate_sql
+from core.llm_routing import (
+    LLMTimeoutError,
+    call_with_hedging,
+    get_llm_routing_stats,
+    get_provider_stats,
+    hedge_delay
+)
+
+
+@pytest.fixture(autouse=True)
+def fast_hedging(monkeypatch):
+    monkeypatch.setattr(llm_routing, "LLM_HEDGE_AFTER_SECONDS", 0.05)
+
+
+def answer(value, delay=0.0):
+    def call():
+        time.sleep(delay)
+        return value
+    return call
+
+
+def fail(message):
+    def call():
+        raise RuntimeError(message)
+    return call
+
+
+class TestLLMRouting:
+
+    def test_fast_primary_wins_without_hedging(self):
+        secondary_called = threading.Event()
+
+        def secondary():
+            secondary_called.set()
+            return "SELECT 2"
+
+        assert call_with_hedging([("a", answer("SELECT 1")), ("b", secondary)]) == ("a", "SELECT 1")
+        assert not secondary_called.is_set()
+
+        stats = get_llm_routing_stats()['a']
+        assert stats['requests'] == 1
+        assert stats['wins'] == 1
+        assert sum(stats['latency_histogram'].values()) == 1
+
+    def test_slow_primary_is_hedged(self):
+        provider, result = call_with_hedging([("a", answer("SELECT 1", delay=1.0)), ("b", answer("SELECT 2"))])
+
+        assert (provider, result) == ("b", "SELECT 2")
+        assert get_provider_stats("b").hedged == 1
+        assert get_provider_stats("b").wins == 1
+
+    def test_failed_primary_falls_back_immediately(self, monkeypatch):
+        monkeypatch.setattr(llm_routing, "LLM_HEDGE_AFTER_SECONDS", 10)
+
+        start = time.monotonic()
+        assert call_with_hedging([("a", fail("down")), ("b", answer("SELECT 2"))]) == ("b", "SELECT 2")
+        assert time.monotonic() - start < 5
+        assert get_provider_stats("a").errors == 1
+
+    def test_all_providers_failing_raises_first_error(self):
+        with pytest.raises(RuntimeError) as exc_info:
+            call_with_hedging([("a", fail("first")), ("b", fail("second"))])
+
+        assert str(exc_info.value) == "first"
+
+    def test_deadline(self):
+        with patch.dict(os.environ, {'LLM_A_DEADLINE_SECONDS': '0.1'}):
+            with pytest.raises(LLMTimeoutError):
+                call_with_hedging([("a", answer("SELECT 1", delay=1.0))])
+
+        assert get_provider_stats("a").timeouts == 1
+
+    def test_invalid_answer_loses_to_valid_one(self):
+        def is_valid(sql):
+            return sql.startswith("SELECT")
+
+        assert call_with_hedging(
+            [("a", answer("I can't")), ("b", answer("SELECT 2", delay=0.1))], is_valid
+        ) == ("b", "SELECT 2")
+        # With no valid answer, the first one is returned for the caller to report
+        assert call_with_hedging([("a", answer("I can't"))], is_valid) == ("a", "I can't")
+
+    def test_hedge_delay_follows_latency_percentile(self, monkeypatch):
+        monkeypatch.setattr(llm_routing, "LLM_HEDGE_MIN_SAMPLES", 10)
+        stats = get_provider_stats("a")
+
+        for _ in range(9):
+            stats.record_latency(500)
+        assert hedge_delay("a") == 0.05
+
+        for latency in range(100, 1100, 100):
+            stats.record_latency(latency)
+        assert hedge_delay("a") == pytest.approx(1.0)
+
+    @patch('core.llm_processor.generate_sql_with_anthropic')
+    @patch('core.llm_processor.generate_sql_with_openai')
+    def test_generate_sql_hedges_slow_openai_with_anthropic(self, mock_openai_func, mock_anthropic_func):
+        mock_openai_func.side_effect = lambda *args: time.sleep(1.0) or "SELECT 1"
+        mock_anthropic_func.return_value = "SELECT 2"
+
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'openai-key', 'ANTHROPIC_API_KEY': 'anthropic-key'}):
+            result = generate_sql(QueryRequest(query="Show all users"), {'tables': {}})
+
+        assert result == "SELECT 2"
+        mock_anthropic_func.assert_called_once()
+
+    @patch('core.llm_processor.generate_sql_with_anthropic')
+    @patch('core.llm_processor.generate_sql_with_openai')
+    def test_hedged_answer_is_cached_under_the_winning_provider(self, mock_openai_func, mock_anthropic_func):
+        mock_openai_func.side_effect = RuntimeError("openai down")
+        mock_anthropic_func.return_value = "SELECT 2"
+
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'openai-key', 'ANTHROPIC_API_KEY': 'anthropic-key'}):
+            assert generate_sql(QueryRequest(query="Show all users"), {'tables': {}}) == "SELECT 2"
+
+        schema_hash = schema_fingerprint(format_schema_for_prompt({'tables': {}}))
+        assert get_cached_sql("Show all users", "openai", OPENAI_MODEL, schema_hash) is None
+        assert get_cached_sql("Show all users", "anthropic", ANTHROPIC_MODEL, schema_hash) == "SELECT 2"
+
+    @patch('core.llm_processor.generate_sql_with_anthropic')
+    @patch('core.llm_processor.generate_sql_with_openai')
+    def test_fallback_answer_is_served_from_cache(self, mock_openai_func, mock_anthropic_func):
+        mock_openai_func.side_effect = RuntimeError("openai down")
+        mock_anthropic_func.return_value = "SELECT 2"
+
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'openai-key', 'ANTHROPIC_API_KEY': 'anthropic-key'}):
+            assert generate_sql(QueryRequest(query="Show all users"), {'tables': {}}) == "SELECT 2"
+            assert generate_sql(QueryRequest(query="Show all users"), {'tables': {}}) == "SELECT 2"
+
+        mock_openai_func.assert_called_once()
+        mock_anthropic_func.assert_called_once()
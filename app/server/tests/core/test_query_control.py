@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import time
+import pytest
+from core.query_control import (
+    QueryControl,
+    QueryCancelledError,
+    QueryTimeoutError,
+    active_query_count,
+    cancel_query,
+    track_query
+)
+
+# Never finishes on its own
+RUNAWAY_SQL = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    yield conn
+    conn.close()
+
+
+def run_controlled(conn, control, sql=RUNAWAY_SQL):
+    with control.attached(conn):
+        try:
+            return conn.execute(sql).fetchall()
+        except Exception as e:
+            raise control.translate(e)
+
+
+class TestQueryControl:
+
+    def test_deadline_interrupts_runaway_query(self, conn):
+        control = QueryControl(timeout=0.2)
+        start = time.monotonic()
+
+        with pytest.raises(QueryTimeoutError, match="timed out after 0.2s"):
+            run_controlled(conn, control)
+
+        assert time.monotonic() - start < 5
+
+    def test_cancel_from_another_thread(self, conn):
+        control = QueryControl(timeout=None)
+        threading.Timer(0.2, control.cancel).start()
+
+        with pytest.raises(QueryCancelledError):
+            run_controlled(conn, control)
+
+    def test_cancelled_query_never_starts(self, conn):
+        control = QueryControl()
+        control.cancel()
+
+        with pytest.raises(QueryCancelledError):
+            run_controlled(conn, control, "SELECT 1")
+
+    def test_handler_removed_after_block(self, conn):
+        control = QueryControl(timeout=0.01)
+        assert run_controlled(conn, control, "SELECT 1") == [(1,)]
+        time.sleep(0.02)
+
+        # The expired deadline no longer applies to the connection
+        control.cancel()
+        assert conn.execute("SELECT 2").fetchall() == [(2,)]
+
+    def test_other_errors_pass_through(self, conn):
+        control = QueryControl()
+
+        with pytest.raises(sqlite3.OperationalError, match="no such table"):
+            run_controlled(conn, control, "SELECT * FROM missing")
+
+
+class TestQueryRegistry:
+
+    def test_cancel_by_request_id(self):
+        with track_query("report-1") as control:
+            assert cancel_query("report-1") is True
+            assert control.cancelled
+
+        assert cancel_query("report-1") is False
+        assert active_query_count() == 0
+
+    def test_finished_query_is_stopped(self, conn):
+        # Leaving the block stops a statement still running in another thread
+        errors = []
+
+        def run(control):
+            try:
+                run_controlled(conn, control)
+            except Exception as e:
+                errors.append(e)
+
+        with track_query(timeout=None) as control:
+            worker = threading.Thread(target=run, args=(control,))
+            worker.start()
+            time.sleep(0.1)
+
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+        assert isinstance(errors[0], QueryCancelledError)
@@ -0,0 +1,81 @@
+from core.llm_processor import build_prompt_schema, format_schema_for_prompt
+from core.schema_retrieval import SchemaIndex, estimate_tokens, select_schema, tokenize
+
+
+def make_schema(table_count, column_count=10):
+    return {
+        'tables': {
+            f"filler_table_{i}": {
+                'columns': {f"attribute_{j}": 'TEXT' for j in range(column_count)},
+                'row_count': 10
+            }
+            for i in range(table_count)
+        }
+    }
+
+
+def measure(schema):
+    return estimate_tokens(format_schema_for_prompt(schema))
+
+
+class TestSchemaRetrieval:
+
+    def test_tokenize_splits_identifiers_and_stems(self):
+        assert tokenize("customerOrders") == ['customer', 'order']
+        assert tokenize("product_categories") == ['product', 'category']
+        assert tokenize("Show me all the orders") == ['order']
+
+    def test_rank_tables_prefers_name_matches(self):
+        schema = make_schema(5)
+        schema['tables']['orders'] = {'columns': {'id': 'INTEGER', 'total': 'REAL'}, 'row_count': 1}
+
+        ranking = SchemaIndex(schema).rank_tables("total of all orders")
+
+        assert ranking[0][0] == 'orders'
+        assert ranking[0][1] > 0
+        assert all(score == 0 for _, score in ranking[1:])
+
+    def test_sample_values_make_tables_findable(self):
+        schema = make_schema(3)
+        schema['tables']['locations'] = {'columns': {'city': 'TEXT'}, 'row_count': 2}
+        index = SchemaIndex(schema, {'locations': {'city': ['Paris', 'Berlin']}})
+
+        assert index.rank_tables("How many in Paris?")[0][0] == 'locations'
+
+    def test_small_schema_is_unchanged(self):
+        schema = make_schema(3)
+
+        assert select_schema(schema, "anything", measure) is schema
+
+    def test_large_schema_is_pruned_to_budget(self):
+        schema = make_schema(100)
+        schema['tables']['invoices'] = {'columns': {'invoice_id': 'INTEGER', 'amount': 'REAL'}, 'row_count': 1}
+
+        pruned = select_schema(schema, "sum of invoice amount", measure, token_budget=500, max_tables=10)
+
+        assert list(pruned['tables'])[0] == 'invoices'
+        assert len(pruned['tables']) <= 10
+        assert measure(pruned) <= 500
+
+    def test_wide_relevant_table_keeps_matching_columns(self):
+        schema = make_schema(20)
+        wide = {f"attribute_{j}": 'TEXT' for j in range(200)}
+        wide['revenue_total'] = 'REAL'
+        schema['tables']['sales'] = {'columns': wide, 'row_count': 1}
+
+        pruned = select_schema(schema, "sales revenue", measure, token_budget=200, max_tables=5)
+
+        columns = pruned['tables']['sales']['columns']
+        assert 'revenue_total' in columns
+        assert len(columns) < 201
+        assert measure(pruned) <= 200
+
+    def test_build_prompt_schema_uses_default_budget(self, monkeypatch):
+        from core import schema_retrieval
+        monkeypatch.setattr(schema_retrieval, "SCHEMA_PROMPT_TOKEN_BUDGET", 300)
+        schema = make_schema(50)
+
+        pruned = build_prompt_schema("attribute", schema)
+
+        assert 0 < len(pruned['tables']) < 50
+        assert measure(pruned) <= 300
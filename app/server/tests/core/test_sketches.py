@@ -0,0 +1,86 @@
+import random
+import pandas as pd
+import pytest
+from core.sketches import HyperLogLog, SpaceSaving, hash_values
+
+
+def zipf_values(n, seed=0):
+    rnd = random.Random(seed)
+    return [int(rnd.paretovariate(1.2)) for _ in range(n)]
+
+
+class TestHyperLogLog:
+
+    @pytest.mark.parametrize("distinct", [10, 5000, 200000])
+    def test_estimate_within_bounds(self, distinct):
+        hll = HyperLogLog()
+        hll.add(pd.Series(range(distinct)))
+
+        lower, upper = hll.bounds()
+        assert lower <= distinct <= upper
+        assert abs(hll.estimate() - distinct) / distinct < 0.05
+
+    def test_repeats_do_not_change_estimate(self):
+        once = HyperLogLog()
+        once.add(pd.Series(range(1000)))
+        repeated = HyperLogLog()
+        repeated.add(pd.Series(list(range(1000)) * 5))
+
+        assert once.estimate() == repeated.estimate()
+
+    def test_merge_equals_single_sketch(self):
+        left, right, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        left.add(pd.Series(range(0, 6000)))
+        right.add(pd.Series(range(4000, 10000)))
+        both.add(pd.Series(range(10000)))
+
+        left.merge(right)
+        assert left.estimate() == both.estimate()
+
+    def test_hashes_are_stable(self):
+        values = pd.Series(["a", "b", "c"])
+        assert hash_values(values).tolist() == hash_values(pd.Index(["a", "b", "c"])).tolist()
+
+    def test_invalid_precision(self):
+        with pytest.raises(ValueError):
+            HyperLogLog(precision=4)
+
+
+class TestSpaceSaving:
+
+    def test_small_domain_is_exact(self):
+        summary = SpaceSaving(capacity=16)
+        summary.add(pd.Series(["a", "b", "a", "c", "a", "b"]))
+
+        assert summary.exact
+        assert summary.top(2) == [("a", 3, 0), ("b", 2, 0)]
+        assert summary.frequency_profile() == {3: 1, 2: 1, 1: 1}
+
+    def test_counts_bound_true_counts(self):
+        values = zipf_values(50000)
+        true_counts = pd.Series(values).value_counts()
+        summary = SpaceSaving(capacity=32)
+        for start in range(0, len(values), 5000):
+            summary.add(pd.Series(values[start:start + 5000]))
+
+        assert not summary.exact
+        assert summary.total == len(values)
+        for value, count, error in summary.top(10):
+            assert count - error <= true_counts[value] <= count
+        # Untracked values never occurred more often than the floor
+        untracked = true_counts.drop(list(summary.counts), errors='ignore')
+        assert untracked.max() <= summary.floor
+        # The heavy hitters are found
+        assert [value for value, _, _ in summary.top(3)] == true_counts.index[:3].tolist()
+
+    def test_merge_keeps_bounds(self):
+        values = zipf_values(40000, seed=1)
+        true_counts = pd.Series(values).value_counts()
+        left, right = SpaceSaving(capacity=32), SpaceSaving(capacity=32)
+        left.add(pd.Series(values[:20000]))
+        right.add(pd.Series(values[20000:]))
+
+        left.merge(right)
+        assert left.total == len(values)
+        for value, count, error in left.top(10):
+            assert count - error <= true_counts[value] <= count
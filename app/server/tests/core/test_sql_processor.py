@@ -1,7 +1,22 @@
 import pytest
 import sqlite3
 from unittest.mock import patch
-from core.sql_processor import execute_sql_safely, get_database_schema
+from core.db import get_connection_manager
+from core.sql_security import SQLSecurityError
+from core.sql_processor import (
+    execute_sql_page,
+    stream_sql_rows,
+    stream_table_rows,
+    scan_storage_classes,
+    scan_table_storage_classes,
+    encode_page_token,
+    decode_page_token,
+    get_database_schema,
+    get_schema_index,
+    invalidate_schema_cache,
+    record_table_analyzed,
+    record_table_row_count
+)
 
 
 @pytest.fixture
@@ -50,9 +65,9 @@ def test_db():
 
 class TestSQLProcessor:
     
-    def test_execute_sql_safely_valid_select(self, test_db):
+    def test_execute_sql_page_valid_select(self, test_db):
         sql_query = "SELECT * FROM users WHERE age > 25"
-        result = execute_sql_safely(sql_query)
+        result = execute_sql_page(sql_query)
         
         assert result['error'] is None
         assert len(result['results']) == 2  # Jane (30) and Bob (35)
@@ -64,24 +79,24 @@ class TestSQLProcessor:
         assert 'Bob' in names
         assert 'John' not in names  # John is 25, not > 25
     
-    def test_execute_sql_safely_with_joins(self, test_db):
+    def test_execute_sql_page_with_joins(self, test_db):
         # Test more complex SQL with real execution
         sql_query = "SELECT COUNT(*) as total FROM users"
-        result = execute_sql_safely(sql_query)
+        result = execute_sql_page(sql_query)
         
         assert result['error'] is None
         assert len(result['results']) == 1
         assert result['results'][0]['total'] == 3
     
-    def test_execute_sql_safely_no_results(self, test_db):
+    def test_execute_sql_page_no_results(self, test_db):
         sql_query = "SELECT * FROM users WHERE age > 100"
-        result = execute_sql_safely(sql_query)
+        result = execute_sql_page(sql_query)
         
         assert result['error'] is None
         assert result['results'] == []
-        assert result['columns'] == []
+        assert result['columns'] == ['id', 'name', 'age', 'email']
     
-    def test_execute_sql_safely_dangerous_keywords(self):
+    def test_execute_sql_page_dangerous_keywords(self):
         # Test dangerous SQL operations
         dangerous_queries = [
             "DROP TABLE users",
@@ -94,34 +109,34 @@ class TestSQLProcessor:
         ]
         
         for query in dangerous_queries:
-            result = execute_sql_safely(query)
+            result = execute_sql_page(query)
             assert result['error'] is not None
             # Query should be blocked (either by security check or database error)
             assert result['results'] == []
             assert result['columns'] == []
     
-    def test_execute_sql_safely_case_insensitive_keywords(self):
+    def test_execute_sql_page_case_insensitive_keywords(self):
         # Test case insensitive keyword detection
         sql_query = "drop table users"  # lowercase
-        result = execute_sql_safely(sql_query)
+        result = execute_sql_page(sql_query)
         
         assert result['error'] is not None
         assert "Security error" in result['error']
     
-    def test_execute_sql_safely_sql_error(self, test_db):
+    def test_execute_sql_page_sql_error(self, test_db):
         # Test with invalid SQL syntax
         sql_query = "SELECT * FROM nonexistent_table"
-        result = execute_sql_safely(sql_query)
+        result = execute_sql_page(sql_query)
         
         assert result['error'] is not None
         assert "no such table" in result['error'].lower()
         assert result['results'] == []
         assert result['columns'] == []
     
-    def test_execute_sql_safely_syntax_error(self, test_db):
+    def test_execute_sql_page_syntax_error(self, test_db):
         # Test with malformed SQL
         sql_query = "SELECT * FORM users"  # typo: FORM instead of FROM
-        result = execute_sql_safely(sql_query)
+        result = execute_sql_page(sql_query)
         
         assert result['error'] is not None
         assert result['results'] == []
@@ -176,6 +191,253 @@ class TestSQLProcessor:
         
         # Test that each operation is properly blocked
         for keyword, query in dangerous_operations:
-            result = execute_sql_safely(query)
+            result = execute_sql_page(query)
             assert result['error'] is not None
-            # Query should be blocked
\ No newline at end of file
+            # Query should be blocked
+
+
+class TestSchemaCache:
+    
+    @pytest.fixture
+    def pooled_db(self):
+        """Create a table in the shared (per-test) application database"""
+        with get_connection_manager().writer() as conn:
+            conn.execute("CREATE TABLE users (id INTEGER, name TEXT)")
+            conn.executemany("INSERT INTO users VALUES (?, ?)", [(1, 'John'), (2, 'Jane')])
+            conn.commit()
+        yield
+        invalidate_schema_cache()
+    
+    def _insert_without_invalidation(self, rows):
+        with get_connection_manager().writer() as conn:
+            conn.executemany("INSERT INTO users VALUES (?, ?)", rows)
+            conn.commit()
+    
+    def test_schema_is_served_from_cache(self, pooled_db):
+        assert get_database_schema()['tables']['users']['row_count'] == 2
+        
+        # Data-only changes don't touch the cached counts until recorded
+        self._insert_without_invalidation([(3, 'Bob')])
+        assert get_database_schema()['tables']['users']['row_count'] == 2
+        
+        record_table_row_count('users', 3)
+        assert get_database_schema()['tables']['users']['row_count'] == 3
+    
+    def test_schema_change_refreshes_cache(self, pooled_db):
+        get_database_schema()
+        self._insert_without_invalidation([(3, 'Bob')])
+        
+        with get_connection_manager().writer() as conn:
+            conn.execute("CREATE TABLE orders (id INTEGER, total REAL)")
+            conn.commit()
+        
+        result = get_database_schema()
+        assert result['tables']['orders'] == {'columns': {'id': 'INTEGER', 'total': 'REAL'}, 'row_count': 0}
+        # Unchanged tables keep their remembered count
+        assert result['tables']['users']['row_count'] == 2
+    
+    def test_altered_table_is_recounted(self, pooled_db):
+        get_database_schema()
+        self._insert_without_invalidation([(3, 'Bob')])
+        
+        with get_connection_manager().writer() as conn:
+            conn.execute("ALTER TABLE users ADD COLUMN email TEXT")
+            conn.commit()
+        
+        assert get_database_schema()['tables']['users']['row_count'] == 3
+    
+    def test_invalidate_forces_recount(self, pooled_db):
+        get_database_schema()
+        self._insert_without_invalidation([(3, 'Bob'), (4, 'Alice')])
+        
+        invalidate_schema_cache('users')
+        
+        assert get_database_schema()['tables']['users']['row_count'] == 4
+    
+    def _analyze_with_stat(self, stat):
+        invalidate_schema_cache()
+        with get_connection_manager().writer() as conn:
+            conn.execute("ANALYZE")
+            conn.execute("UPDATE sqlite_stat1 SET stat = ? WHERE tbl = 'users'", (stat,))
+            conn.commit()
+            record_table_analyzed(conn, 'users')
+    
+    def test_row_count_estimated_from_sqlite_stat1(self, pooled_db):
+        self._analyze_with_stat('1000')
+        
+        assert get_database_schema()['tables']['users']['row_count'] == 1000
+    
+    def test_sqlite_stat1_is_ignored_once_the_table_is_written(self, pooled_db):
+        self._analyze_with_stat('1000')
+        self._insert_without_invalidation([(3, 'Bob')])
+        
+        assert get_database_schema()['tables']['users']['row_count'] == 3
+    
+    def test_sqlite_stat1_is_ignored_unless_analyzed_here(self, pooled_db):
+        with get_connection_manager().writer() as conn:
+            conn.execute("ANALYZE")
+            conn.execute("UPDATE sqlite_stat1 SET stat = '1000' WHERE tbl = 'users'")
+            conn.commit()
+        invalidate_schema_cache()
+        
+        assert get_database_schema()['tables']['users']['row_count'] == 2
+    
+    def test_returned_schema_is_a_copy(self, pooled_db):
+        get_database_schema()['tables']['users']['row_count'] = -1
+        
+        assert get_database_schema()['tables']['users']['row_count'] == 2
+    
+    def test_schema_index_samples_values_and_follows_schema_changes(self):
+        with get_connection_manager().writer() as conn:
+            conn.execute("CREATE TABLE locations (city TEXT, population INTEGER)")
+            conn.execute("CREATE TABLE employees (name TEXT)")
+            conn.execute("INSERT INTO locations VALUES ('Paris', 2100000)")
+            conn.commit()
+        
+        index = get_schema_index()
+        assert index.rank_tables("population of Paris")[0][0] == 'locations'
+        assert get_schema_index() is index
+        
+        with get_connection_manager().writer() as conn:
+            conn.execute("CREATE TABLE cities (city_name TEXT)")
+            conn.commit()
+        
+        assert get_schema_index() is not index
+
+
+class TestQueryPagination:
+    
+    @pytest.fixture
+    def numbers_db(self):
+        """Create a 25-row table in the shared (per-test) application database"""
+        with get_connection_manager().writer() as conn:
+            conn.execute("CREATE TABLE numbers (n INTEGER, label TEXT)")
+            conn.executemany("INSERT INTO numbers VALUES (?, ?)", [(i, f"n{i}") for i in range(25)])
+            conn.commit()
+    
+    def test_execute_sql_page_first_and_later_pages(self, numbers_db):
+        sql = "SELECT n, label FROM numbers ORDER BY n"
+        
+        first = execute_sql_page(sql, page_size=10)
+        assert first['error'] is None
+        assert first['columns'] == ['n', 'label']
+        assert [row['n'] for row in first['results']] == list(range(10))
+        assert first['has_more'] is True
+        
+        last = execute_sql_page(sql, page_size=10, offset=20)
+        assert [row['n'] for row in last['results']] == list(range(20, 25))
+        assert last['has_more'] is False
+    
+    def test_execute_sql_page_exact_fit_has_no_more(self, numbers_db):
+        result = execute_sql_page("SELECT n FROM numbers", page_size=25)
+        
+        assert len(result['results']) == 25
+        assert result['has_more'] is False
+    
+    def test_execute_sql_page_columns_without_rows(self, numbers_db):
+        result = execute_sql_page("SELECT n, label FROM numbers WHERE n < 0", page_size=10)
+        
+        assert result['results'] == []
+        assert result['columns'] == ['n', 'label']
+    
+    def test_execute_sql_page_blocks_dangerous_queries(self, numbers_db):
+        result = execute_sql_page("DROP TABLE numbers", page_size=10)
+        
+        assert "Security error" in result['error']
+        assert result['has_more'] is False
+    
+    def test_execute_sql_page_read_only_without_validation(self, numbers_db):
+        # The read-only connection holds even if a query gets past validation
+        with patch('core.sql_processor.validate_sql_query'):
+            result = execute_sql_page("DELETE FROM numbers", page_size=10)
+        
+        assert "Security error" in result['error']
+        assert "read-only" in result['error']
+        with get_connection_manager().reader() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM numbers").fetchone()[0] == 25
+    
+    def test_execute_sql_page_stops_at_max_rows(self, numbers_db):
+        with patch('core.sql_processor.QUERY_MAX_ROWS', 15):
+            first = execute_sql_page("SELECT n FROM numbers ORDER BY n", page_size=10)
+            last = execute_sql_page("SELECT n FROM numbers ORDER BY n", page_size=10, offset=10)
+        
+        assert first['has_more'] is True and first['truncated'] is False
+        assert [row['n'] for row in last['results']] == list(range(10, 15))
+        assert last['has_more'] is False
+        assert last['truncated'] is True
+    
+    def test_execute_sql_page_times_out(self, numbers_db):
+        from core.query_control import QueryControl
+        runaway = "SELECT COUNT(*) FROM numbers a, numbers b, numbers c, numbers d, numbers e, numbers f"
+        
+        result = execute_sql_page(runaway, control=QueryControl(timeout=0.1))
+        
+        assert result['error'] == "Query timed out after 0.1s"
+    
+    def test_page_token_round_trip(self):
+        token = encode_page_token("SELECT * FROM numbers", 100)
+        
+        assert decode_page_token(token) == ("SELECT * FROM numbers", 100)
+    
+    def test_page_token_rejects_tampering(self):
+        import base64
+        token = encode_page_token("SELECT * FROM numbers", 100)
+        raw = base64.urlsafe_b64decode(token)
+        forged = base64.urlsafe_b64encode(raw.replace(b"numbers", b"secrets")).decode()
+        
+        with pytest.raises(SQLSecurityError):
+            decode_page_token(forged)
+        with pytest.raises(SQLSecurityError):
+            decode_page_token("not-a-token")
+    
+    def test_stream_sql_rows_yields_batches_and_releases_reader(self, numbers_db):
+        columns, batches = stream_sql_rows("SELECT n FROM numbers ORDER BY n", batch_size=10)
+        
+        assert columns == ['n']
+        assert [len(batch) for batch in batches] == [10, 10, 5]
+        assert get_connection_manager().stats()['idle_readers'] == 1
+    
+    def test_stream_sql_rows_close_before_iterating_releases_reader(self, numbers_db):
+        _, batches = stream_sql_rows("SELECT n FROM numbers")
+        
+        batches.close()
+        
+        assert get_connection_manager().stats()['idle_readers'] == 1
+    
+    def test_stream_sql_rows_raises_before_streaming(self, numbers_db):
+        with pytest.raises(SQLSecurityError):
+            stream_sql_rows("DELETE FROM numbers")
+        with pytest.raises(Exception) as exc_info:
+            stream_sql_rows("SELECT * FROM missing_table")
+        assert "no such table" in str(exc_info.value)
+        assert get_connection_manager().stats()['idle_readers'] == 1
+    
+    def test_stream_table_rows_reads_whole_table(self, numbers_db):
+        columns, batches = stream_table_rows("numbers", batch_size=20)
+        
+        assert columns == ['n', 'label']
+        assert sum(len(batch) for batch in batches) == 25
+        assert get_connection_manager().stats()['idle_readers'] == 1
+    
+    def test_scan_storage_classes_reports_each_column(self, numbers_db):
+        with get_connection_manager().writer() as conn:
+            conn.execute("INSERT INTO numbers VALUES (2.5, NULL), ('N/A', 7)")
+            conn.commit()
+        
+        assert scan_table_storage_classes("numbers", 2) == [
+            {'integer', 'real', 'text'},
+            {'text'}
+        ]
+        # Columns are matched by position, whatever they are named
+        assert scan_storage_classes("SELECT n, n, NULL FROM numbers WHERE n < 2;", 3) == [
+            {'integer'}, {'integer'}, set()
+        ]
+        assert get_connection_manager().stats()['idle_readers'] == 1
+    
+    def test_scan_storage_classes_validates_the_query(self, numbers_db):
+        with pytest.raises(SQLSecurityError):
+            scan_storage_classes("DELETE FROM numbers", 1)
+    
+    def test_stream_table_rows_rejects_invalid_identifier(self, numbers_db):
+        with pytest.raises(SQLSecurityError):
+            stream_table_rows("numbers; DROP TABLE numbers")
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+from core.type_inference import convert_series, infer_kind, plan_column_kinds, validate_schema_hints
+
+
+class TestInferKind:
+
+    @pytest.mark.parametrize("values, kind", [
+        ([1, 2, 3], 'integer'),
+        ([1.0, None, 3.0], 'integer'),
+        ([1.5, 2.0], 'real'),
+        ([True, False], 'boolean'),
+        (["true", "FALSE", None], 'boolean'),
+        (["2024-01-31", "2024-02-01"], 'date'),
+        (["2024-01-31T10:00:00Z", "2024-02-01 09:30"], 'datetime'),
+        (["31/01/2024", "01/02/2024"], 'text'),
+        (["a", "b", "a", "a"], 'category'),
+        (["a", "b", "c"], 'text'),
+        ([None, None], 'text'),
+    ])
+    def test_kinds(self, values, kind):
+        assert infer_kind(pd.Series(values)) == kind
+
+    def test_hints_take_precedence(self):
+        frame = pd.DataFrame({'code': ["1", "2"], 'day': ["01/02/2024", "03/02/2024"]})
+        assert plan_column_kinds(frame, {'day': 'date'}) == {'code': 'text', 'day': 'date'}
+
+    def test_validate_schema_hints(self):
+        assert validate_schema_hints({'day': ' Date '}) == {'day': 'date'}
+        with pytest.raises(ValueError, match="Unknown type 'uuid'"):
+            validate_schema_hints({'id': 'uuid'})
+
+
+class TestConvertSeries:
+
+    def test_integers_are_downcast(self):
+        assert convert_series(pd.Series([1, 2, 3]), 'integer').dtype == 'int8'
+        converted = convert_series(pd.Series([1.0, None, 300.0]), 'integer')
+        assert converted.dtype == 'Int64'
+        assert converted.tolist()[::2] == [1, 300]
+
+    def test_dates_and_datetimes(self):
+        days = convert_series(pd.Series(["2024-01-31", "Feb 1 2024", None]), 'date')
+        assert days.tolist()[:2] == ["2024-01-31", "2024-02-01"]
+        assert pd.isna(days.iloc[2])
+
+        moments = convert_series(pd.Series(["2024-01-31T10:00:00+02:00"]), 'datetime')
+        assert moments.tolist() == ["2024-01-31 08:00:00"]
+
+    def test_timestamps(self):
+        converted = convert_series(pd.Series(["1970-01-02", None]), 'timestamp')
+        assert converted.iloc[0] == 86400
+        assert pd.isna(converted.iloc[1])
+
+    def test_booleans(self):
+        converted = convert_series(pd.Series(["yes", "No", None]), 'boolean')
+        assert converted.iloc[:2].tolist() == [1, 0]
+        assert pd.isna(converted.iloc[2])
+
+    def test_unconvertible_values_are_kept(self):
+        converted = convert_series(pd.Series(["2024-01-31", "soon"]), 'date')
+        assert converted.tolist() == ["2024-01-31", "soon"]
+        assert convert_series(pd.Series(["1", "n/a"]), 'integer').tolist() == [1, "n/a"]
+
+    def test_categories(self):
+        assert convert_series(pd.Series(["a", "b", "a"]), 'category').dtype == 'category'
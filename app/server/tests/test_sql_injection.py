@@ -17,7 +17,7 @@ from core.sql_security import (
     check_table_exists,
     SQLSecurityError
 )
-from core.sql_processor import execute_sql_safely
+from core.sql_processor import execute_sql_page
 from core.file_processor import sanitize_table_name
 from core.insights import generate_insights
 
@@ -165,6 +165,32 @@ class TestSQLSecurityModule:
         with pytest.raises(SQLSecurityError):
             validate_sql_query("SELECT * FROM users -- comment")
     
+    def test_validate_sql_query_is_structural(self):
+        """Test that validation looks at tokens, not raw text"""
+        # Keywords and comment markers inside literals or quoted identifiers are data
+        assert validate_sql_query("SELECT * FROM logs WHERE message = 'please DROP TABLE users; -- now'")
+        assert validate_sql_query('SELECT "update", [delete] FROM events WHERE note = \'it\'\'s ok\'')
+        assert validate_sql_query("SELECT replace(name, 'a', 'b') FROM users;")
+        assert validate_sql_query("WITH recent AS (SELECT * FROM users) SELECT * FROM recent")
+        assert validate_sql_query("(SELECT 1) UNION ALL (SELECT 2)")
+        assert validate_sql_query("SELECT * FROM users WHERE name = 'a' OR name = 'b'")
+        
+        dangerous_queries = [
+            "WITH gone AS (SELECT 1) DELETE FROM users",
+            "SELECT 1; SELECT 2",
+            "REPLACE INTO users VALUES (1)",
+            "PRAGMA writable_schema = 1",
+            "ATTACH DATABASE 'other.db' AS other",
+            "SELECT * FROM users WHERE name = 'unterminated",
+            "SELECT * FROM users WHERE id = 1 OR 2 = 2",
+            'SELECT * FROM users WHERE name = "" OR "1"="1"',
+            "SELECT * FROM users /* hidden */",
+            "EXPLAIN DROP TABLE users",
+        ]
+        for query in dangerous_queries:
+            with pytest.raises(SQLSecurityError):
+                validate_sql_query(query)
+    
     def test_sanitize_value_for_like(self):
         """Test LIKE clause sanitization"""
         assert sanitize_value_for_like("test") == "test"
@@ -200,25 +226,25 @@ class TestSQLProcessorSecurity:
     """Test SQL processor with security enhancements"""
     
     @patch('core.sql_processor.sqlite3.connect')
-    def test_execute_sql_safely_blocks_dangerous_queries(self, mock_connect):
+    def test_execute_sql_page_blocks_dangerous_queries(self, mock_connect):
         """Test that dangerous SQL queries are blocked"""
         # Test DROP statement
-        result = execute_sql_safely("DROP TABLE users")
+        result = execute_sql_page("DROP TABLE users")
         assert result['error'] is not None
         assert "Security error" in result['error']
         
         # Test DELETE statement
-        result = execute_sql_safely("DELETE FROM users WHERE id = 1")
+        result = execute_sql_page("DELETE FROM users WHERE id = 1")
         assert result['error'] is not None
         assert "Security error" in result['error']
         
         # Test multiple statements
-        result = execute_sql_safely("SELECT * FROM users; DROP TABLE users")
+        result = execute_sql_page("SELECT * FROM users; DROP TABLE users")
         assert result['error'] is not None
         assert "Security error" in result['error']
     
     @patch('core.sql_processor.sqlite3.connect')
-    def test_execute_sql_safely_allows_select(self, mock_connect):
+    def test_execute_sql_page_allows_select(self, mock_connect):
         """Test that safe SELECT queries are allowed"""
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
@@ -226,7 +252,7 @@ class TestSQLProcessorSecurity:
         mock_conn.cursor.return_value = mock_cursor
         mock_cursor.fetchall.return_value = []
         
-        result = execute_sql_safely("SELECT * FROM users WHERE id = 1")
+        result = execute_sql_page("SELECT * FROM users WHERE id = 1")
         assert result['error'] is None
         mock_cursor.execute.assert_called_once()
 
@@ -308,7 +334,7 @@ class TestEndToEndSQLInjection:
         ]
         
         for query in malicious_queries:
-            result = execute_sql_safely(query)
+            result = execute_sql_page(query)
             assert result['error'] is not None
             assert result['results'] == []
     
@@ -321,7 +347,7 @@ class TestEndToEndSQLInjection:
         ]
         
         for query in queries_with_comments:
-            result = execute_sql_safely(query)
+            result = execute_sql_page(query)
             assert result['error'] is not None
 
 